@@ -114,6 +114,12 @@ This may be useful if you are using a custom reverse proxy that will handle HTTP
             """
 Whether the instance will run behind a reverse proxy.
 If enabled, the instance will apply fixes to IPs and headers to account for the reverse proxy.
+""",
+        ),
+        "is_file_offload_enabled": (
+            "yes",
+            """
+Whether Caddy sends uploaded files after TIM has checked the access, instead of TIM sending them.
 """,
         ),
         "extra_tim_config": (
@@ -174,6 +180,33 @@ Initial heap size for Cassandra used for csplugin tasks
             "1024M",
             """
 Max heap size for Cassandra used for csplugin tasks
+""",
+        ),
+        "container_pool_size": (
+            "0",
+            """
+Number of warm containers to keep for running csplugin programs of each image.
+If 0, a new container is started for every run.
+""",
+        ),
+        "container_pool_max_runs": (
+            "50",
+            """
+Number of runs after which a pooled csplugin container is replaced with a new one.
+""",
+        ),
+        "container_pool_queue_size": (
+            "20",
+            """
+Maximum number of csplugin runs that may wait for a free pooled container.
+Runs beyond this are rejected with a "try again" message.
+""",
+        ),
+        "compile_cache_max_size_mb": (
+            "500",
+            """
+Maximum total size of the compiler outputs cached by csplugin, in megabytes.
+If 0, programs are always compiled.
 """,
         ),
     },
@@ -15,6 +15,11 @@ from timApp.admin.util import commit_if_not_dry
 from timApp.answer.answer import Answer, AnswerSaver
 from timApp.answer.answer_models import UserAnswer, AnswerUpload
 from timApp.answer.answers import valid_answers_query
+from timApp.answer.usertasktally import (
+    get_tally_keys_for_answers,
+    refresh_user_task_tallies,
+    rebuild_user_task_tallies,
+)
 from timApp.document.docinfo import DocInfo
 from timApp.folder.folder import Folder
 from timApp.item.block import Block
@@ -66,6 +71,19 @@ def fix_double_c(dry_run: bool) -> None:
     commit_if_not_dry(dry_run)
 
 
+@answer_cli.command()
+@click.option("--dry-run/--no-dry-run", default=True)
+def rebuild_tallies(dry_run: bool) -> None:
+    """Rebuilds the per-user task tally table from the answers.
+
+    The table is kept up to date automatically, so this is only needed if answers have been modified
+    directly in the database.
+    """
+    count = rebuild_user_task_tallies()
+    click.echo(f"Total {count} tallies")
+    commit_if_not_dry(dry_run)
+
+
 @dataclass
 class AnswerDeleteResult:
     useranswer: int
@@ -124,6 +142,7 @@ def delete_answers_with_ids(
 ) -> AnswerDeleteResult:
     if not isinstance(ids, list):
         raise TypeError("ids should be a list of answer ids")
+    tally_keys = get_tally_keys_for_answers(ids)
     d_ua = len(
         run_sql(
             delete(UserAnswer)
@@ -185,6 +204,7 @@ def delete_answers_with_ids(
             .execution_options(synchronize_session=False)
         ).all()
     )
+    refresh_user_task_tallies(tally_keys)
     return AnswerDeleteResult(
         useranswer=d_ua,
         answersaver=d_as,
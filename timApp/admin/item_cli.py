@@ -11,6 +11,7 @@ from timApp.admin.fix_orphan_documents import (
 )
 from timApp.admin.util import commit_if_not_dry
 from timApp.document.docentry import DocEntry
+from timApp.document.document import Document
 from timApp.document.translation.translation import Translation
 from timApp.item.block import Block, BlockType
 from timApp.notification.notification import Notification
@@ -221,3 +222,37 @@ Second paragraph
     shutil.move(pars_dir.as_posix(), deleted_pars)
 
     click.echo("Done, basic IO seems to work!")
+
+
+@item_cli.command()
+@click.option(
+    "--doc-id",
+    "doc_ids",
+    multiple=True,
+    type=int,
+    help="Document to compact. Can be given multiple times. Default is all documents.",
+)
+def compact_versions(doc_ids: tuple[int, ...]) -> None:
+    """Converts full copies of document versions into deltas and removes rebuilt versions except the latest.
+
+    This can be run periodically to reclaim disk space taken by document version history.
+    """
+    if not doc_ids:
+        docs_dir = Document.get_documents_dir()
+        doc_ids = tuple(
+            sorted(int(p.name) for p in docs_dir.iterdir() if p.name.isdigit())
+        )
+    total_converted = 0
+    total_saved = 0
+    with click.progressbar(doc_ids) as bar:
+        for doc_id in bar:
+            d = Document(doc_id)
+            converted, saved = d.get_version_store().compact(
+                keep_materialized=d.get_version()
+            )
+            total_converted += converted
+            total_saved += saved
+    click.echo(
+        f"Converted {total_converted} versions to deltas in {len(doc_ids)} documents, "
+        f"saved {total_saved} bytes."
+    )
@@ -5,6 +5,9 @@ from sqlalchemy import select
 
 from timApp.auth.accesshelper import verify_admin
 from timApp.auth.sessioninfo import get_restored_context_user
+from timApp.document.parcache import get_paragraph_cache
+from timApp.markdown.htmlcache import get_dumbo_html_cache
+from timApp.plugin.pluginconnection import get_plugin_connection_stats
 from timApp.timdb.sqa import db, run_sql
 from timApp.user.user import User
 from timApp.user.usergroup import UserGroup
@@ -59,3 +62,28 @@ def search_users(term: str, exact_match: bool = False, full: bool = False) -> Re
         )
     result: list[User] = run_sql(q).scalars().all()
     return json_response([u.to_json(contacts=True, full=full) for u in result])
+
+
+@admin_bp.get("/cachestats")
+def get_cache_stats() -> Response:
+    """Returns hit/miss statistics of the in-process caches of this worker."""
+    verify_admin()
+    return json_response(
+        {
+            "pid": os.getpid(),
+            "paragraphs": get_paragraph_cache().stats(),
+            "dumbo_html": get_dumbo_html_cache().stats(),
+        }
+    )
+
+
+@admin_bp.get("/pluginstats")
+def get_plugin_stats() -> Response:
+    """Returns the circuit breaker states and call latencies of plugins in this worker."""
+    verify_admin()
+    return json_response(
+        {
+            "pid": os.getpid(),
+            "plugins": get_plugin_connection_stats(),
+        }
+    )
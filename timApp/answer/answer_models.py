@@ -4,6 +4,7 @@ from sqlalchemy import UniqueConstraint, ForeignKey
 from sqlalchemy.orm import mapped_column, Mapped, relationship
 
 from timApp.timdb.sqa import db
+from timApp.timdb.types import datetime_tz
 
 if TYPE_CHECKING:
     from timApp.item.block import Block
@@ -45,3 +46,28 @@ class UserAnswer(db.Model):
     user_id: Mapped[int] = mapped_column(ForeignKey("useraccount.id"))
 
     __table_args__ = (UniqueConstraint("answer_id", "user_id"),)
+
+
+class UserTaskTally(db.Model):
+    """Per-user summary of the answers to a task.
+
+    The rows are kept up to date by timApp.answer.usertasktally whenever answers are flushed.
+    The answer ids are not foreign keys because the summary is refreshed only after the answers have been deleted.
+    """
+
+    task_id: Mapped[str] = mapped_column(primary_key=True)
+    """Task id in the form "doc_id.name"."""
+
+    user_id: Mapped[int] = mapped_column(ForeignKey("useraccount.id"), primary_key=True)
+
+    latest_answer_id: Mapped[int]
+    """Latest answer of the user in the task."""
+
+    latest_valid_answer_id: Mapped[Optional[int]]
+    """Latest valid answer of the user in the task, or None if there is none."""
+
+    answer_count: Mapped[int]
+    """Number of answers, valid or not."""
+
+    first_answered_on: Mapped[datetime_tz]
+    last_answered_on: Mapped[datetime_tz]
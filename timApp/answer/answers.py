@@ -34,10 +34,10 @@ from sqlalchemy import (
 from sqlalchemy.dialects.postgresql import aggregate_order_by
 from sqlalchemy.orm import defaultload, selectinload, contains_eager
 from sqlalchemy.sql import Select, Subquery
-from sqlalchemy.sql.elements import OperatorExpression
+from sqlalchemy.sql.elements import OperatorExpression, True_
 
 from timApp.answer.answer import Answer
-from timApp.answer.answer_models import AnswerTag, UserAnswer
+from timApp.answer.answer_models import AnswerTag, UserAnswer, UserTaskTally
 from timApp.answer.pointsumrule import PointSumRule, PointType, Group
 from timApp.document.viewcontext import OriginInfo
 from timApp.plugin.plugintype import PluginType, PluginTypeLazy, PluginTypeBase
@@ -780,7 +780,32 @@ def get_users_for_tasks_py(
             if len(user_answers_by_id[user_id]) == 0:
                 del user_answers_by_id[user_id]
 
-    # Step 4: Select annotations for the selected answers and add the points to the user and task
+    return collect_user_task_entries(
+        user_answers_by_id,
+        answer_info_by_answer_id,
+        user_ids,
+        group_by_user,
+        group_by_doc,
+    )
+
+
+def collect_user_task_entries(
+    user_answers_by_id: dict[int, dict[str, UserAnswerInfo]],
+    answer_info_by_answer_id: dict[int, list[UserAnswerInfo]],
+    user_ids: list[int] | None,
+    group_by_user: bool,
+    group_by_doc: bool,
+) -> list[UserTaskEntry]:
+    """Adds the velp points to the selected answers and groups the results.
+
+    :param user_answers_by_id: The selected answer info of each user and task.
+    :param answer_info_by_answer_id: The same infos keyed by the selected answer id.
+    :param user_ids: The users that were requested, or None for all users that have answers.
+    :param group_by_user: Whether to return one entry per user.
+    :param group_by_doc: Whether to return one entry per user and document.
+    :return: The entries; one per user and task if no grouping is used.
+    """
+    # Select annotations for the selected answers and add the points to the user and task
     annotations_query = (
         select(Annotation)
         .filter_by(valid_until=None)
@@ -808,8 +833,9 @@ def get_users_for_tasks_py(
             info.velp_points += points
             info.velped = True
 
-    # Step 5: Collect the user infos of all users
+    # Collect the user infos of all users
 
+    userid_filter: Any
     if user_ids:
         userid_filter = User.id.in_(user_ids)
     else:
@@ -819,7 +845,7 @@ def get_users_for_tasks_py(
     if current_app.config["LOAD_STUDENT_IDS_IN_TEACHER"]:
         users_query = users_query.options(selectinload("uniquecodes"))
 
-    # Step 6: Aggregate the results based on the different grouping options
+    # Aggregate the results based on the different grouping options
 
     def collect_by_user() -> list[UserTaskEntry]:
         result: list[UserTaskEntry] = []
@@ -893,6 +919,66 @@ def get_users_for_tasks_py(
     return collect_by_task()
 
 
+def get_users_for_tasks_tally(
+    task_ids: list[TaskId],
+    user_ids: list[int] | None = None,
+    group_by_user: bool = True,
+    group_by_doc: bool = False,
+    with_answer_time: bool = False,
+    count_rule: AnswerCountRule = AnswerCountRule.OnlyValid,
+) -> list[UserTaskEntry]:
+    """Same as get_users_for_tasks_py without an answer filter, but reads the latest answers from UserTaskTally."""
+    if not task_ids:
+        return []
+
+    match count_rule:
+        case AnswerCountRule.OnlyValid:
+            selected_answer_id: Any = UserTaskTally.latest_valid_answer_id
+        case AnswerCountRule.ValidThenInvalid:
+            selected_answer_id = func.coalesce(
+                UserTaskTally.latest_valid_answer_id, UserTaskTally.latest_answer_id
+            )
+        case AnswerCountRule.Any:
+            selected_answer_id = UserTaskTally.latest_answer_id
+
+    stmt = (
+        select(UserTaskTally)
+        .join(Answer, Answer.id == selected_answer_id)
+        .filter(UserTaskTally.task_id.in_(task_ids_to_strlist(task_ids)))
+        .with_only_columns(
+            UserTaskTally.user_id,
+            UserTaskTally.task_id,
+            Answer.id,
+            Answer.points,
+            UserTaskTally.first_answered_on,
+            UserTaskTally.last_answered_on,
+        )
+    )
+    if user_ids is not None:
+        stmt = stmt.filter(UserTaskTally.user_id.in_(user_ids))
+
+    user_answers_by_id: dict[int, dict[str, UserAnswerInfo]] = defaultdict(dict)
+    answer_info_by_answer_id: dict[int, list[UserAnswerInfo]] = defaultdict(list)
+    tallies: Result[tuple[int, str, int, float | None, datetime, datetime]] = run_sql(
+        stmt
+    )
+    for user_id, task_id, answer_id, points, first_on, last_on in tallies:
+        info = UserAnswerInfo(answer_id=answer_id, points=points)
+        if with_answer_time:
+            info.answered_on_min = first_on
+            info.answered_on_max = last_on
+        user_answers_by_id[user_id][task_id] = info
+        answer_info_by_answer_id[answer_id].append(info)
+
+    return collect_user_task_entries(
+        user_answers_by_id,
+        answer_info_by_answer_id,
+        user_ids,
+        group_by_user,
+        group_by_doc,
+    )
+
+
 def get_users_for_tasks(
     task_ids: list[TaskId],
     user_ids: list[int] | None = None,
@@ -902,6 +988,16 @@ def get_users_for_tasks(
     with_answer_time: bool = False,
     count_rule: AnswerCountRule = AnswerCountRule.OnlyValid,
 ) -> list[UserTaskEntry]:
+    # The tally table only covers all answers of a task, so filtered queries have to go through the answers.
+    if answer_filter is None or isinstance(answer_filter, True_):
+        return get_users_for_tasks_tally(
+            task_ids,
+            user_ids,
+            group_by_user,
+            group_by_doc,
+            with_answer_time,
+            count_rule,
+        )
     # FIXME: Fix the get_users_for_tasks_sql version and call it instead. See the PERF comment below for details.
     return get_users_for_tasks_py(
         task_ids,
@@ -928,6 +1024,7 @@ def get_users_for_tasks(
 #     - Consider using a materialized view for the query. However, this will require running
 #       updates on the view periodically, which increases speed at the cost of data freshness.
 #     - Consider adding an aggregate table that contains the per-user tally on each answer.
+#       (Done for queries without an answer filter, see get_users_for_tasks_tally.)
 def get_users_for_tasks_sql(
     task_ids: list[TaskId],
     user_ids: list[int] | None = None,
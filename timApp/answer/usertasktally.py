@@ -0,0 +1,193 @@
+"""Keeps the per-user task tally table (UserTaskTally) in sync with the answers.
+
+Every flush that adds or deletes answers, changes their validity, time or task, or changes the users of an answer
+records the affected (task, user) pairs. After the flush the tally rows of those pairs are recomputed from the
+answer table within the same transaction. Points are not stored in the tally but read through the answer ids,
+so changing the points of an answer does not require a refresh.
+
+Bulk statements (e.g. delete(Answer)) bypass the session hooks and must call refresh_user_task_tallies
+themselves. The whole table can be rebuilt with "flask answer rebuild_tallies".
+"""
+from typing import Iterable, Any
+
+from sqlalchemy import select, func, tuple_, delete, exists, event, Connection
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session, attributes
+from sqlalchemy.orm.base import PASSIVE_NO_INITIALIZE
+
+from timApp.answer.answer import Answer
+from timApp.answer.answer_models import UserAnswer, UserTaskTally
+from timApp.timdb.sqa import db
+from timApp.user.user import User
+
+TallyKey = tuple[str, int]
+PendingTallyKey = tuple[str, User | int]
+
+PENDING_TALLIES_KEY = "pending_user_task_tallies"
+
+# First key of the advisory locks taken while refreshing; the second key is the user id.
+TALLY_LOCK_NAMESPACE = 8271
+
+ANSWER_TALLY_FIELDS = ("valid", "answered_on", "task_id")
+
+
+def get_tally_select() -> Any:
+    """Returns a statement that computes the tally rows from the answer table."""
+    return (
+        select(
+            Answer.task_id,
+            UserAnswer.user_id,
+            func.max(Answer.id),
+            func.max(Answer.id).filter(Answer.valid),
+            func.count(),
+            func.min(Answer.answered_on),
+            func.max(Answer.answered_on),
+        )
+        .join(UserAnswer, UserAnswer.answer_id == Answer.id)
+        .group_by(Answer.task_id, UserAnswer.user_id)
+    )
+
+
+def upsert_tallies(conn: Connection | Session, tally_select: Any) -> None:
+    t = UserTaskTally.__table__
+    stmt = insert(t).from_select(
+        [
+            t.c.task_id,
+            t.c.user_id,
+            t.c.latest_answer_id,
+            t.c.latest_valid_answer_id,
+            t.c.answer_count,
+            t.c.first_answered_on,
+            t.c.last_answered_on,
+        ],
+        tally_select,
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[t.c.task_id, t.c.user_id],
+        set_={
+            c: stmt.excluded[c]
+            for c in (
+                "latest_answer_id",
+                "latest_valid_answer_id",
+                "answer_count",
+                "first_answered_on",
+                "last_answered_on",
+            )
+        },
+    )
+    conn.execute(stmt)
+
+
+def refresh_user_task_tallies(
+    keys: Iterable[TallyKey], conn: Connection | Session | None = None
+) -> None:
+    """Recomputes the tally rows of the given (task id, user id) pairs from the answer table.
+
+    :param keys: The pairs to refresh.
+    :param conn: The connection to use. Defaults to the current session.
+    """
+    keys = sorted(set(keys), key=lambda k: (k[1], k[0]))
+    if not keys:
+        return
+    if conn is None:
+        conn = db.session
+    # Serialize refreshes per user so that concurrent answers cannot leave a stale row behind.
+    # The locks are taken in user id order to avoid deadlocks.
+    for user_id in sorted({user_id for _, user_id in keys}):
+        conn.execute(select(func.pg_advisory_xact_lock(TALLY_LOCK_NAMESPACE, user_id)))
+    upsert_tallies(
+        conn,
+        get_tally_select().filter(tuple_(Answer.task_id, UserAnswer.user_id).in_(keys)),
+    )
+    t = UserTaskTally.__table__
+    conn.execute(
+        delete(t).where(
+            tuple_(t.c.task_id, t.c.user_id).in_(keys)
+            & ~exists(
+                select(Answer.id)
+                .join(UserAnswer, UserAnswer.answer_id == Answer.id)
+                .where(
+                    (Answer.task_id == t.c.task_id)
+                    & (UserAnswer.user_id == t.c.user_id)
+                )
+            )
+        )
+    )
+
+
+def rebuild_user_task_tallies() -> int:
+    """Rebuilds the whole tally table from the answer table.
+
+    :return: The number of tally rows.
+    """
+    db.session.execute(delete(UserTaskTally.__table__))
+    upsert_tallies(db.session, get_tally_select())
+    return db.session.scalar(select(func.count()).select_from(UserTaskTally))
+
+
+def get_tally_keys_for_answers(answer_ids: list[int]) -> set[TallyKey]:
+    """Returns the (task id, user id) pairs that the given answers contribute to."""
+    if not answer_ids:
+        return set()
+    return set(
+        db.session.execute(
+            select(Answer.task_id, UserAnswer.user_id)
+            .join(UserAnswer, UserAnswer.answer_id == Answer.id)
+            .filter(Answer.id.in_(answer_ids))
+        ).all()
+    )
+
+
+def _get_changed_items(obj: Any, key: str) -> list[Any]:
+    hist = attributes.get_history(obj, key, passive=PASSIVE_NO_INITIALIZE)
+    return [*(hist.added or ()), *(hist.deleted or ())]
+
+
+def _collect_answer_keys(session: Session, answer: Answer) -> set[PendingTallyKey]:
+    task_ids = {answer.task_id}
+    users: list[User | int] = _get_changed_items(answer, "users")
+    users += _get_changed_items(answer, "users_all")
+    changed = answer in session.deleted or any(
+        attributes.get_history(answer, f, passive=PASSIVE_NO_INITIALIZE).has_changes()
+        for f in ANSWER_TALLY_FIELDS
+    )
+    if changed and answer not in session.new:
+        task_ids.update(
+            attributes.get_history(
+                answer, "task_id", passive=PASSIVE_NO_INITIALIZE
+            ).deleted
+            or ()
+        )
+        users += session.execute(
+            select(UserAnswer.user_id).filter_by(answer_id=answer.id)
+        ).scalars()
+    return {(task_id, u) for task_id in task_ids for u in users}
+
+
+@event.listens_for(db.session, "before_flush")
+def collect_tally_changes(session: Session, flush_context: Any, instances: Any) -> None:
+    keys: set[PendingTallyKey] = set()
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, Answer):
+            keys.update(_collect_answer_keys(session, obj))
+        elif isinstance(obj, User):
+            for key in ("answers", "answers_alt"):
+                keys.update((a.task_id, obj) for a in _get_changed_items(obj, key))
+    if keys:
+        session.info.setdefault(PENDING_TALLIES_KEY, set()).update(keys)
+
+
+@event.listens_for(db.session, "after_flush")
+def refresh_pending_tallies(session: Session, flush_context: Any) -> None:
+    keys = session.info.pop(PENDING_TALLIES_KEY, None)
+    if keys:
+        # New users get their ids only during the flush.
+        refresh_user_task_tallies(
+            ((task_id, u.id if isinstance(u, User) else u) for task_id, u in keys),
+            session.connection(),
+        )
+
+
+@event.listens_for(db.session, "after_rollback")
+def clear_pending_tallies(session: Session) -> None:
+    session.info.pop(PENDING_TALLIES_KEY, None)
@@ -78,6 +78,17 @@ PLUGIN_COUNT_LAZY_LIMIT = 20
 QST_PLUGIN_PORT = 5000
 PLUGIN_CONNECT_TIMEOUT = 0.5
 
+# Maximum number of concurrent render requests to plugins when rendering a page.
+# Set to 1 to render plugins one at a time.
+PLUGIN_RENDER_CONCURRENCY = 8
+
+# Number of consecutive connection failures, connect timeouts or 5xx responses after which calls to a plugin fail
+# immediately until the plugin responds again. Read timeouts are not counted. Set to 0 to disable the circuit breaker.
+PLUGIN_BREAKER_FAILURE_THRESHOLD = 5
+
+# Seconds between the checks whether a plugin with an open circuit breaker responds again.
+PLUGIN_BREAKER_PROBE_INTERVAL = 10
+
 # When enabled, the readingtypes on_screen and hover_par will not be saved in the database.
 DISABLE_AUTOMATIC_READINGS = False
 HELP_EMAIL = "tim@jyu.fi"
@@ -133,8 +144,36 @@ If enabled, UserSelect will automatically schedule running the queued actions wi
 When disabled, the actions must be run manually with /userSelect/applyPendingActions
 """
 
+GEN_CACHE_CELERY = True
+"""
+If enabled, /generateCache distributes the renders to Celery workers.
+When disabled, the renders are done one after another in the request process.
+"""
+GEN_CACHE_TIMEOUT = 60 * 60
+"""How long /generateCache waits for the Celery renders to finish. Duration in seconds."""
+
+SEARCH_INDEX_UPDATE_CELERY = True
+"""
+If enabled, the search index is updated in Celery after documents are edited, renamed, moved or tagged.
+When disabled, the index is updated in the request process.
+"""
+
 MAIL_HOST = "smtpauth2.jyu.fi"
 MAIL_SIGNATURE = "\n\n-- \nThis message was automatically sent by TIM"
+MAIL_POOL_SIZE = 2
+"""Number of persistent SMTP connections per process."""
+MAIL_BATCH_SIZE = 50
+"""Maximum number of queued messages that a connection sends at a time."""
+MAIL_RATE_LIMIT = 10
+"""Maximum number of messages sent per second per process. Set to 0 to disable the limit."""
+MAIL_MAX_RETRIES = 3
+"""How many times a message is retried after a connection problem or a temporary SMTP error."""
+MAIL_RETRY_DELAY = 5
+"""Delay in seconds before the first retry. The delay doubles on every retry."""
+MAIL_IDLE_TIMEOUT = 30
+"""How long an idle SMTP connection is kept open. Duration in seconds."""
+MAIL_EXIT_TIMEOUT = 10
+"""How long the process waits for the queued messages to be sent when it exits. Duration in seconds."""
 WTF_CSRF_METHODS = ["POST", "PUT", "PATCH", "DELETE"]
 WTF_CSRF_HEADERS = ["X-XSRF-TOKEN"]
 WTF_CSRF_TIME_LIMIT = None
@@ -254,6 +293,15 @@ RESERVED_NAMES = ["postmaster", "listmaster", "admin"]
 # If true, prints all SQL statements with tracebacks.
 DEBUG_SQL = False
 
+# If true, responses have a Server-Timing header with the time spent in the request,
+# in database queries, Dumbo and plugins, and in the taketime probes.
+# The header is visible to every client, so this is only enabled in development by default.
+TRACE_SERVER_TIMING = False
+
+# Percentage of requests whose timing is written to the log as a JSON line (prefixed with "TRACE").
+# Set to 100 to log every request.
+TRACE_LOG_SAMPLE_PERCENT = 0
+
 MINIMUM_SCHEDULED_FUNCTION_INTERVAL = 3600
 
 INTERNAL_PLUGIN_DOMAIN = "tim"
@@ -329,6 +377,10 @@ DIST_RIGHTS_IS_DISTRIBUTOR = False
 # Number of threads to use when distributing rights via HTTP
 DIST_RIGHTS_WORKER_THREADS = multiprocessing.cpu_count()
 
+# Number of logged ops after which the folded rights of a target are written to the <target>.rights.snapshot file,
+# so that other processes only need to replay the rest of the log.
+DIST_RIGHTS_SNAPSHOT_INTERVAL = 100
+
 # The set of allowed IP networks. The following actions are restricted:
 # * Login and email registration are denied for non-admins.
 # * Answer route is blocked.
@@ -525,6 +577,34 @@ GLOBAL_DOCUMENT_CACHING = False
 Global default value for document caching. The value allows globally enabling or disabling document cache.
 """
 
+PARAGRAPH_CACHE_MAX_BYTES = 64 * 1024 * 1024
+"""
+Maximum total size (in bytes of paragraph JSON) of the per-process cache of paragraph files.
+Paragraph files are immutable for a given hash, so the cache is shared between requests. Set to 0 to disable.
+"""
+
+NATIVE_PARAGRAPH_ITERATOR = True
+"""
+Whether to read document paragraphs with the native (Rust) reader that loads all paragraph files of a document
+in parallel. If the tim_rust library is not available or was built from older sources, the pure Python reader
+is used regardless of this setting.
+The request parameter native_iter can be used to override this per request.
+"""
+
+UPLOAD_ACCEL_REDIRECT = os.environ.get("CADDY_FILE_OFFLOAD") == "1"
+"""
+Whether uploaded files are sent by Caddy instead of TIM. If True, the file routes only check access and respond with
+an X-Accel-Redirect header that points to the file under FILES_PATH; Caddy then sends the file itself, including
+range requests and ETags. Caddy must have FILES_PATH/blocks mounted at the same path.
+"""
+
+DUMBO_HTML_CACHE_MAX_BYTES = 32 * 1024 * 1024
+"""
+Maximum total size (in bytes of HTML) of the per-process cache of Dumbo results.
+The cache is keyed by the hash of the macro-expanded markdown and the Dumbo options, so identical paragraphs
+in different documents are converted only once. Set to 0 to disable.
+"""
+
 RESTRICT_ROBOTS = False
 RESTRICT_ROBOTS_METHODS = {
     "restrict_global": True,
@@ -3,6 +3,7 @@ import os
 DEBUG = True
 PROFILE = False
 DEBUG_SQL = False
+TRACE_SERVER_TIMING = True
 MINIMUM_SCHEDULED_FUNCTION_INTERVAL = 5
 
 if os.environ.get("RUN_MAILMAN_DEV", "0") == "1":
@@ -0,0 +1,151 @@
+"""Shared caches for the auto macro values and headings of document paragraphs.
+
+The caches are Redis hashes keyed by the document version, so every worker can read them concurrently
+without locking, and entries of old versions simply expire.
+Values for a given version are deterministic, so writers only add missing fields (HSETNX) and never
+overwrite what another worker has already stored.
+
+For each document, the latest version whose caches cover every paragraph is also remembered, so that the caches
+of a new version can be derived from it instead of being recomputed from scratch.
+"""
+
+import pickle
+from typing import Any, Iterable, Iterator
+
+from redis import RedisError
+
+from timApp.document.version import Version
+from timApp.util.logger import log_warning
+from timApp.util.redisclient import rclient
+
+AUTO_MACRO_CACHE_EXPIRE_SECS = 3600 * 24 * 7
+
+
+class VersionedParCache:
+    """A dict-like view of a Redis hash that stores one value per paragraph for a single document version.
+
+    New values are kept locally until :meth:`flush` is called.
+    If Redis is not available, the cache works as a plain dict.
+    """
+
+    def __init__(self, name: str, doc_id: int, version: Version) -> None:
+        self.key = f"tim-{name}-{doc_id}-{version[0]}-{version[1]}"
+        self.data: dict[str, Any] = {}
+        self.new: dict[str, Any] = {}
+
+    def load(self, fields: Iterable[str] | None = None) -> "VersionedParCache":
+        """Loads cached values from Redis.
+
+        :param fields: The fields to load, or None to load all of them.
+        :return: The cache itself.
+        """
+        try:
+            if fields is None:
+                raw = rclient.hgetall(self.key)
+            else:
+                field_list = list(fields)
+                if not field_list:
+                    return self
+                raw = dict(zip(field_list, rclient.hmget(self.key, field_list)))
+        except RedisError as e:
+            log_warning(f"Could not read {self.key} from Redis: {e}")
+            return self
+        for k, v in raw.items():
+            if v is not None:
+                self.data[k.decode() if isinstance(k, bytes) else k] = pickle.loads(v)
+        return self
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self.data.get(key, default)
+
+    def __getitem__(self, key: str) -> Any:
+        return self.data[key]
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        self.data[key] = value
+        self.new[key] = value
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.data
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.data)
+
+    def items(self) -> Iterable[tuple[str, Any]]:
+        return self.data.items()
+
+    def flush(self, ex: int = AUTO_MACRO_CACHE_EXPIRE_SECS) -> None:
+        """Writes new values to Redis without overwriting existing ones."""
+        if not self.new:
+            return
+        try:
+            with rclient.pipeline(transaction=False) as pipe:
+                for k, v in self.new.items():
+                    pipe.hsetnx(self.key, k, pickle.dumps(v))
+                pipe.expire(self.key, ex)
+                pipe.execute()
+        except RedisError as e:
+            log_warning(f"Could not write {self.key} to Redis: {e}")
+        self.new = {}
+
+    def clear(self) -> None:
+        """Removes all values from the cache, including the ones in Redis."""
+        self.data = {}
+        self.new = {}
+        try:
+            rclient.delete(self.key)
+        except RedisError as e:
+            log_warning(f"Could not clear {self.key} from Redis: {e}")
+
+
+def get_auto_macro_cache(doc_id: int, version: Version) -> VersionedParCache:
+    """Returns the cache of auto macro values (heading numbers) of each paragraph."""
+    return VersionedParCache("automacros", doc_id, version)
+
+
+def get_heading_cache(doc_id: int, version: Version) -> VersionedParCache:
+    """Returns the cache of heading ids preceding each paragraph."""
+    return VersionedParCache("headings", doc_id, version)
+
+
+def get_cached_auto_macros(doc_id: int, version: Version, par_id: str) -> dict | None:
+    """Returns the cached auto macro values of a single paragraph, or None if they are not cached."""
+    return get_auto_macro_cache(doc_id, version).load([par_id]).get(par_id)
+
+
+def _get_latest_complete_key(doc_id: int) -> str:
+    return f"tim-automacros-latest-{doc_id}"
+
+
+def get_latest_complete_version(doc_id: int, settings_hash: str) -> Version | None:
+    """Returns the latest version of the document whose auto macro caches are complete.
+
+    :param doc_id: The document id.
+    :param settings_hash: The hash of the current document settings. Caches computed with other settings are ignored.
+    :return: The version, or None if there is no usable version.
+    """
+    try:
+        raw = rclient.get(_get_latest_complete_key(doc_id))
+    except RedisError as e:
+        log_warning(f"Could not read latest auto macro version of {doc_id}: {e}")
+        return None
+    if raw is None:
+        return None
+    major, minor, stored_hash = raw.decode().split(" ", 2)
+    if stored_hash != settings_hash:
+        return None
+    return int(major), int(minor)
+
+
+def set_latest_complete_version(
+    doc_id: int, version: Version, settings_hash: str
+) -> None:
+    """Remembers that the auto macro caches of the given version are complete."""
+    try:
+        rclient.set(
+            _get_latest_complete_key(doc_id),
+            f"{version[0]} {version[1]} {settings_hash}",
+            ex=AUTO_MACRO_CACHE_EXPIRE_SECS,
+        )
+    except RedisError as e:
+        log_warning(f"Could not write latest auto macro version of {doc_id}: {e}")
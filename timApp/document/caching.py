@@ -1,28 +1,32 @@
 import hashlib
+import time
 from dataclasses import dataclass
 from typing import Optional, Union, TYPE_CHECKING, overload
 
-import redis
 from redis import ResponseError
+from redis.client import Pipeline
 
 from timApp.document.docinfo import DocInfo
 from timApp.document.docrenderresult import DocRenderResult
 from timApp.document.document import Document
 from timApp.document.docviewparams import DocViewParams
 from timApp.document.viewcontext import ViewRoute, ViewContext
+from timApp.util.redisclient import rclient
 from timApp.util.utils import dataclass_to_bytearray
 
 if TYPE_CHECKING:
     from timApp.user.user import User
 
-rclient = redis.Redis(host="redis")
-
 allowed_cache_routes = {
     ViewRoute.View,
 }
 
 DEFAULT_EXPIRE_SECS = 3600 * 24 * 7
 
+# Included in the cache keys. Bump this when the cache format or the way the keys are tracked changes
+# so that entries written by older versions are not used.
+DOC_CACHE_KEY_VERSION = 2
+
 
 DocInfoOrDocument = Union[DocInfo, Document]
 
@@ -82,6 +86,7 @@ def get_doc_cache_key(
 ) -> str:
     # We can't use builtin hash(...) here because the hash value changes between restarts.
     h = hashlib.shake_256()
+    h.update(DOC_CACHE_KEY_VERSION.to_bytes(4, "little"))
     for part in doc.document.get_version():
         h.update(part.to_bytes(4, "little", signed=True))
     h.update(dataclass_to_bytearray(m))
@@ -89,6 +94,20 @@ def get_doc_cache_key(
     return f"timdoc-{doc.id}-{user.id}-{h.hexdigest(10)}"
 
 
+def get_doc_cache_index_key(doc_id: int) -> str:
+    return f"timdocindex-doc-{doc_id}"
+
+
+def get_user_cache_index_key(user_id: int) -> str:
+    return f"timdocindex-user-{user_id}"
+
+
+def get_cache_index_keys(key: str) -> tuple[str, str]:
+    """Returns the document and user index keys of a document cache key."""
+    _, doc_id, user_id, _ = key.split("-", 3)
+    return get_doc_cache_index_key(int(doc_id)), get_user_cache_index_key(int(user_id))
+
+
 @overload
 def clear_doc_cache(doc: DocInfoOrDocument | int, user: "User") -> None:
     ...
@@ -107,23 +126,33 @@ def clear_doc_cache(doc: None, user: "User") -> None:
 def clear_doc_cache(
     doc: DocInfoOrDocument | int | None, user: Optional["User"]
 ) -> None:
-    if not doc:
-        prefix = "timdoc-*-"
-    else:
+    if doc:
         doc_id: int = doc if isinstance(doc, int) else doc.id
-        prefix = f"timdoc-{doc_id}-"
-    if user:
-        prefix += f"{user.id}-"
-    prefix += "*"
-    for key in rclient.scan_iter(match=prefix, count=1000):
-        rclient.delete(key)
+        index = get_doc_cache_index_key(doc_id)
+    elif user:
+        index = get_user_cache_index_key(user.id)
+    else:
+        raise ValueError("Either doc or user must be given")
+    keys: list[bytes] = rclient.zrange(index, 0, -1)  # type: ignore
+    if doc and user:
+        prefix = f"timdoc-{doc_id}-{user.id}-".encode()
+        keys = [k for k in keys if k.startswith(prefix)]
+    if not keys:
+        return
+    pipe = rclient.pipeline(transaction=False)
+    pipe.delete(*keys)
+    for key in keys:
+        for i in get_cache_index_keys(key.decode()):
+            pipe.zrem(i, key)
+    pipe.execute()
 
 
 def set_doc_cache(
     key: str, value: DocRenderResult, ex: int = DEFAULT_EXPIRE_SECS
 ) -> None:
-    rclient.delete(key)
-    rclient.rpush(
+    pipe = rclient.pipeline()
+    pipe.delete(key)
+    pipe.rpush(
         key,
         value.head_html,
         value.content_html,
@@ -131,11 +160,26 @@ def set_doc_cache(
         value.override_theme or "",
         int(value.hide_readmarks),
     )
-    refresh_doc_expire(key, ex)
+    _add_expire_commands(pipe, key, ex)
+    pipe.execute()
 
 
 def refresh_doc_expire(key: str, ex: int = DEFAULT_EXPIRE_SECS) -> None:
-    rclient.expire(key, ex)
+    pipe = rclient.pipeline()
+    _add_expire_commands(pipe, key, ex)
+    pipe.execute()
+
+
+def _add_expire_commands(pipe: Pipeline, key: str, ex: int) -> None:
+    # The indexes are sorted sets scored by the expiry time of the entries,
+    # so the expired entries can be pruned on the way.
+    # An index lives as long as its latest entry; all entries use the same expiry time in practice.
+    now = time.time()
+    pipe.expire(key, ex)
+    for index in get_cache_index_keys(key):
+        pipe.zremrangebyscore(index, "-inf", now)
+        pipe.zadd(index, {key: now + ex})
+        pipe.expire(index, ex)
 
 
 def set_style_timestamp_hash(style_name: str, hash_val: str) -> None:
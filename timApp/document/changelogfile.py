@@ -0,0 +1,144 @@
+"""Append-only storage for document changelogs.
+
+The log is stored oldest entry first, one JSON object per line. Next to it there is a small binary index that
+contains the starting byte offset of each line, so the newest N entries can be read by seeking near the end of
+the log instead of parsing the whole file.
+
+Older documents have a changelog file in the legacy format (newest entry first). Those are migrated to the new
+format the first time the changelog is read or written.
+"""
+
+import json
+import os
+from array import array
+from pathlib import Path
+from typing import Any
+
+from filelock import FileLock
+
+LEGACY_LOG_NAME = "changelog"
+LOG_NAME = "changelog.log"
+INDEX_NAME = "changelog.idx"
+
+# Each index item is an unsigned 64-bit byte offset into the log.
+INDEX_TYPECODE = "Q"
+INDEX_ITEM_SIZE = array(INDEX_TYPECODE).itemsize
+
+
+class ChangelogFile:
+    def __init__(self, doc_dir: Path, doc_id: int):
+        self.doc_dir = doc_dir
+        self.doc_id = doc_id
+
+    @property
+    def legacy_path(self) -> Path:
+        return self.doc_dir / LEGACY_LOG_NAME
+
+    @property
+    def log_path(self) -> Path:
+        return self.doc_dir / LOG_NAME
+
+    @property
+    def index_path(self) -> Path:
+        return self.doc_dir / INDEX_NAME
+
+    def get_lock(self) -> FileLock:
+        return FileLock(f"/tmp/doc_{self.doc_id}_changelog_lock")
+
+    def append(self, entry: dict[str, Any]) -> None:
+        """Appends an entry to the end of the log.
+
+        :param entry: The changelog entry to append.
+        """
+        line = (json.dumps(entry) + "\n").encode("utf-8")
+        with self.get_lock():
+            self._migrate_legacy()
+            with self.log_path.open("ab") as log:
+                offset = log.seek(0, os.SEEK_END)
+                log.write(line)
+            with self.index_path.open("ab") as idx:
+                array(INDEX_TYPECODE, [offset]).tofile(idx)
+
+    def read_newest(self, max_entries: int) -> list[str]:
+        """Reads the newest entries from the log.
+
+        :param max_entries: Maximum number of entries to read. A negative value reads all entries.
+        :return: The raw JSON lines, newest first.
+        """
+        if max_entries == 0:
+            return []
+        if self.legacy_path.exists():
+            with self.get_lock():
+                self._migrate_legacy()
+        if not self.log_path.is_file():
+            return []
+        start = 0
+        if max_entries > 0:
+            start = self._get_offset_from_end(max_entries)
+            if start > self.log_path.stat().st_size:
+                # The index does not match the log, e.g. because the log was restored from a backup.
+                self.rebuild_index()
+                start = self._get_offset_from_end(max_entries)
+        with self.log_path.open("rb") as log:
+            log.seek(start)
+            data = log.read()
+        lines = [l.decode("utf-8") for l in data.splitlines() if l]
+        lines.reverse()
+        if max_entries > 0:
+            # The log may contain entries that were written after the index was read, so the result can be longer.
+            return lines[:max_entries]
+        return lines
+
+    def _get_offset_from_end(self, n: int) -> int:
+        """Returns the offset of the n-th newest indexed entry, or 0 if there are fewer entries."""
+        try:
+            size = self.index_path.stat().st_size
+        except FileNotFoundError:
+            self.rebuild_index()
+            size = self.index_path.stat().st_size
+        count = size // INDEX_ITEM_SIZE
+        if count <= n:
+            return 0
+        offsets = array(INDEX_TYPECODE)
+        with self.index_path.open("rb") as idx:
+            idx.seek((count - n) * INDEX_ITEM_SIZE)
+            offsets.fromfile(idx, 1)
+        return offsets[0]
+
+    def rebuild_index(self) -> None:
+        """Rebuilds the offset index by scanning the whole log."""
+        offsets = array(INDEX_TYPECODE)
+        pos = 0
+        if self.log_path.is_file():
+            with self.log_path.open("rb") as log:
+                for line in log:
+                    if line.strip():
+                        offsets.append(pos)
+                    pos += len(line)
+        tmp_path = self.index_path.with_suffix(".idx.tmp")
+        with tmp_path.open("wb") as idx:
+            offsets.tofile(idx)
+        os.replace(tmp_path, self.index_path)
+
+    def _migrate_legacy(self) -> None:
+        """Converts a legacy newest-first changelog to the append-only format.
+
+        Must be called while holding the changelog lock.
+        """
+        if not self.legacy_path.exists():
+            return
+        with self.legacy_path.open("rb") as f:
+            legacy_lines = [l for l in f.read().splitlines() if l.strip()]
+        legacy_lines.reverse()
+        # Any entries already in the new log were written after the legacy ones.
+        existing = b""
+        if self.log_path.is_file():
+            existing = self.log_path.read_bytes()
+        tmp_path = self.log_path.with_suffix(".log.tmp")
+        with tmp_path.open("wb") as log:
+            for l in legacy_lines:
+                log.write(l + b"\n")
+            log.write(existing)
+        os.replace(tmp_path, self.log_path)
+        self.rebuild_index()
+        self.legacy_path.unlink()
@@ -2,22 +2,28 @@ from __future__ import annotations
 
 import json
 import os
-import shelve
 import time
 from collections import defaultdict
 from copy import copy
 from typing import TYPE_CHECKING, Optional
 
 import commonmark
-import filelock
 from commonmark.node import Node
 from jinja2.sandbox import SandboxedEnvironment
 
+from timApp.document.automacrocache import (
+    get_auto_macro_cache,
+    get_heading_cache,
+    get_cached_auto_macros,
+    get_latest_complete_version,
+    set_latest_complete_version,
+)
 from timApp.document.documentparser import DocumentParser
 from timApp.document.documentparseroptions import DocumentParserOptions
 from timApp.document.documentwriter import DocumentWriter
 from timApp.document.macroinfo import MacroInfo
 from timApp.document.par_basic_data import ParBasicData
+from timApp.document.parcache import get_paragraph_cache, copy_block
 from timApp.document.preloadoption import PreloadOption
 from timApp.document.prepared_par import PreparedPar
 from timApp.document.randutils import random_id, hashfunc
@@ -38,7 +44,7 @@ from timApp.util.utils import (
     get_boolean,
 )
 from tim_common.dumboclient import DumboOptions, MathType, InputFormat
-from tim_common.html_sanitize import sanitize_html, strip_div
+from tim_common.html_sanitize import sanitize_html, sanitize_html_batch, strip_div
 from tim_common.utils import parse_bool
 
 if TYPE_CHECKING:
@@ -270,6 +276,11 @@ class DocParagraph:
         :return: The retrieved DocParagraph.
 
         """
+        cache = get_paragraph_cache()
+        cache_key = (doc.doc_id, par_id, t)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return cls.from_dict(doc, copy_block(cached))
         try:
             par_path = cls._get_path(doc, par_id, t)
             # We need to retry reading the file in case it is being written to.
@@ -280,7 +291,8 @@ class DocParagraph:
             while True:
                 with open(par_path) as f:
                     try:
-                        doc_dict = json.loads(f.read())
+                        par_json = f.read()
+                        doc_dict = json.loads(par_json)
                         break
                     except json.JSONDecodeError as ex:
                         attempt += 1
@@ -290,6 +302,7 @@ class DocParagraph:
                             ) from ex
                         else:
                             time.sleep(0.01)
+            cache.put(cache_key, copy_block(doc_dict), len(par_json))
             return cls.from_dict(doc, doc_dict)
         except FileNotFoundError:
             doc._raise_not_found(par_id)
@@ -605,9 +618,9 @@ class DocParagraph:
         if not pars:
             return []
 
-        doc_id = pars[0].doc.doc_id
-        macro_cache_file = f"/tmp/tim_auto_macros_{doc_id}"
-        heading_cache_file = f"/tmp/heading_cache_{doc_id}"
+        doc = pars[0].doc
+        cache = get_auto_macro_cache(doc.doc_id, doc.get_version())
+        heading_cache = get_heading_cache(doc.doc_id, doc.get_version())
 
         first_pars = []
         if context_par is not None:
@@ -615,43 +628,35 @@ class DocParagraph:
             pars = first_pars + pars
 
         if not persist:
-            cache = {}
-            heading_cache = {}
-            with shelve.open(macro_cache_file) as c, shelve.open(
-                heading_cache_file
-            ) as hc:
-                # Basically we want the cache objects to be non-persistent, so we convert them to normal dicts
-                # Find out better way if possible...
-                for par in first_pars:
-                    key = str((par.get_id(), par.doc.get_version()))
-                    value = c.get(key)
-                    if value is not None:
-                        cache[key] = value
-                    value = hc.get(par.get_id())
-                    if value is not None:
-                        heading_cache[par.get_id()] = value
+            # The values computed for temporary paragraphs must not be stored, so only the values of the context
+            # paragraph are loaded and nothing is flushed.
+            first_ids = [par.get_id() for par in first_pars]
+            cache.load(first_ids)
+            heading_cache.load(first_ids)
             unloaded_pars = cls.get_unloaded_pars(
                 pars, settings, cache, heading_cache, clear_cache
             )
         else:
-            with filelock.FileLock(f"/tmp/cache_lock_{doc_id}"):
-                if clear_cache:
-                    try:
-                        os.remove(macro_cache_file + ".db")
-                    except FileNotFoundError:
-                        pass
-                    try:
-                        os.remove(heading_cache_file + ".db")
-                    except FileNotFoundError:
-                        pass
-                with shelve.open(macro_cache_file) as cache, shelve.open(
-                    heading_cache_file
-                ) as heading_cache:
-                    unloaded_pars = cls.get_unloaded_pars(
-                        pars, settings, cache, heading_cache, clear_cache
-                    )
-                    for k, v in heading_cache.items():
-                        heading_cache[k] = v
+            if clear_cache:
+                cache.clear()
+                heading_cache.clear()
+            else:
+                cache.load()
+                heading_cache.load()
+                if not doc.preamble_included:
+                    cls.reuse_previous_auto_macros(doc, settings, cache, heading_cache)
+            unloaded_pars = cls.get_unloaded_pars(
+                pars, settings, cache, heading_cache, clear_cache
+            )
+            cache.flush()
+            heading_cache.flush()
+            par_ids = doc.get_par_ids()
+            if not doc.preamble_included and par_ids and par_ids[-1] in cache:
+                # The values of a paragraph depend on all the previous ones, so the caches are complete
+                # if the last paragraph has a value.
+                set_latest_complete_version(
+                    doc.doc_id, doc.get_version(), settings.get_hash()
+                )
 
         changed_pars = []
         if len(unloaded_pars) > 0:
@@ -678,25 +683,102 @@ class DocParagraph:
                     for _, _, auto_macros, hs, _ in unloaded_pars
                 ),
             )
+            htmls = [h.decode() if isinstance(h, bytes) else h for h in htmls]
+            htmls = [strip_div(h) for h in htmls]
+            # h is not sanitized but old_html is, but HTML stays unchanged after sanitization most of the time
+            # so they are comparable after stripping div. We want to avoid calling sanitize_html unnecessarily.
+            to_sanitize = [
+                i
+                for i, ((par, _, _, _, old_html), h) in enumerate(
+                    zip(unloaded_pars, htmls)
+                )
+                if h != old_html and not getattr(par, "was_invalid", False)
+            ]
+            for i, h in zip(
+                to_sanitize, sanitize_html_batch(htmls[i] for i in to_sanitize)
+            ):
+                htmls[i] = h
+                par, _, _, _, old_html = unloaded_pars[i]
+                if h != old_html and not par.from_preamble():
+                    changed_pars.append(par)
             for (par, auto_macro_hash, _, _, old_html), h in zip(unloaded_pars, htmls):
-                # h is not sanitized but old_html is, but HTML stays unchanged after sanitization most of the time
-                # so they are comparable after stripping div. We want to avoid calling sanitize_html unnecessarily.
                 if getattr(par, "was_invalid", False):
                     continue
-                if isinstance(h, bytes):
-                    h = h.decode()
-                h = strip_div(h)
-                if h != old_html:
-                    h = sanitize_html(h)
-                    if h != old_html:
-                        if not par.from_preamble():
-                            changed_pars.append(par)
                 par.html_cache[auto_macro_hash] = h
                 par._set_html(h, sanitized=True)
                 if persist and not par.from_preamble():
                     par.__write()
         return changed_pars
 
+    @classmethod
+    def reuse_previous_auto_macros(
+        cls, doc, settings, auto_macro_cache, heading_cache
+    ) -> None:
+        """Fills the auto macro caches of the current document version from an earlier version.
+
+        The auto macro values of a paragraph depend only on the previous paragraph and its values. So the values
+        are copied from the latest version that has complete caches as long as the previous paragraph is unchanged
+        and has the same values as in that version. Otherwise the values are recomputed, which means that after an
+        edit the recomputation starts from the changed paragraph and stops when the values converge with the
+        earlier version.
+
+        :param doc: The document.
+        :param settings: The document settings.
+        :param auto_macro_cache: The auto macro cache of the current version.
+        :param heading_cache: The heading cache of the current version.
+        """
+        par_ids = doc.get_par_ids()
+        if not par_ids or par_ids[-1] in auto_macro_cache:
+            return
+        settings_hash = settings.get_hash()
+        version = doc.get_version()
+        prev_version = get_latest_complete_version(doc.doc_id, settings_hash)
+        if prev_version is None or prev_version >= version:
+            return
+        old_cache = get_auto_macro_cache(doc.doc_id, prev_version).load()
+        old_heading_cache = get_heading_cache(doc.doc_id, prev_version).load()
+        if not old_cache:
+            return
+        old_lines = doc.get_version_store().read_lines(prev_version)
+        old_index = {line.split("/")[0]: i for i, line in enumerate(old_lines)}
+        new_lines = [f"{par_id}/{t}" for par_id, t in zip(par_ids, doc.par_hashes)]
+
+        macroinfo = settings.get_macroinfo(default_view_ctx)
+        macros = macroinfo.get_macros()
+        env = macroinfo.jinja_env
+        auto_number_start = settings.auto_number_start()
+
+        # Whether the previous paragraph has the same values as in the earlier version.
+        prev_same = True
+        for i, (par_id, line) in enumerate(zip(par_ids, new_lines)):
+            old_i = old_index.get(par_id)
+            if (
+                prev_same
+                and old_i is not None
+                and par_id in old_cache
+                and par_id in old_heading_cache
+                and (
+                    (i == 0 and old_i == 0)
+                    or (
+                        i > 0 and old_i > 0 and new_lines[i - 1] == old_lines[old_i - 1]
+                    )
+                )
+            ):
+                if par_id not in auto_macro_cache:
+                    auto_macro_cache[par_id] = old_cache[par_id]
+                if par_id not in heading_cache:
+                    heading_cache[par_id] = old_heading_cache[par_id]
+                continue
+            try:
+                values = doc.get_paragraph(par_id).get_auto_macro_values(
+                    macros, env, auto_macro_cache, heading_cache, auto_number_start
+                )
+            except RecursionError:
+                raise TimDbException(
+                    "Infinite recursion detected in get_auto_macro_values; the document may be broken."
+                )
+            prev_same = old_i is not None and old_cache.get(par_id) == values
+
     @classmethod
     def get_unloaded_pars(
         cls, pars, settings, auto_macro_cache, heading_cache, clear_cache=False
@@ -811,7 +893,7 @@ class DocParagraph:
 
         """
 
-        key = str((self.get_id(), self.doc.get_version()))
+        key = self.get_id()
         cached = auto_macro_cache.get(key)
         if cached is not None:
             return cached
@@ -888,6 +970,17 @@ class DocParagraph:
         new_html = sanitize_html(self.html)
         self._set_html(new_html, True)
 
+    @staticmethod
+    def sanitize_htmls(pars: list[DocParagraph]) -> None:
+        """Sanitizes the HTML of the given paragraphs in one batch.
+
+        Paragraphs whose HTML has already been sanitized or has not been loaded are skipped.
+
+        """
+        pars = [p for p in pars if not p.html_sanitized and p.html]
+        for p, new_html in zip(pars, sanitize_html_batch(p.html for p in pars)):
+            p._set_html(new_html, True)
+
     def _set_html(self, new_html: str, sanitized: bool = False) -> str:
         """Sets the HTML for this paragraph.
 
@@ -978,8 +1071,13 @@ class DocParagraph:
             if not os.path.exists(base_path):
                 os.makedirs(base_path)
 
+        d = self.dict(include_html_cache=True)
+        par_json = json.dumps(d)
         with open(file_name, "w") as f:
-            f.write(json.dumps(self.dict(include_html_cache=True)))
+            f.write(par_json)
+        get_paragraph_cache().put(
+            (self.doc.doc_id, self.id, self.hash), copy_block(d), len(par_json)
+        )
 
     def set_latest(self):
         """Updates the 'current' symlink to point to this paragraph version."""
@@ -1416,11 +1514,9 @@ def create_final_par(
 
 def get_heading_counts(ctx: DocParagraph):
     d = ctx.doc
-    macro_cache_file = f"/tmp/tim_auto_macros_{d.doc_id}"
-    ps = commonmark.Parser()
-    with shelve.open(macro_cache_file) as cache:
-        vals = cache.get(str((ctx.get_id(), d.get_version())), {}).get("h")
-        return vals
+    return (get_cached_auto_macros(d.doc_id, d.get_version(), ctx.get_id()) or {}).get(
+        "h"
+    )
 
 
 def add_heading_numbers(
@@ -1433,12 +1529,12 @@ def add_heading_numbers(
     initial_heading_counts: dict[int, int] | None = None,
 ):
     d = ctx.doc
-    macro_cache_file = f"/tmp/tim_auto_macros_{ctx.doc.doc_id}"
     # TODO: Cache should be picked up only once and used as a parameter
     ps = commonmark.Parser()
     parsed = ps.parse(s)
-    with shelve.open(macro_cache_file) as cache:
-        vals = cache.get(str((ctx.get_id(), d.get_version())), {}).get("h")
+    vals = (get_cached_auto_macros(d.doc_id, d.get_version(), ctx.get_id()) or {}).get(
+        "h"
+    )
     if not vals:
         return s
     lines = s.splitlines(keepends=False)
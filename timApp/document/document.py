@@ -7,16 +7,16 @@ from dataclasses import dataclass
 from datetime import datetime
 from difflib import SequenceMatcher
 from pathlib import Path
-from tempfile import mkstemp
 from time import time
-from typing import Iterable, Generator, Optional
+from typing import Callable, Iterable, Generator, Optional
 from typing import TYPE_CHECKING
 
 from filelock import FileLock
-from flask import has_request_context, request
+from flask import has_request_context, request, current_app
 from lxml import etree, html
 
 from timApp.document.changelog import Changelog
+from timApp.document.changelogfile import ChangelogFile
 from timApp.document.changelogentry import ChangelogEntry
 from timApp.document.docparagraph import DocParagraph
 from timApp.document.docsettings import DocSettings, resolve_settings_for_pars
@@ -24,10 +24,12 @@ from timApp.document.documentparser import DocumentParser
 from timApp.document.documentparseroptions import DocumentParserOptions
 from timApp.document.documentwriter import DocumentWriter
 from timApp.document.editing.documenteditresult import DocumentEditResult
+from timApp.document.parcache import get_paragraph_cache, copy_block
 from timApp.document.exceptions import DocExistsError, ValidationException
 from timApp.document.preloadoption import PreloadOption
 from timApp.document.validationresult import ValidationResult
 from timApp.document.version import Version
+from timApp.document.versionstore import VersionStore, DeltaOp
 from timApp.document.viewcontext import ViewContext, default_view_ctx
 from timApp.document.yamlblock import YamlBlock
 from timApp.timdb.exceptions import (
@@ -35,9 +37,26 @@ from timApp.timdb.exceptions import (
     PreambleException,
     InvalidReferenceException,
 )
-from timApp.util.utils import get_error_html, trim_markdown, cache_folder_path
+from timApp.util.utils import (
+    get_error_html,
+    trim_markdown,
+    cache_folder_path,
+    get_boolean,
+)
 from tim_common.html_sanitize import presanitize_html_body
 
+# The version of the tim_rust reader interface that ParallelParagraphIter is written for.
+TIM_RUST_READER_API_VERSION = 2
+
+try:
+    from tim_rust.python import read_all_blocks, READER_API_VERSION
+except ImportError:
+    read_all_blocks = None
+else:
+    # An extension built from older sources imports fine but has a different signature and block format.
+    if READER_API_VERSION != TIM_RUST_READER_API_VERSION:
+        read_all_blocks = None
+
 if TYPE_CHECKING:
     from timApp.document.docinfo import DocInfo
 
@@ -93,6 +112,8 @@ class Document:
         self.par_map = None
         # List of preamble pars if they have been inserted
         self.preamble_pars = None
+        # Paragraph list lines of the most recently written version
+        self.version_lines_cache: tuple[Version, list[str]] | None = None
 
     @property
     def id(self):
@@ -271,7 +292,7 @@ class Document:
                 yield p
 
     def get_lock(self) -> FileLock:
-        return FileLock(f"/tmp/doc_{self.doc_id}_lock")
+        return self.get_version_store().get_lock()
 
     def get_own_settings(self) -> YamlBlock:
         """Returns the settings for this document excluding any preamble documents."""
@@ -425,14 +446,27 @@ class Document:
             modifier_group_id=self.modifier_group_id,
         )
 
+    def get_version_store(self) -> VersionStore:
+        return VersionStore(self.get_doc_dir(), self.doc_id)
+
     def get_version_path(self, ver: Version | None = None) -> Path:
+        """Gets the path to the full paragraph list of the given version.
+
+        If the version is stored as a delta, the full list is rebuilt from the deltas first.
+
+        :param ver: The version, or None for the latest version.
+        :return: The path.
+
+        """
         version = self.get_version() if ver is None else ver
-        return (
-            self.get_documents_dir()
-            / str(self.doc_id)
-            / str(version[0])
-            / str(version[1])
-        )
+        return self.get_version_store().get_full_path(version)
+
+    def __get_version_lines(self, ver: Version) -> list[str]:
+        if ver[0] < 1:
+            return []
+        if self.version_lines_cache and self.version_lines_cache[0] == ver:
+            return list(self.version_lines_cache[1])
+        return self.get_version_store().read_lines(ver)
 
     def get_refs_dir(self, ver: Version | None = None) -> Path:
         version = self.get_version() if ver is None else ver
@@ -448,16 +482,14 @@ class Document:
         return self.get_refs_dir(ver) / "reflist_to"
 
     def getlogfilename(self) -> Path:
-        return self.get_doc_dir() / "changelog"
+        return self.get_changelog_file().log_path
+
+    def get_changelog_file(self) -> ChangelogFile:
+        return ChangelogFile(self.get_doc_dir(), self.doc_id)
 
     def __write_changelog(
         self, ver: Version, operation: str, par_id: str, op_params: dict | None = None
     ):
-        logname = self.getlogfilename()
-        src = logname.open("r") if logname.exists() else None
-        destfd, tmpname = mkstemp()
-        dest = os.fdopen(destfd, "w")
-
         ts = time()
         timestamp = datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S")
         entry = {
@@ -468,41 +500,45 @@ class Document:
             "ver": ver,
             "time": timestamp,
         }
-        dest.write(json.dumps(entry))
-        dest.write("\n")
-
-        while src:
-            line = src.readline()
-            if line:
-                dest.write(line)
-            else:
-                src.close()
-                src = None
-
-        dest.close()
-        shutil.copyfile(tmpname, logname)
-        os.unlink(tmpname)
+        self.get_changelog_file().append(entry)
 
     def __increment_version(
-        self, op: str, par_id: str, increment_major: bool, op_params: dict | None = None
-    ) -> Version:
-        ver_exists = True
-        ver = self.get_version()
-        old_ver = None
-        while ver_exists:
-            old_ver = ver
+        self,
+        op: str,
+        par_id: str,
+        increment_major: bool,
+        get_delta: Callable[[list[str]], list[DeltaOp]],
+        op_params: dict | None = None,
+    ) -> tuple[Version, Version]:
+        """Writes a new version of the document.
+
+        The latest version is read, the delta is computed from its lines and the new version is written while
+        holding the document lock, so that concurrent edits cannot write a delta against the wrong base version.
+
+        :param op: The operation for the changelog.
+        :param par_id: The paragraph for the changelog.
+        :param increment_major: Whether to increment the major version instead of the minor one.
+        :param get_delta: Computes the delta operations from the lines of the latest version.
+        :param op_params: The operation parameters for the changelog.
+        :return: The version that the delta was computed from and the new version.
+        """
+        store = self.get_version_store()
+        with store.get_lock():
+            # Another process may have written a version after this object read it.
+            self.version = None
+            old_ver = self.get_version()
+            old_lines = self.__get_version_lines(old_ver)
+            delta = get_delta(old_lines)
             ver = (
                 (old_ver[0] + 1, 0) if increment_major else (old_ver[0], old_ver[1] + 1)
             )
-            ver_exists = (self.get_version_path(ver)).is_file()
-        if increment_major:
-            (self.get_documents_dir() / str(self.doc_id) / str(ver[0])).mkdir()
-        if old_ver[0] > 0:
-            shutil.copyfile(self.get_version_path(old_ver), self.get_version_path(ver))
-        else:
-            with self.get_version_path(ver).open("w"):
-                pass
-        self.__write_changelog(ver, op, par_id, op_params)
+            if increment_major:
+                (self.get_documents_dir() / str(self.doc_id) / str(ver[0])).mkdir()
+            new_lines = store.write_version(
+                ver, old_ver if old_ver[0] > 0 else None, old_lines, delta
+            )
+            self.__write_changelog(ver, op, par_id, op_params)
+        self.version_lines_cache = ver, new_lines
         self.version = ver
         self.par_cache = None
         self.par_map = None
@@ -513,7 +549,7 @@ class Document:
         self.own_settings = None
         self.single_par_cache = {}
         self.ref_doc_cache = {}
-        return ver
+        return old_ver, ver
 
     def __update_metadata(
         self, pars: list[DocParagraph], old_ver: Version, new_ver: Version
@@ -595,16 +631,12 @@ class Document:
         assert p.doc.doc_id == self.doc_id
         p.store()
         p.set_latest()
-        old_ver = self.get_version()
-        new_ver = self.__increment_version("Added", p.get_id(), increment_major=True)
-        old_path = self.get_version_path(old_ver)
-        new_path = self.get_version_path(new_ver)
-        if old_path.exists():
-            shutil.copyfile(old_path, new_path)
-
-        with new_path.open("a") as f:
-            f.write(p.get_id() + "/" + p.get_hash())
-            f.write("\n")
+        old_ver, new_ver = self.__increment_version(
+            "Added",
+            p.get_id(),
+            increment_major=True,
+            get_delta=lambda lines: [("+", len(lines), f"{p.get_id()}/{p.get_hash()}")],
+        )
         if update_meta:
             self.__update_metadata([p], old_ver, new_ver)
         return p
@@ -630,20 +662,18 @@ class Document:
 
         """
         self.raise_if_not_exist(par_id)
-        old_ver = self.get_version()
-        new_ver = self.__increment_version("Deleted", par_id, increment_major=True)
-        self.__update_metadata([], old_ver, new_ver)
 
-        with self.get_version_path(old_ver).open("r") as f_src:
-            with self.get_version_path(new_ver).open("w") as f:
-                while True:
-                    line = f_src.readline()
-                    if not line:
-                        return
-                    if line.startswith(par_id):
-                        pass
-                    else:
-                        f.write(line)
+        def get_delta(lines: list[str]) -> list[DeltaOp]:
+            return [
+                ("-", i, None)
+                for i in reversed(range(len(lines)))
+                if lines[i].startswith(par_id)
+            ]
+
+        old_ver, new_ver = self.__increment_version(
+            "Deleted", par_id, increment_major=True, get_delta=get_delta
+        )
+        self.__update_metadata([], old_ver, new_ver)
 
     def insert_paragraph(
         self,
@@ -706,31 +736,32 @@ class Document:
         if "HELP_PAR" in (insert_after_id, insert_before_id):
             return self.add_paragraph_obj(p)
 
-        old_ver = self.get_version()
-        old_path = self.get_version_path(old_ver)
         p.store()
         p.set_latest()
-        new_ver = self.__increment_version(
+
+        new_line = p.get_id() + "/" + p.get_hash()
+
+        def get_delta(lines: list[str]) -> list[DeltaOp]:
+            delta: list[DeltaOp] = []
+            offset = 0
+            for i, line in enumerate(lines):
+                if insert_before_id and line.startswith(insert_before_id):
+                    delta.append(("+", i + offset, new_line))
+                    offset += 1
+                if insert_after_id and line.startswith(insert_after_id):
+                    delta.append(("+", i + offset + 1, new_line))
+                    offset += 1
+            return delta
+
+        old_ver, new_ver = self.__increment_version(
             "Inserted",
             p.get_id(),
             increment_major=True,
+            get_delta=get_delta,
             op_params={"before_id": insert_before_id}
             if insert_before_id
             else {"after_id": insert_after_id},
         )
-
-        new_line = p.get_id() + "/" + p.get_hash() + "\n"
-        with old_path.open("r") as f_src, self.get_version_path(new_ver).open("w") as f:
-            while True:
-                line = f_src.readline()
-                if not line:
-                    break
-
-                if insert_before_id and line.startswith(insert_before_id):
-                    f.write(new_line)
-                f.write(line)
-                if insert_after_id and line.startswith(insert_after_id):
-                    f.write(new_line)
         self.__update_metadata([p], old_ver, new_ver)
         return p
 
@@ -763,31 +794,26 @@ class Document:
         new_hash = p.get_hash()
         p.store()
         p.set_latest()
-        old_ver = self.get_version()
         old_hash = p_src.get_hash()
         if p.is_same_as(p_src):
             return p
-        new_ver = self.__increment_version(
+        old_line_start = f"{par_id}/"
+        new_line = f"{par_id}/{new_hash}"
+
+        def get_delta(lines: list[str]) -> list[DeltaOp]:
+            return [
+                ("=", i, new_line)
+                for i, line in enumerate(lines)
+                if line.startswith(old_line_start) or line == par_id
+            ]
+
+        old_ver, new_ver = self.__increment_version(
             "Modified",
             par_id,
             increment_major=False,
+            get_delta=get_delta,
             op_params={"old_hash": old_hash, "new_hash": new_hash},
         )
-
-        old_line_start = f"{par_id}/"
-        old_line_legacy = f"{par_id}\n"
-        new_line = f"{par_id}/{new_hash}\n"
-        with self.get_version_path(old_ver).open("r") as f_src, self.get_version_path(
-            new_ver
-        ).open("w") as f:
-            while True:
-                line = f_src.readline()
-                if not line:
-                    break
-                if line.startswith(old_line_start) or line == old_line_legacy:
-                    f.write(new_line)
-                else:
-                    f.write(line)
         self.__update_metadata([p], old_ver, new_ver)
         return p
 
@@ -1004,24 +1030,19 @@ class Document:
         return get_index_from_html_list(html_list)
 
     def get_changelog(self, max_entries: int = 100) -> Changelog:
-        log = Changelog()
-        logname = self.getlogfilename()
-        if not logname.is_file():
-            return Changelog()
-
-        lc = max_entries
-        with logname.open("r") as f:
-            while lc != 0:
-                line = f.readline()
-                if not line:
-                    break
-                try:
-                    entry = json.loads(line)
-                    log.append(ChangelogEntry(**entry))
-                except ValueError:
-                    print(f"doc id {self.doc_id}: malformed log line: {line}")
-                lc -= 1
+        """Gets the newest changelog entries of the document, newest first.
+
+        :param max_entries: Maximum number of entries to get, or a negative number to get all of them.
+        :return: The changelog.
 
+        """
+        log = Changelog()
+        for line in self.get_changelog_file().read_newest(max_entries):
+            try:
+                entry = json.loads(line)
+                log.append(ChangelogEntry(**entry))
+            except ValueError:
+                print(f"doc id {self.doc_id}: malformed log line: {line}")
         return log
 
     def delete_section(self, area_start, area_end) -> DocumentEditResult:
@@ -1195,20 +1216,14 @@ class Document:
     def _get_par_ids_impl(self) -> tuple[list[str], list[str]]:
         par_ids = []
         par_hashes = []
-        if not self.get_version_path().exists():
-            return [], []
-        with self.get_version_path().open("r", encoding="UTF-8") as f:
-            while True:
-                line = f.readline()
-                if not line:
-                    break
-                if len(line) > 14:
-                    # Line contains both par_id and t
-                    par_id, t = line.replace("\n", "").split("/")
-                else:
-                    par_id, t = line.replace("\n", ""), None
-                par_ids.append(par_id)
-                par_hashes.append(t)
+        for line in self.__get_version_lines(self.get_version()):
+            if len(line) > 13:
+                # Line contains both par_id and t
+                par_id, t = line.split("/")
+            else:
+                par_id, t = line, None
+            par_ids.append(par_id)
+            par_hashes.append(t)
         return par_ids, par_hashes
 
     def insert_preamble_pars(self, class_names: list[str] | None = None):
@@ -1283,6 +1298,7 @@ class Document:
         self.settings_cache = {}
         self.ref_doc_cache = {}
         self.single_par_cache = {}
+        self.version_lines_cache = None
 
     def get_ref_doc(
         self,
@@ -1356,13 +1372,28 @@ class CacheIterator:
         return self.i.__next__()
 
 
+def use_native_par_iterator() -> bool:
+    """Returns whether paragraphs should be read with the native (Rust) reader.
+
+    The native reader is used when it is available and enabled with NATIVE_PARAGRAPH_ITERATOR.
+    The native_iter request parameter overrides the configuration.
+    """
+    if read_all_blocks is None:
+        return False
+    default = current_app.config["NATIVE_PARAGRAPH_ITERATOR"]
+    if has_request_context():
+        return get_boolean(request.args.get("native_iter"), default)
+    return default
+
+
 def get_par_iterator(
     doc: Document,
 ) -> DocParagraphIter | ParallelParagraphIter:
-    if has_request_context():
-        # Check if native_iter=true is set in the request.
-        if request.args.get("native_iter", None):
-            return ParallelParagraphIter(doc)
+    from timApp.document.documentversion import DocumentVersion
+
+    # The native reader needs a file, but only the latest version is materialized.
+    if use_native_par_iterator() and not isinstance(doc, DocumentVersion):
+        return ParallelParagraphIter(doc)
     return DocParagraphIter(doc)
 
 
@@ -1386,19 +1417,54 @@ class ParallelParagraphIter:
         return next(self._iterator)
 
     def _do_iter(self) -> Generator[DocParagraph, None, None]:
-        from tim_rust.python import read_all_blocks
+        from timApp.timdb.dbaccess import get_files_path
+
+        doc = self.doc
+        version_path = doc.get_version_path(doc.get_version())
+        if not version_path.is_file():
+            return
 
-        cached_blocks = set(k for k in self.doc.single_par_cache)
-        version_path = self.doc.get_version_path(self.doc.get_version()).as_posix()
-        blocks = read_all_blocks(self.doc.doc_id, version_path, cached_blocks)
+        # Skip reading the blocks that are already cached either in the document or in the process-wide cache.
+        doc.ensure_par_ids_loaded()
+        par_cache = get_paragraph_cache()
+        cached_blocks = set(doc.single_par_cache)
+        cached_blocks.update(
+            par_id
+            for par_id, t in zip(doc.par_ids, doc.par_hashes)
+            if t is not None and (doc.doc_id, par_id, t) in par_cache
+        )
+
+        blocks = read_all_blocks(
+            doc.doc_id,
+            version_path.as_posix(),
+            cached_blocks,
+            get_files_path().as_posix(),
+        )
         for block_json in blocks:
             par_id = block_json["id"]
-            if p := self.doc.single_par_cache.get(par_id):
+            if p := doc.single_par_cache.get(par_id):
                 yield p
                 continue
 
-            p = DocParagraph.from_dict(self.doc, block_json)
-            self.doc.single_par_cache[p.get_id()] = p
+            t = block_json["t"]
+            if par_id in cached_blocks:
+                p = DocParagraph.get(doc, par_id, t)
+            elif t == "current":
+                # A legacy line without a hash; resolve the hash so that only real hashes end up in the cache.
+                p = DocParagraph.get_latest(doc, par_id)
+            elif block_json["error"]:
+                # Let the Python reader retry the file and raise the usual error; the error stub is not cached.
+                p = DocParagraph.get(doc, par_id, t)
+            else:
+                # The size is only an estimate because the original JSON is not available.
+                par_cache.put(
+                    (doc.doc_id, par_id, t),
+                    copy_block(block_json),
+                    len(block_json["md"])
+                    + sum(len(h) for h in (block_json["h"] or {}).values()),
+                )
+                p = DocParagraph.from_dict(doc, block_json)
+            doc.single_par_cache[par_id] = p
             yield p
 
 
@@ -1406,8 +1472,7 @@ class DocParagraphIter:
     def __init__(self, doc: Document):
         self.doc = doc
         self.next_index = 0
-        name = doc.get_version_path(doc.get_version())
-        self.f = name.open("r") if name.is_file() else None
+        self.lines = iter(doc.get_version_store().read_lines(doc.get_version()))
 
     def __enter__(self):
         return self
@@ -1419,31 +1484,27 @@ class DocParagraphIter:
         return self
 
     def __next__(self) -> DocParagraph:
-        if not self.f:
+        if not self.lines:
             raise StopIteration
-        while True:
-            line = self.f.readline()
-            if not line:
-                self.close()
-                raise StopIteration
-            if line != "\n":
-                if len(line) > 14:
-                    # Line contains both par_id and t
-                    par_id, t = line.rstrip("\n").split("/")
-                    cached = self.doc.single_par_cache.get(par_id)
-                    if cached:
-                        return cached
-                    fetched = DocParagraph.get(self.doc, par_id, t)
-                    self.doc.single_par_cache[par_id] = fetched
-                    return fetched
-                else:
-                    # Line contains just par_id, use the latest t
-                    return DocParagraph.get_latest(self.doc, line.rstrip("\n"))
+        line = next(self.lines, None)
+        if line is None:
+            self.close()
+            raise StopIteration
+        if len(line) > 13:
+            # Line contains both par_id and t
+            par_id, t = line.split("/")
+            cached = self.doc.single_par_cache.get(par_id)
+            if cached:
+                return cached
+            fetched = DocParagraph.get(self.doc, par_id, t)
+            self.doc.single_par_cache[par_id] = fetched
+            return fetched
+        else:
+            # Line contains just par_id, use the latest t
+            return DocParagraph.get_latest(self.doc, line)
 
     def close(self):
-        if self.f:
-            self.f.close()
-            self.f = None
+        self.lines = None
 
 
 def get_index_from_html_list(html_table) -> list[tuple]:
@@ -0,0 +1,42 @@
+"""Process-wide cache of parsed paragraph files.
+
+A paragraph file ``pars/<doc_id>/<par_id>/<hash>`` always has the same markdown and attributes because the hash
+is computed from them, so the parsed file can be shared between requests handled by the same worker.
+The only part that can change is the HTML cache, which is updated in this cache whenever the file is written.
+"""
+
+from copy import copy
+
+from flask import current_app, has_app_context
+
+from tim_common.collections import SizedLRUCache
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+ParCacheKey = tuple[int, str, str]
+
+_paragraph_cache: SizedLRUCache[dict] | None = None
+
+
+def get_paragraph_cache() -> SizedLRUCache[dict]:
+    global _paragraph_cache
+    if _paragraph_cache is None:
+        max_bytes = (
+            current_app.config["PARAGRAPH_CACHE_MAX_BYTES"]
+            if has_app_context()
+            else DEFAULT_MAX_BYTES
+        )
+        _paragraph_cache = SizedLRUCache(max_bytes)
+    return _paragraph_cache
+
+
+def copy_block(d: dict) -> dict:
+    """Copies a parsed paragraph so that the copy can be modified without affecting the cached one."""
+    result = d.copy()
+    attrs = d.get("attrs")
+    if attrs is not None:
+        result["attrs"] = {k: copy(v) for k, v in attrs.items()}
+    h = d.get("h")
+    if isinstance(h, dict):
+        result["h"] = h.copy()
+    return result
@@ -0,0 +1,287 @@
+"""Delta-encoded storage for document paragraph lists.
+
+Each document version is a file ``docs/<doc_id>/<major>/<minor>``. A version file is either
+
+* a full snapshot, i.e. one ``par_id/hash`` line per paragraph (this is also the legacy format), or
+* a delta that starts with a header line ``#delta <base_major> <base_minor> <chain_length>`` followed by
+  operations that transform the base version into this version.
+
+Delta operations are applied in order and the indices refer to the list as it is after the previous operations:
+
+* ``+ <index> <line>`` inserts a line,
+* ``- <index>`` deletes a line,
+* ``= <index> <line>`` replaces a line.
+
+A full snapshot is written instead of a delta when the delta chain would grow longer than the snapshot interval.
+The latest version is materialized under ``docs/<doc_id>/full`` when it is rebuilt so that readers that need a
+real file (such as the native paragraph reader) can read it directly. Older versions are only rebuilt in memory.
+"""
+
+import os
+from difflib import SequenceMatcher
+from pathlib import Path
+from typing import Iterable
+
+from filelock import FileLock
+
+from timApp.document.version import Version
+
+DELTA_HEADER = "#delta"
+
+# Maximum number of consecutive delta files before a full snapshot is written.
+SNAPSHOT_INTERVAL = 50
+
+DeltaOp = tuple[str, int, str | None]
+
+
+def apply_delta(lines: list[str], ops: Iterable[DeltaOp]) -> list[str]:
+    """Applies delta operations to a paragraph list in place.
+
+    :param lines: The paragraph list lines.
+    :param ops: The operations to apply.
+    :return: The same list.
+    """
+    for op, index, line in ops:
+        if op == "+":
+            lines.insert(index, line)
+        elif op == "-":
+            del lines[index]
+        elif op == "=":
+            lines[index] = line
+        else:
+            raise ValueError(f"Unknown delta operation: {op}")
+    return lines
+
+
+class VersionStore:
+    def __init__(self, doc_dir: Path, doc_id: int):
+        self.doc_dir = doc_dir
+        self.doc_id = doc_id
+
+    def get_version_file(self, ver: Version) -> Path:
+        return self.doc_dir / str(ver[0]) / str(ver[1])
+
+    def get_materialized_dir(self) -> Path:
+        return self.doc_dir / "full"
+
+    def get_materialized_file(self, ver: Version) -> Path:
+        return self.get_materialized_dir() / str(ver[0]) / str(ver[1])
+
+    def get_lock(self) -> FileLock:
+        """Returns the write lock of the document."""
+        return FileLock(f"/tmp/doc_{self.doc_id}_lock")
+
+    def is_delta(self, ver: Version) -> bool:
+        return self._read_header(self.get_version_file(ver)) is not None
+
+    def get_full_path(self, ver: Version) -> Path:
+        """Returns a path to a full paragraph list of the latest version, rebuilding it if needed.
+
+        Only one version is kept materialized at a time, so older versions should be read with read_lines instead.
+        Must not be called while holding the document lock.
+
+        :param ver: The latest version.
+        :return: Path to either the snapshot file or the materialized version.
+        """
+        path = self.get_version_file(ver)
+        if not path.is_file() or self._read_header(path) is None:
+            return path
+        materialized = self.get_materialized_file(ver)
+        if not materialized.is_file():
+            self._write_lines(materialized, self.read_lines(ver))
+            with self.get_lock():
+                self._remove_materialized(keep=ver)
+        return materialized
+
+    def read_lines(self, ver: Version) -> list[str]:
+        """Reads the paragraph list lines of the given version.
+
+        :param ver: The version.
+        :return: The lines without line terminators. Empty lines are skipped.
+        """
+        deltas: list[list[DeltaOp]] = []
+        current = ver
+        while True:
+            try:
+                # The materialized file may be removed at any time by a writer.
+                lines = self._read_plain(self.get_materialized_file(current))
+                break
+            except FileNotFoundError:
+                pass
+            path = self.get_version_file(current)
+            if not path.is_file():
+                lines = []
+                break
+            with path.open("r", encoding="utf-8") as f:
+                header = self._parse_header(f.readline())
+                if header is None:
+                    f.seek(0)
+                    lines = [l.rstrip("\n") for l in f if l != "\n"]
+                    break
+                deltas.append([self._parse_op(l) for l in f if l != "\n"])
+            current, _ = header
+        for ops in reversed(deltas):
+            apply_delta(lines, ops)
+        return lines
+
+    def write_version(
+        self,
+        ver: Version,
+        base_ver: Version | None,
+        base_lines: list[str],
+        ops: list[DeltaOp],
+    ) -> list[str]:
+        """Writes a new version.
+
+        Must be called while holding the document lock, and the operations must have been computed from the
+        latest version while holding it.
+
+        :param ver: The new version.
+        :param base_ver: The latest version that the operations are relative to, or None if there is none.
+        :param base_lines: The lines of the base version. The list is modified in place.
+        :param ops: The operations that transform the base version into the new version.
+        :return: The lines of the new version.
+        """
+        path = self.get_version_file(ver)
+        if path.exists():
+            raise ValueError(f"Version {ver} of document {self.doc_id} already exists")
+        chain_length = 0
+        if base_ver is not None:
+            if ver not in ((base_ver[0], base_ver[1] + 1), (base_ver[0] + 1, 0)):
+                raise ValueError(f"Version {ver} does not follow the base {base_ver}")
+            header = self._read_header(self.get_version_file(base_ver))
+            chain_length = header[1] + 1 if header else 1
+        new_lines = apply_delta(base_lines, ops)
+        if base_ver is None or chain_length >= SNAPSHOT_INTERVAL:
+            self._write_lines(path, new_lines)
+        else:
+            self._write_delta(path, base_ver, chain_length, ops)
+        # The previously materialized version is no longer the latest one.
+        self._remove_materialized()
+        return new_lines
+
+    def compact(self, keep_materialized: Version | None = None) -> tuple[int, int]:
+        """Converts full copies into deltas and removes materialized versions.
+
+        Every SNAPSHOT_INTERVAL-th version is kept as a full snapshot.
+
+        :param keep_materialized: A version whose materialized file is kept, typically the latest one.
+        :return: The number of versions converted to deltas and the number of bytes saved.
+        """
+        with self.get_lock():
+            return self._compact(keep_materialized)
+
+    def _compact(self, keep_materialized: Version | None) -> tuple[int, int]:
+        versions = self.list_versions()
+        converted = 0
+        saved = 0
+        prev: Version | None = None
+        prev_lines: list[str] = []
+        chain_length = 0
+        for ver in versions:
+            path = self.get_version_file(ver)
+            lines = self.read_lines(ver)
+            header = self._read_header(path)
+            if header is not None:
+                chain_length = header[1]
+            elif prev is None or chain_length + 1 >= SNAPSHOT_INTERVAL:
+                chain_length = 0
+            else:
+                ops = self._compute_ops(prev_lines, lines)
+                old_size = path.stat().st_size
+                chain_length += 1
+                self._write_delta(path, prev, chain_length, ops)
+                saved += old_size - path.stat().st_size
+                converted += 1
+            prev = ver
+            prev_lines = lines
+        self._remove_materialized(keep=keep_materialized)
+        return converted, saved
+
+    def list_versions(self) -> list[Version]:
+        versions = []
+        if not self.doc_dir.exists():
+            return versions
+        for major_dir in self.doc_dir.iterdir():
+            if not major_dir.is_dir() or not major_dir.name.isdigit():
+                continue
+            for f in major_dir.iterdir():
+                if f.name.isdigit():
+                    versions.append((int(major_dir.name), int(f.name)))
+        versions.sort()
+        return versions
+
+    def _remove_materialized(self, keep: Version | None = None) -> None:
+        mdir = self.get_materialized_dir()
+        if not mdir.exists():
+            return
+        for major_dir in mdir.iterdir():
+            for f in major_dir.iterdir():
+                if not f.name.isdigit():
+                    continue
+                if (int(major_dir.name), int(f.name)) != keep:
+                    f.unlink(missing_ok=True)
+
+    @staticmethod
+    def _compute_ops(old: list[str], new: list[str]) -> list[DeltaOp]:
+        ops: list[DeltaOp] = []
+        offset = 0
+        for tag, i1, i2, j1, j2 in SequenceMatcher(
+            None, old, new, autojunk=False
+        ).get_opcodes():
+            if tag == "equal":
+                continue
+            common = min(i2 - i1, j2 - j1) if tag == "replace" else 0
+            for k in range(common):
+                ops.append(("=", i1 + offset + k, new[j1 + k]))
+            for k in range(i2 - i1 - common):
+                ops.append(("-", i1 + offset + common, None))
+            for k in range(common, j2 - j1):
+                ops.append(("+", i1 + offset + k, new[j1 + k]))
+            offset += (j2 - j1) - (i2 - i1)
+        return ops
+
+    @staticmethod
+    def _parse_header(line: str) -> tuple[Version, int] | None:
+        if not line.startswith(DELTA_HEADER):
+            return None
+        _, major, minor, chain_length = line.split()
+        return (int(major), int(minor)), int(chain_length)
+
+    def _read_header(self, path: Path) -> tuple[Version, int] | None:
+        try:
+            with path.open("r", encoding="utf-8") as f:
+                return self._parse_header(f.readline())
+        except FileNotFoundError:
+            return None
+
+    @staticmethod
+    def _parse_op(line: str) -> DeltaOp:
+        parts = line.rstrip("\n").split(" ", 2)
+        return parts[0], int(parts[1]), parts[2] if len(parts) > 2 else None
+
+    @staticmethod
+    def _read_plain(path: Path) -> list[str]:
+        with path.open("r", encoding="utf-8") as f:
+            return [l.rstrip("\n") for l in f if l != "\n"]
+
+    @staticmethod
+    def _write_atomic(path: Path, content: str) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{path.name}.tmp{os.getpid()}")
+        with tmp_path.open("w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+    def _write_lines(self, path: Path, lines: list[str]) -> None:
+        self._write_atomic(path, "".join(l + "\n" for l in lines))
+
+    def _write_delta(
+        self, path: Path, base_ver: Version, chain_length: int, ops: list[DeltaOp]
+    ) -> None:
+        content = [f"{DELTA_HEADER} {base_ver[0]} {base_ver[1]} {chain_length}\n"]
+        for op, index, line in ops:
+            content.append(
+                f"{op} {index}\n" if line is None else f"{op} {index} {line}\n"
+            )
+        self._write_atomic(path, "".join(content))
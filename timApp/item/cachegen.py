@@ -0,0 +1,327 @@
+"""Pre-generation of the document view cache for many users at once (see the gen_cache route).
+
+Users whose rendered document would be identical share one render. Two users are considered equivalent if
+
+* the document does not contain anything that depends on the user directly (user macros, rndmacros,
+  fieldmacros, paragraphs with random values or peer review),
+* neither of them has answers, read marks or own comments in the document and
+* they have the same rights to the document, the same groups and the same preferences.
+
+The shared render is verified before copying it to the other users: if it mentions the rendering user
+(e.g. a plugin that shows the username), the rest of the users are rendered one by one.
+
+The renders are done in Celery workers (or in the request process if GEN_CACHE_CELERY is disabled).
+Every finished render is written to the cache immediately, so an interrupted generation can be resumed by
+running it again; already cached users are skipped unless forced.
+"""
+import dataclasses
+import hashlib
+import html
+import json
+import re
+import time
+from collections import deque
+from typing import Generator, Iterable
+
+from flask import current_app
+from sqlalchemy import select, or_
+from sqlalchemy.orm import selectinload
+
+from timApp.answer.answer_models import UserTaskTally
+from timApp.auth.get_user_rights_for_item import get_user_rights_for_item
+from timApp.document.caching import check_doc_cache, set_doc_cache
+from timApp.document.docentry import DocEntry
+from timApp.document.docinfo import DocInfo
+from timApp.document.docrenderresult import DocRenderResult
+from timApp.document.document import Document, dereference_pars
+from timApp.document.docviewparams import DocViewParams
+from timApp.document.viewcontext import default_view_ctx
+from timApp.note.usernote import UserNote
+from timApp.readmark.readparagraph import ReadParagraph
+from timApp.timdb.sqa import run_sql
+from timApp.user.user import User
+
+USER_MACRO_RE = re.compile(
+    r"\b(userid|username|realname|useremail|loggedUsername|userfolder)\b"
+)
+
+# How often the progress of the Celery jobs is checked, in seconds.
+JOB_POLL_INTERVAL = 0.5
+
+STATUS_ALREADY_CACHED = "already cached"
+STATUS_OK = "ok"
+STATUS_SHARED = "ok (shared)"
+STATUS_NOT_ALLOWED = "not allowed to cache (one or more plugins had errors)"
+
+CacheJobResult = tuple[list[tuple[int, str]], list[int]]
+"""Statuses of the handled users as (user id, status) pairs and the users whose render could not be shared."""
+
+
+@dataclasses.dataclass
+class CacheJob:
+    user_ids: list[int]
+    verify_share: bool
+    """Whether the shared render must be checked for user-specific content before copying it to the others."""
+
+
+def get_share_blockers(doc_info: DocInfo) -> list[str]:
+    """Returns the reasons why the users of the document cannot share renders.
+
+    :param doc_info: The document.
+    :return: The reasons, or an empty list if sharing is possible.
+    """
+    blockers = []
+    settings = doc_info.document.get_settings()
+    if settings.rndmacros():
+        blockers.append("rndmacros")
+    if settings.fieldmacros():
+        blockers.append("fieldmacros")
+    if settings.peer_review():
+        blockers.append("peer_review")
+    doc = Document(doc_info.id)
+    pars = dereference_pars(
+        doc.get_paragraphs(include_preamble=True),
+        context_doc=doc,
+        view_ctx=default_view_ctx,
+    )
+    for p in pars:
+        if p.get_attr("rnd") is not None:
+            blockers.append(f"random values in paragraph {p.get_id()}")
+            break
+    for p in pars:
+        if USER_MACRO_RE.search(p.get_markdown()):
+            blockers.append(f"user macros in paragraph {p.get_id()}")
+            break
+    return blockers
+
+
+def get_personalized_user_ids(doc_info: DocInfo, users: list[User]) -> set[int]:
+    """Returns the ids of the users that have answers, read marks or own comments in the document."""
+    if not users:
+        return set()
+    doc_ids = {doc_info.id, doc_info.src_docid}
+    user_ids = [u.id for u in users]
+    group_to_user = {u.get_personal_group().id: u.id for u in users}
+    personalized = set(
+        run_sql(
+            select(UserTaskTally.user_id)
+            .filter(
+                UserTaskTally.user_id.in_(user_ids)
+                & or_(*(UserTaskTally.task_id.startswith(f"{d}.") for d in doc_ids))
+            )
+            .distinct()
+        ).scalars()
+    )
+    for model in (ReadParagraph, UserNote):
+        personalized.update(
+            group_to_user[gid]
+            for gid in run_sql(
+                select(model.usergroup_id)
+                .filter(
+                    model.usergroup_id.in_(group_to_user.keys())
+                    & model.doc_id.in_(doc_ids)
+                )
+                .distinct()
+            ).scalars()
+        )
+    return personalized
+
+
+def get_render_key(doc_info: DocInfo, u: User) -> str:
+    """Returns a key that is the same for users whose non-personalized render of the document is identical."""
+    personal_group = u.get_personal_group()
+    h = hashlib.shake_256()
+    h.update(
+        json.dumps(
+            [
+                get_user_rights_for_item(doc_info, u, allow_duration=True),
+                sorted(g.id for g in u.groups if g != personal_group),
+                u.prefs or "",
+            ],
+            sort_keys=True,
+        ).encode()
+    )
+    return h.hexdigest(10)
+
+
+def plan_cache_jobs(
+    doc_info: DocInfo, users: list[User], same_for_all: bool
+) -> list[CacheJob]:
+    """Splits the users into render jobs so that equivalent users share one render.
+
+    :param doc_info: The document.
+    :param users: The users whose cache needs to be generated.
+    :param same_for_all: Whether all users should share one render without any checks.
+    :return: The jobs in the order of their first user.
+    """
+    if not users:
+        return []
+    if same_for_all:
+        return [CacheJob([u.id for u in users], verify_share=False)]
+    if get_share_blockers(doc_info):
+        return [CacheJob([u.id], verify_share=True) for u in users]
+    # Load the groups of all users at once for the render keys.
+    run_sql(
+        select(User)
+        .options(selectinload(User.groups))
+        .filter(User.id.in_([u.id for u in users]))
+    ).scalars().all()
+    personalized = get_personalized_user_ids(doc_info, users)
+    jobs: list[CacheJob] = []
+    shared_jobs: dict[str, CacheJob] = {}
+    for u in users:
+        if u.id in personalized:
+            jobs.append(CacheJob([u.id], verify_share=True))
+            continue
+        key = get_render_key(doc_info, u)
+        job = shared_jobs.get(key)
+        if job:
+            job.user_ids.append(u.id)
+        else:
+            job = shared_jobs[key] = CacheJob([u.id], verify_share=True)
+            jobs.append(job)
+    return jobs
+
+
+def render_mentions_user(dr: DocRenderResult, u: User) -> bool:
+    """Checks whether the rendered document contains the name or email of the user."""
+    for token in {u.name, u.real_name, u.email}:
+        if not token:
+            continue
+        for t in {token, html.escape(token)}:
+            if t in dr.head_html or t in dr.content_html:
+                return True
+    return False
+
+
+def render_cache_job(
+    doc_id: int, user_ids: list[int], force: bool, verify_share: bool
+) -> CacheJobResult:
+    """Renders the document for the users of one job and writes the results to the cache.
+
+    Must be called in a request context.
+
+    :param doc_id: The document id.
+    :param user_ids: The users. They share one render.
+    :param force: Whether to render even if the cache seems up-to-date.
+    :param verify_share: Whether to check the first render for user-specific content before sharing it.
+    :return: The result of the job.
+    """
+    from timApp.item.routes import render_doc_view
+
+    doc_info = DocEntry.find_by_id(doc_id)
+    # Make sure tags attribute is always loaded.
+    # Otherwise the "translations" variable (in doc_head.jinja2) will first not have "tags" and
+    # after encountering someone with manage access, it is loaded and all subsequent users will get it too.
+    _ = doc_info.block.tags
+    users_by_id = {
+        u.id: u for u in run_sql(select(User).filter(User.id.in_(user_ids))).scalars()
+    }
+    m = DocViewParams()
+    view_ctx_cached = dataclasses.replace(default_view_ctx, for_cache=True)
+    statuses: list[tuple[int, str]] = []
+    shared: DocRenderResult | None = None
+    for i, uid in enumerate(user_ids):
+        u = users_by_id[uid]
+        cr = check_doc_cache(doc_info, u, default_view_ctx, m, False)
+        if cr.doc and not force:
+            statuses.append((uid, STATUS_ALREADY_CACHED))
+            continue
+        if shared is not None:
+            set_doc_cache(cr.key, shared)
+            statuses.append((uid, STATUS_SHARED))
+            continue
+        dr = render_doc_view(doc_info, m, view_ctx_cached, u, False)
+        if not dr.allowed_to_cache:
+            statuses.append((uid, STATUS_NOT_ALLOWED))
+            continue
+        set_doc_cache(cr.key, dr)
+        statuses.append((uid, STATUS_OK))
+        if verify_share and render_mentions_user(dr, u):
+            return statuses, user_ids[i + 1 :]
+        shared = dr
+    return statuses, []
+
+
+def generate_doc_cache(
+    doc_info: DocInfo,
+    users: list[User],
+    requester: User,
+    force: bool,
+    same_for_all: bool,
+) -> Generator[tuple[User, str], None, None]:
+    """Generates the document cache for the given users.
+
+    :param doc_info: The document.
+    :param users: The users.
+    :param requester: The user who requested the generation. The renders are done on their behalf.
+    :param force: Whether to render even if the cache seems up-to-date.
+    :param same_for_all: Whether all users should share one render without any checks.
+    :return: The users and their statuses in the order they are finished.
+    """
+    m = DocViewParams()
+    to_render = []
+    for u in users:
+        cr = check_doc_cache(doc_info, u, default_view_ctx, m, False)
+        if cr.doc and not force:
+            yield u, STATUS_ALREADY_CACHED
+        else:
+            to_render.append(u)
+    users_by_id = {u.id: u for u in users}
+    jobs = plan_cache_jobs(doc_info, to_render, same_for_all)
+    if current_app.config["GEN_CACHE_CELERY"]:
+        results = run_jobs_in_celery(doc_info.id, jobs, requester, force)
+    else:
+        results = run_jobs_locally(doc_info.id, jobs, force)
+    for uid, status in results:
+        yield users_by_id[uid], status
+
+
+def run_jobs_locally(
+    doc_id: int, jobs: Iterable[CacheJob], force: bool
+) -> Generator[tuple[int, str], None, None]:
+    queue = deque(jobs)
+    while queue:
+        job = queue.popleft()
+        statuses, unshared = render_cache_job(
+            doc_id, job.user_ids, force, job.verify_share
+        )
+        yield from statuses
+        queue.extend(CacheJob([uid], verify_share=False) for uid in unshared)
+
+
+def run_jobs_in_celery(
+    doc_id: int, jobs: Iterable[CacheJob], requester: User, force: bool
+) -> Generator[tuple[int, str], None, None]:
+    from timApp.tim_celery import render_doc_cache
+
+    def submit(job: CacheJob):
+        return job, render_doc_cache.delay(
+            doc_id, job.user_ids, requester.id, force, job.verify_share
+        )
+
+    pending = [submit(job) for job in jobs]
+    deadline = time.monotonic() + current_app.config["GEN_CACHE_TIMEOUT"]
+    while pending:
+        still_pending = []
+        for job, result in pending:
+            if not result.ready():
+                still_pending.append((job, result))
+                continue
+            try:
+                statuses, unshared = result.get()
+            except Exception as e:
+                yield from ((uid, f"failed ({e})") for uid in job.user_ids)
+                continue
+            yield from ((uid, status) for uid, status in statuses)
+            still_pending.extend(
+                submit(CacheJob([uid], verify_share=False)) for uid in unshared
+            )
+        pending = still_pending
+        if pending and time.monotonic() > deadline:
+            for job, result in pending:
+                result.revoke()
+                yield from ((uid, "timed out") for uid in job.user_ids)
+            return
+        if pending:
+            time.sleep(JOB_POLL_INTERVAL)
@@ -1,4 +1,5 @@
-import itertools
+import json
+import os
 from collections import defaultdict
 from concurrent.futures import Future
 from dataclasses import dataclass, replace, field, fields, Field
@@ -257,14 +258,7 @@ class RightLog:
     def get_group_emails(self, r: GroupOp) -> list[Email]:
         emails = self.group_cache.get(r.group)
         if not emails:
-            emails = [
-                e
-                for e in run_sql(
-                    select(User.email)
-                    .join(User, UserGroup.users)
-                    .filter(UserGroup.name == r.group)
-                ).scalars()
-            ]
+            emails = get_group_member_emails(r.group)
         if not emails:
             if not UserGroup.get_by_name(r.group):
                 raise Exception(f"Usergroup {r.group} not found")
@@ -283,6 +277,16 @@ class RightLog:
             return None
 
 
+def get_group_member_emails(group: str) -> list[Email]:
+    return list(
+        run_sql(
+            select(User.email)
+            .join(User, UserGroup.users)
+            .filter(UserGroup.name == group)
+        ).scalars()
+    )
+
+
 def change_time(right: Right, op: ChangeTimeOp | ChangeTimeGroupOp) -> None:
     if right.accessible_to:
         right.accessible_to += timedelta(seconds=op.secs)
@@ -314,19 +318,208 @@ def confirm_group(right: Right, op: ConfirmGroupOp) -> None:
     do_confirm(right, op.timestamp)
 
 
-def get_current_rights(target: str) -> tuple[RightLog, Path]:
+# Number of bytes before the snapshot offset that are stored in the snapshot.
+# They are compared with the log to detect a log that has been rewritten.
+SNAPSHOT_TAIL_BYTES = 64
+
+# Number of latest history entries per user that are kept in a snapshot. RightLog.add_op only looks at these.
+SNAPSHOT_HISTORY_LENGTH = 2
+
+
+@dataclass
+class RightLogState:
+    """Folded rights of a target and the position in the rights log up to which the ops have been applied."""
+
+    rights: RightLog
+    initial_stamp: tuple[int, int]
+    """Size and modification time of the initial rights file."""
+    log_offset: int = 0
+    log_tail: bytes = b""
+    ops_since_snapshot: int = 0
+
+
+# The latest state of each target in this process. Only valid while it matches the files, see is_state_valid.
+right_log_states: dict[str, RightLogState] = {}
+
+
+def get_right_paths(target: str) -> tuple[Path, Path, Path]:
     fp = Path(app.config["FILES_PATH"])
-    initial_rights, lines = read_rights(fp / f"{target}.rights.initial", 1)
-    rights_log_path = fp / f"{target}.rights.log"
+    return (
+        fp / f"{target}.rights.initial",
+        fp / f"{target}.rights.log",
+        fp / f"{target}.rights.snapshot",
+    )
+
+
+def get_current_rights(target: str) -> tuple[RightLog, Path]:
+    """Returns the current rights of the target.
+
+    The rights are read from the latest state in this process or from the snapshot file if they are still valid,
+    and only the rest of the log is replayed. Otherwise, all ops in the initial file and the log are replayed.
+    """
+    state = load_right_log_state(target)
+    right_log_states[target] = state
+    return state.rights, get_right_paths(target)[1]
+
+
+def load_right_log_state(target: str) -> RightLogState:
+    """Returns the up-to-date state of the target and removes it from the process cache.
+
+    The caller may modify the state and must put it back to right_log_states only if it still matches the log.
+    """
+    initial_path, rights_log_path, snapshot_path = get_right_paths(target)
+    st = initial_path.stat()
+    stamp = (st.st_size, st.st_mtime_ns)
+    state = right_log_states.pop(target, None)
+    if not state or not is_state_valid(state, stamp, rights_log_path):
+        state = read_snapshot(snapshot_path, stamp, rights_log_path)
+    if not state:
+        initial_rights, lines = read_rights(initial_path, 1)
+        state = RightLogState(RightLog(RightSchema.load(lines[0])), stamp)
+        for r in initial_rights:
+            state.rights.add_op(r)
+    replay_log_tail(state, rights_log_path)
+    if state.ops_since_snapshot >= app.config["DIST_RIGHTS_SNAPSHOT_INTERVAL"]:
+        write_snapshot(state, snapshot_path)
+    return state
+
+
+def is_state_valid(
+    state: RightLogState, initial_stamp: tuple[int, int], rights_log_path: Path
+) -> bool:
+    if state.initial_stamp != initial_stamp:
+        return False
+    try:
+        with rights_log_path.open("rb") as f:
+            start = max(state.log_offset - SNAPSHOT_TAIL_BYTES, 0)
+            f.seek(start)
+            if f.read(state.log_offset - start) != state.log_tail:
+                return False
+    except FileNotFoundError:
+        if state.log_offset:
+            return False
+    # Group ops were applied to the members of the groups at the time of replay,
+    # so the state is only valid as long as the memberships stay the same.
+    group_cache = state.rights.group_cache
+    if group_cache:
+        members: DefaultDict[str, list[Email]] = defaultdict(list)
+        for group, email in run_sql(
+            select(UserGroup.name, User.email)
+            .join(User, UserGroup.users)
+            .filter(UserGroup.name.in_(group_cache.keys()))
+        ):
+            members[group].append(email)
+        for group, emails in group_cache.items():
+            if sorted(emails) != sorted(members[group]):
+                return False
+    return True
+
+
+def replay_log_tail(state: RightLogState, rights_log_path: Path) -> None:
+    try:
+        with rights_log_path.open("rb") as f:
+            f.seek(state.log_offset)
+            data = f.read()
+    except FileNotFoundError:
+        return
+    # An op that is being written may not have been completed yet.
+    end = data.rfind(b"\n") + 1
+    for line in data[:end].splitlines():
+        if line.strip():
+            state.rights.add_op(_deserialize_right(json.loads(line)))
+            state.ops_since_snapshot += 1
+    update_log_position(state, rights_log_path, state.log_offset + end)
+
+
+def update_log_position(
+    state: RightLogState, rights_log_path: Path, offset: int
+) -> None:
+    if offset == state.log_offset:
+        return
+    with rights_log_path.open("rb") as f:
+        start = max(offset - SNAPSHOT_TAIL_BYTES, 0)
+        f.seek(start)
+        state.log_tail = f.read(offset - start)
+    state.log_offset = offset
+
+
+def read_snapshot(
+    snapshot_path: Path, initial_stamp: tuple[int, int], rights_log_path: Path
+) -> RightLogState | None:
     try:
-        logged_rights, _ = read_rights(rights_log_path, 0)
+        with snapshot_path.open() as f:
+            data = json.load(f)
+        rights = RightLog(RightSchema.load(data["initial_right"]), data["groups"])
+        for email, entries in data["history"].items():
+            rights.op_history[email] = [
+                RightLogEntry(_deserialize_right(e["op"]), RightSchema.load(e["right"]))
+                for e in entries
+            ]
+        state = RightLogState(
+            rights,
+            tuple(data["initial_stamp"]),
+            data["log_offset"],
+            bytes.fromhex(data["log_tail"]),
+        )
     except FileNotFoundError:
-        logged_rights = []
-    initial_right: Right = RightSchema.load(lines[0])
-    rights = RightLog(initial_right)
-    for r in itertools.chain(initial_rights, logged_rights):
-        rights.add_op(r)
-    return rights, rights_log_path
+        return None
+    except Exception as e:
+        log_warning(f"Ignoring invalid rights snapshot {snapshot_path}: {e}")
+        return None
+    if not is_state_valid(state, initial_stamp, rights_log_path):
+        return None
+    return state
+
+
+def write_snapshot(state: RightLogState, snapshot_path: Path) -> None:
+    rights = state.rights
+    content = to_json_str(
+        {
+            "initial_stamp": state.initial_stamp,
+            "log_offset": state.log_offset,
+            "log_tail": state.log_tail.hex(),
+            "initial_right": rights.initial_right,
+            "groups": rights.group_cache,
+            "history": {
+                email: [
+                    {"op": e.op, "right": e.right}
+                    for e in entries[-SNAPSHOT_HISTORY_LENGTH:]
+                ]
+                for email, entries in rights.op_history.items()
+                if entries
+            },
+        }
+    )
+    tmp_path = snapshot_path.with_name(f".{snapshot_path.name}.tmp{os.getpid()}")
+    with tmp_path.open("w") as f:
+        f.write(content)
+    os.replace(tmp_path, snapshot_path)
+    state.ops_since_snapshot = 0
+
+
+def append_right_op(target: str, state: RightLogState, op: RightOp) -> bool:
+    """Appends an op to the rights log of the target.
+
+    The op must have already been applied to the state.
+
+    :return: True if the state still matches the log, i.e. nobody else has written to the log in the meantime.
+    """
+    rights_log_path = get_right_paths(target)[1]
+    line = (to_json_str(op) + "\n").encode()
+    # A single write to a file opened in append mode cannot be interleaved with the writes of other processes.
+    fd = os.open(rights_log_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        written = os.write(fd, line)
+        if written != len(line):
+            raise OSError(f"Partial write to {rights_log_path}")
+        size = os.fstat(fd).st_size
+    finally:
+        os.close(fd)
+    if size != state.log_offset + len(line):
+        return False
+    state.ops_since_snapshot += 1
+    update_log_position(state, rights_log_path, size)
+    return True
 
 
 def read_rights(path: Path, index: int) -> tuple[list[RightOp], list[dict]]:
@@ -335,7 +528,9 @@ def read_rights(path: Path, index: int) -> tuple[list[RightOp], list[dict]]:
 
 
 def do_register_right(op: RightOp, target: str) -> tuple[RightLog | None, str | None]:
-    rights, right_log_path = get_current_rights(target)
+    state = load_right_log_state(target)
+    rights = state.rights
+    err = None
     if not isinstance(op, GroupOps):
         latest_op = rights.latest_op(op.email)
         if (
@@ -343,14 +538,17 @@ def do_register_right(op: RightOp, target: str) -> tuple[RightLog | None, str |
             and isinstance(latest_op.op, QuitOp)
             and not isinstance(op, UndoQuitOp)
         ):
-            return None, f"{target}: Cannot register a non-UndoQuitOp after QuitOp"
-        if isinstance(op, UndoQuitOp) and (
+            err = f"{target}: Cannot register a non-UndoQuitOp after QuitOp"
+        elif isinstance(op, UndoQuitOp) and (
             not latest_op or not isinstance(latest_op.op, QuitOp)
         ):
-            return None, f"{target}: There is no QuitOp to undo"
+            err = f"{target}: There is no QuitOp to undo"
+    if err:
+        right_log_states[target] = state
+        return None, err
     rights.add_op(op)
-    with right_log_path.open("a") as f:
-        f.write(to_json_str(op) + "\n")
+    if append_right_op(target, state, op):
+        right_log_states[target] = state
     return rights, None
 
 
@@ -80,6 +80,7 @@ from timApp.util.flask.responsehelper import (
     get_grid_modules,
     safe_redirect,
 )
+from timApp.util.flask.searchindex import update_search_index
 from timApp.util.flask.typedblueprint import TypedBlueprint
 from timApp.util.logger import log_info
 from timApp.util.utils import (
@@ -874,6 +875,7 @@ def change_alias(alias: str, new_name: str, public: bool = True) -> Response:
             "This is the only visible name for this document, so you cannot make it invisible."
         )
     db.session.commit()
+    update_search_index([doc.id], content=False)
     return ok_response()
 
 
@@ -924,6 +926,9 @@ def rename_folder(item_id: int) -> Response:
 
     f.rename_path(new_name)
     db.session.commit()
+    update_search_index(
+        [d.id for d in f.get_all_documents(include_subdirs=True)], content=False
+    )
     return json_response({"new_name": new_name})
 
 
@@ -1015,6 +1020,7 @@ def del_document(doc_id: int) -> Response:
             delete_velp_group(vg)
 
     db.session.commit()
+    update_search_index([d.id], content=False)
     return ok_response()
 
 
@@ -1030,6 +1036,9 @@ def delete_folder(folder_id: int) -> Response:
     trash_path = find_free_name(trash, f)
     f.rename_path(trash_path)
     db.session.commit()
+    update_search_index(
+        [d.id for d in f.get_all_documents(include_subdirs=True)], content=False
+    )
     return ok_response()
 
 
@@ -1039,6 +1048,8 @@ def change_title(item_id: int, new_title: str) -> Response:
     verify_edit_access(item)
     item.title = new_title
     db.session.commit()
+    if isinstance(item, DocInfo):
+        update_search_index([item.id], content=False)
     return ok_response()
 
 
@@ -1,5 +1,4 @@
 """Routes for document view."""
-import dataclasses
 import html
 import time
 from difflib import context_diff
@@ -82,6 +81,7 @@ from timApp.document.viewparams import ViewParams, ViewParamsSchema
 from timApp.folder.folder import Folder
 from timApp.folder.folder_view import try_return_folder
 from timApp.item.block import BlockType, Block
+from timApp.item.cachegen import generate_doc_cache, STATUS_NOT_ALLOWED
 from timApp.item.blockrelevance import BlockRelevance
 from timApp.item.item import Item
 from timApp.item.manage import do_copy_folder, CopyOptions
@@ -358,6 +358,9 @@ def gen_cache(
     """Pre-generates document cache for the users with non-expired rights.
 
     Useful for exam documents to reduce server load at the beginning of the exam.
+    The renders are distributed to Celery workers and users with identical views share one render,
+    see timApp.item.cachegen. The output lists the users in the order they are finished.
+    Interrupted generation can be resumed by running it again.
 
     :param group: The usergroup for which to generate the cache. If omitted, the users are computed from the
       currently active (or upcoming) rights.
@@ -397,38 +400,24 @@ def gen_cache(
         user_set = {u for u, _ in users}
     for g in groups_that_need_access_check:
         verify_group_view_access(g)
-    view_ctx = default_view_ctx
-    m = DocViewParams()
-    vp = ViewParams()
     users_uniq = list(sorted(user_set, key=lambda u: u.name))
     total = len(users_uniq)
     digits = len(str(total))
-
-    # Make sure tags attribute is always loaded.
-    # Otherwise the "translations" variable (in doc_head.jinja2) will first not have "tags" and
-    # after encountering someone with manage access, it is loaded and all subsequent users will get it too.
-    # This wouldn't cause any user-facing bugs, but it makes it easier to compare cached HTMLs.
-    _ = doc_info.block.tags
+    requester = get_current_user_object()
 
     def generate() -> Generator[tuple[str, DocRenderResult | None], None, None]:
-        first_cache = None
-        for i, u in enumerate(users_uniq):
-            start = f"{i + 1:>{digits}}/{total} {u.name}: "
-            cr = check_doc_cache(doc_info, u, view_ctx, m, vp.nocache)
-            view_ctx_cached = dataclasses.replace(view_ctx, for_cache=True)
-            if cr.doc and not force:
-                yield f"{start}already cached\n", cr.doc
+        results = generate_doc_cache(
+            doc_info, users_uniq, requester, force, same_for_all
+        )
+        for i, (u, status) in enumerate(results):
+            line = f"{i + 1:>{digits}}/{total} {u.name}: {status}\n"
+            if status == STATUS_NOT_ALLOWED or not print_diffs:
+                yield line, None
             else:
-                if first_cache is None or not same_for_all:
-                    dr = render_doc_view(doc_info, m, view_ctx_cached, u, False)
-                    first_cache = dr
-                else:
-                    dr = first_cache
-                if dr.allowed_to_cache:
-                    set_doc_cache(cr.key, dr)
-                    yield f"{start}ok\n", dr
-                else:
-                    yield f"{start}not allowed to cache (one or more plugins had errors)\n", None
+                cr = check_doc_cache(
+                    doc_info, u, default_view_ctx, DocViewParams(), False
+                )
+                yield line, cr.doc
 
     def generate_with_lock():
         try:
@@ -508,7 +497,7 @@ def process_anonymous_access(doc_info: DocInfo, commit: bool = False) -> None:
 
 
 def view(item_path: str, route: ViewRoute, render_doc: bool = True) -> FlaskViewResult:
-    taketime("view begin", zero=True)
+    taketime("view begin")
     m: DocViewParams = ViewModelSchema.load(request.args, unknown=EXCLUDE)
     vp: ViewParams = ViewParamsSchema.load(request.args, unknown=EXCLUDE)
 
@@ -30,6 +30,7 @@ from timApp.util.flask.requesthelper import (
     NotExist,
 )
 from timApp.util.flask.responsehelper import ok_response, json_response
+from timApp.util.flask.searchindex import update_search_index
 from timApp.util.flask.typedblueprint import TypedBlueprint
 
 tags_blueprint = TypedBlueprint("tags", __name__, url_prefix="/tags")
@@ -61,15 +62,16 @@ def add_tag(doc: str, tags: list[TagInfo]) -> Response:
         raise NotExist()
     verify_manage_access(d)
     add_tags(d, tags)
-    return commit_and_ok()
+    return commit_and_ok(d)
 
 
-def commit_and_ok() -> Response:
+def commit_and_ok(d: DocInfo) -> Response:
     try:
         db.session.commit()
     except (IntegrityError, FlushError):
         db.session.rollback()
         raise RouteException("Tag name is already in use.")
+    update_search_index([d.id], content=False)
     return ok_response()
 
 
@@ -129,7 +131,7 @@ def set_group_tags(
         t = Tag(name=GROUP_TAG_PREFIX + g, type=TagType.Regular, expires=groups_expire)
         check_tag_access(t)
         d.block.tags.append(t)
-    return commit_and_ok()
+    return commit_and_ok(d)
 
 
 @tags_blueprint.post("/edit/<path:doc>")
@@ -169,6 +171,7 @@ def edit_tag(doc: str, old_tag: TagInfo, new_tag: TagInfo) -> Response:
         db.session.commit()
     except (IntegrityError, FlushError):
         raise RouteException("Tag editing failed! New tag name may already be in use")
+    update_search_index([d.id], content=False)
     return ok_response()
 
 
@@ -200,6 +203,7 @@ def remove_tag(doc: str, tag: TagInfo) -> Response:
         db.session.commit()
     except (IntegrityError, UnmappedInstanceError):
         raise RouteException("Tag removal failed.")
+    update_search_index([d.id], content=False)
     return ok_response()
 
 
@@ -0,0 +1,112 @@
+"""Lecture update notifications over Redis pub/sub.
+
+Routes that change what the lecture participants see (questions, points, messages, lecture end time) publish an
+event to the lecture's channel. Each process has one listener thread subscribed to all lecture channels; waiting
+requests block on a condition until their lecture's event counter changes instead of polling the database.
+
+If Redis is not reachable, waiting falls back to polling once a second.
+"""
+import os
+import threading
+import time
+from collections import defaultdict
+
+from timApp.util.logger import log_warning
+from timApp.util.redisclient import rclient
+
+LECTURE_CHANNEL_PREFIX = "tim-lecture-"
+
+# How often waiters re-check the database when the listener is not connected to Redis.
+FALLBACK_POLL_INTERVAL = 1
+
+# Delay before reconnecting after the listener has lost its Redis connection.
+RECONNECT_DELAY = 5
+
+
+def get_lecture_channel(lecture_id: int) -> str:
+    return f"{LECTURE_CHANNEL_PREFIX}{lecture_id}"
+
+
+def publish_lecture_event(lecture_id: int) -> None:
+    """Wakes up the requests waiting for updates in the given lecture.
+
+    Must be called after the changes have been committed so that the woken requests see them.
+
+    :param lecture_id: The lecture id.
+    """
+    try:
+        rclient.publish(get_lecture_channel(lecture_id), "")
+    except Exception as e:
+        log_warning(f"Could not publish lecture event: {e}")
+
+
+class LectureEventListener:
+    def __init__(self) -> None:
+        self.cond = threading.Condition()
+        self.sequences: dict[int, int] = defaultdict(int)
+        self.connected = False
+        self.pid: int | None = None
+
+    def _ensure_started(self) -> None:
+        # The listener thread does not survive forking, so it is started lazily in each worker.
+        with self.cond:
+            if self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            self.connected = False
+            self.sequences.clear()
+        threading.Thread(target=self._listen, daemon=True).start()
+
+    def _listen(self) -> None:
+        while True:
+            pubsub = rclient.pubsub(ignore_subscribe_messages=True)
+            try:
+                pubsub.psubscribe(f"{LECTURE_CHANNEL_PREFIX}*")
+                with self.cond:
+                    self.connected = True
+                for message in pubsub.listen():
+                    lecture_id = int(message["channel"][len(LECTURE_CHANNEL_PREFIX) :])
+                    with self.cond:
+                        self.sequences[lecture_id] += 1
+                        self.cond.notify_all()
+            except Exception as e:
+                log_warning(f"Lecture event listener disconnected: {e}")
+            finally:
+                pubsub.close()
+                with self.cond:
+                    self.connected = False
+                    self.cond.notify_all()
+            time.sleep(RECONNECT_DELAY)
+
+    def get_sequence(self, lecture_id: int) -> int:
+        """Returns the number of events seen so far in the lecture.
+
+        Read this before checking the database and pass it to wait, so that no event is missed in between.
+        """
+        self._ensure_started()
+        with self.cond:
+            return self.sequences[lecture_id]
+
+    def wait(self, lecture_id: int, sequence: int, timeout: float) -> bool:
+        """Waits for an event in the lecture.
+
+        :param lecture_id: The lecture id.
+        :param sequence: The sequence number from get_sequence.
+        :param timeout: Maximum time to wait in seconds.
+        :return: True if the caller should check for updates, False if the timeout passed without events.
+        """
+        self._ensure_started()
+        deadline = time.monotonic() + timeout
+        with self.cond:
+            while self.sequences[lecture_id] == sequence:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                if not self.connected:
+                    self.cond.wait(min(remaining, FALLBACK_POLL_INTERVAL))
+                    return deadline - time.monotonic() > 0
+                self.cond.wait(remaining)
+            return True
+
+
+lecture_events = LectureEventListener()
@@ -36,6 +36,7 @@ from timApp.lecture.askedquestion import (
     user_activity_lock,
 )
 from timApp.lecture.lecture import Lecture
+from timApp.lecture.lectureevents import lecture_events, publish_lecture_event
 from timApp.lecture.lectureanswer import LectureAnswer, get_totals
 from timApp.lecture.lectureutils import (
     is_lecturer_of,
@@ -173,6 +174,35 @@ def get_updates(m: GetUpdatesModel):
     return json_response(ret, date_conversion=True)
 
 
+@lecture_routes.get("/lectureEvents")
+def get_lecture_events():
+    """Streams Server-Sent Events for the current lecture of the user.
+
+    An "update" event is sent whenever something happens in the lecture; the client should then call /getUpdates.
+    The stream ends after EVENT_STREAM_DURATION seconds and the client is expected to reconnect.
+    """
+    lecture_id = get_current_lecture_or_abort().lecture_id
+    # Don't keep a database connection while streaming.
+    db.session.commit()
+
+    def generate():
+        sequence = lecture_events.get_sequence(lecture_id)
+        yield f"retry: {EVENT_STREAM_KEEPALIVE * 1000}\n\n"
+        end = time.monotonic() + EVENT_STREAM_DURATION
+        while time.monotonic() < end:
+            if lecture_events.wait(lecture_id, sequence, EVENT_STREAM_KEEPALIVE):
+                sequence = lecture_events.get_sequence(lecture_id)
+                yield f"event: update\ndata: {sequence}\n\n"
+            else:
+                yield ": keepalive\n\n"
+
+    return Response(
+        generate(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @lecture_routes.before_request
 def lecture_before_request():
     tim_main_execute("SET LOCAL lock_timeout = '1s'")
@@ -180,6 +210,15 @@ def lecture_before_request():
 
 EXTRA_FIELD_NAME = "extra"
 
+# Maximum time in seconds that a long poll request waits for lecture events.
+LONG_POLL_TIMEOUT = 10
+
+# Maximum lifetime of a lecture event stream in seconds; clients reconnect automatically.
+EVENT_STREAM_DURATION = 300
+
+# Interval in seconds of the comments that keep an idle event stream open.
+EVENT_STREAM_KEEPALIVE = 15
+
 
 @suppress_wuff(
     OperationalError,
@@ -189,7 +228,8 @@ EXTRA_FIELD_NAME = "extra"
 def do_get_updates(m: GetUpdatesModel):
     """Gets updates from some lecture.
 
-    Checks updates in 1 second frequently and answers if there is updates.
+    With long polling, waits for lecture events for up to LONG_POLL_TIMEOUT seconds and answers
+    as soon as there are updates.
 
     """
     client_last_id = m.client_last_id
@@ -199,7 +239,6 @@ def do_get_updates(m: GetUpdatesModel):
     use_questions = m.use_questions
     session["use_questions"] = use_questions
 
-    step = 0
     lecture = get_current_lecture()
 
     doc_id = m.doc_id
@@ -267,7 +306,14 @@ def do_get_updates(m: GetUpdatesModel):
     basic_info = {
         "ms": poll_interval_ms,
     }
-    while step <= 10:
+    # Don't wait when testing.
+    should_wait = long_poll and not current_app.config["TESTING"]
+    deadline = time.monotonic() + LONG_POLL_TIMEOUT
+    timed_out = False
+    while True:
+        if should_wait:
+            # Read before checking so that an event published during the check is not missed.
+            event_sequence = lecture_events.get_sequence(lecture_id)
         lecture = get_current_lecture()
         if not lecture:
             return get_running_lectures(doc_id)
@@ -319,18 +365,18 @@ def do_get_updates(m: GetUpdatesModel):
         if list_of_new_messages:
             return base_resp
 
-        if not long_poll or current_app.config["TESTING"]:
-            # Don't loop when testing.
+        if timed_out or not should_wait:
             break
 
-        # Database updates may have happened during sleep, so we have to expire all objects so that they will be
-        # reloaded. Additionally, we don't want to keep the connection open during sleep, so we call commit()
+        # Database updates may have happened during the wait, so we have to expire all objects so that they will be
+        # reloaded. Additionally, we don't want to keep the connection open during the wait, so we call commit()
         # instead of expire_all().
         db.session.commit()
 
-        # For long poll wait 1 sec before new check.
-        time.sleep(1)
-        step += 1
+        # Wait until something happens in the lecture. After a timeout, check once more to refresh the user lists.
+        timed_out = not lecture_events.wait(
+            lecture_id, event_sequence, deadline - time.monotonic()
+        )
 
     if lecture_ending != 100 or lecturers or students:
         return base_resp
@@ -472,6 +518,7 @@ def send_message(m: SendMessageModel):
     msg = Message(message=m.message, user_id=get_current_user_id())
     lecture.messages.append(msg)
     db.session.commit()
+    publish_lecture_event(lecture.lecture_id)
     return json_response(msg, date_conversion=True)
 
 
@@ -704,6 +751,7 @@ def end_lecture():
     lecture.end_time = now
     empty_lecture(lecture)
     db.session.commit()
+    publish_lecture_event(lecture.lecture_id)
     return json_response(get_running_lectures(lecture.doc_id), date_conversion=True)
 
 
@@ -765,6 +813,7 @@ def extend_lecture():
     lecture = get_lecture_from_request()
     lecture.end_time = new_end_time
     db.session.commit()
+    publish_lecture_event(lecture.lecture_id)
     return ok_response()
 
 
@@ -783,6 +832,7 @@ def delete_lecture(m: DeleteLectureModel):
             run_sql(delete(t).where(t.lecture_id == lecture.lecture_id))
         db.session.delete(lecture)
     db.session.commit()
+    publish_lecture_event(lecture.lecture_id)
 
     return json_response(get_running_lectures(lecture.doc_id), date_conversion=True)
 
@@ -872,6 +922,7 @@ def extend_question():
         raise RouteException("Question is not running")
     rq.end_time += timedelta(seconds=extend)
     db.session.commit()
+    publish_lecture_event(q.lecture_id)
     return ok_response()
 
 
@@ -964,6 +1015,7 @@ def ask_question():
     )
     db.session.add(rq)
     db.session.commit()
+    publish_lecture_event(lecture.lecture_id)
     return json_response(question, date_conversion=True)
 
 
@@ -990,6 +1042,7 @@ def show_points(m: ShowAnswerPointsModel):
     current_points_id = m.current_points_id
     new_question = get_new_question(lecture, current_question_id, current_points_id)
     db.session.commit()
+    publish_lecture_event(lecture.lecture_id)
     if new_question is not None:
         return json_response(new_question, date_conversion=True)
     return empty_response()
@@ -1093,6 +1146,7 @@ def stop_question(m: AskedIdModel):
         aq, [QuestionActivityKind.Usershown, QuestionActivityKind.Useranswered]
     )
     db.session.commit()
+    publish_lecture_event(lecture.lecture_id)
     return ok_response()
 
 
@@ -0,0 +1,67 @@
+"""Process-wide content-addressed cache of Dumbo results.
+
+The HTML that Dumbo returns depends only on the text that is sent and the Dumbo options, so paragraphs with identical
+content in different documents (copied courses, untranslated translations, preambles) are converted only once
+per worker. The key is a cryptographic hash because the cache is shared between all documents.
+"""
+
+import hashlib
+import json
+
+from flask import current_app, has_app_context
+
+from tim_common.collections import SizedLRUCache
+from tim_common.dumboclient import DumboOptions, call_dumbo
+
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+
+_html_cache: SizedLRUCache[str] | None = None
+
+
+def get_dumbo_html_cache() -> SizedLRUCache[str]:
+    global _html_cache
+    if _html_cache is None:
+        max_bytes = (
+            current_app.config["DUMBO_HTML_CACHE_MAX_BYTES"]
+            if has_app_context()
+            else DEFAULT_MAX_BYTES
+        )
+        _html_cache = SizedLRUCache(max_bytes)
+    return _html_cache
+
+
+def get_html_cache_key(text: str | dict, options: DumboOptions) -> str:
+    """Returns the cache key of a text to be converted with the given options.
+
+    :param text: The macro-expanded markdown, or a dict with the markdown and paragraph-specific Dumbo options.
+    :param options: The document-level Dumbo options.
+    """
+    return hashlib.sha256(
+        json.dumps([text, options.dict()], sort_keys=True).encode()
+    ).hexdigest()
+
+
+def call_dumbo_cached(texts: list[str | dict], options: DumboOptions) -> list[str]:
+    """Converts the given texts to HTML, calling Dumbo only for the texts that are not cached.
+
+    Identical texts within the same list are also converted only once.
+
+    :param texts: The texts in the same format as for call_dumbo.
+    :param options: The Dumbo options.
+    :return: The HTML of each text.
+    """
+    cache = get_dumbo_html_cache()
+    keys = [get_html_cache_key(t, options) for t in texts]
+    results: list[str | None] = [cache.get(k) for k in keys]
+    to_convert: dict[str, str | dict] = {}
+    for key, text, result in zip(keys, texts, results):
+        if result is None:
+            to_convert.setdefault(key, text)
+    if not to_convert:
+        return results
+    converted = dict(
+        zip(to_convert.keys(), call_dumbo(list(to_convert.values()), options=options))
+    )
+    for key, html in converted.items():
+        cache.put(key, html, len(html))
+    return [converted[k] if r is None else r for k, r in zip(keys, results)]
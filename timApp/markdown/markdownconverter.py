@@ -24,6 +24,7 @@ from timApp.markdown.autocounters import (
     add_h_values,
     check_autonumber_error,
 )
+from timApp.markdown.htmlcache import call_dumbo_cached
 from timApp.util.utils import get_error_html, title_to_id, slugify
 from timApp.util.utils import widen_fields
 from tim_common.dumboclient import call_dumbo, DumboOptions
@@ -712,7 +713,7 @@ def par_list_to_html_list(
             text = texts[i]
             if text.find("```") != 0 and text.find("#") != 0:
                 texts[i] = "```\n" + text + "\n```"
-    raw = call_dumbo(texts, options=dumbo_opts)
+    raw = call_dumbo_cached(texts, options=dumbo_opts)
 
     # Edit html after dumbo
     raw = edit_html_with_own_syntax(raw)
@@ -0,0 +1,48 @@
+"""Add UserTaskTally table
+
+Revision ID: 5c7e2a91d4f3
+Revises: 417094192806
+Create Date: 2026-10-18 10:12:41.385112
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = "5c7e2a91d4f3"
+down_revision = "417094192806"
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table(
+        "usertasktally",
+        sa.Column("task_id", sa.Text(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("latest_answer_id", sa.Integer(), nullable=False),
+        sa.Column("latest_valid_answer_id", sa.Integer(), nullable=True),
+        sa.Column("answer_count", sa.Integer(), nullable=False),
+        sa.Column("first_answered_on", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("last_answered_on", sa.DateTime(timezone=True), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["user_id"],
+            ["useraccount.id"],
+        ),
+        sa.PrimaryKeyConstraint("task_id", "user_id"),
+    )
+    # Backfill from the existing answers; "flask answer rebuild_tallies" does the same.
+    op.execute(
+        """
+        INSERT INTO usertasktally (task_id, user_id, latest_answer_id, latest_valid_answer_id, answer_count,
+                                   first_answered_on, last_answered_on)
+        SELECT a.task_id, ua.user_id, max(a.id), max(a.id) FILTER (WHERE a.valid), count(*),
+               min(a.answered_on), max(a.answered_on)
+        FROM answer a
+        JOIN useranswer ua ON ua.answer_id = a.id
+        GROUP BY a.task_id, ua.user_id
+        """
+    )
+
+
+def downgrade():
+    op.drop_table("usertasktally")
@@ -0,0 +1,195 @@
+"""A content-addressed cache of compiler outputs for csplugin.
+
+Many runs compile exactly the same sources given by the task (e.g. teacher-provided programs and test harnesses
+in extra files or the master directory). Runs that compile submitted files are not cached because those differ
+almost every time. Language.runself (see languages.py) computes a key from the language, the compile command line
+and the hashes of the source files. On a hit, the cached outputs are copied to the run directory and the
+compilation is skipped. On a miss, only the source files are copied to an empty scratch directory and compiled
+there in a separate run, and the files that the compilation produced are hashed and stored by csplugin before any
+program is run. So nothing that a user's program writes can end up in the cache. If the scratch compilation fails
+with a compile error, its output is the result of the run.
+
+Each entry is a directory named by the key with the output files and a manifest. The cache is shared by the
+csplugin processes and bounded by size: the manifest of an entry is touched on every hit, and the least recently
+used entries are removed when the total size exceeds the limit.
+"""
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+MANIFEST = "manifest.json"
+
+
+def get_compile_cache_dir() -> str:
+    return os.environ.get("CSPLUGIN_COMPILE_CACHE_DIR", "/tmp/.cscompilecache")
+
+
+def get_compile_cache_max_size() -> int:
+    """Returns the maximum total size of the cache in bytes. 0 disables the cache."""
+    return int(os.environ.get("CSPLUGIN_COMPILE_CACHE_MAX_SIZE_MB", "500")) * 1024**2
+
+
+def hash_file(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(65536), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def get_compile_cache_key(parts: list[str], files: dict[str, str]) -> str:
+    """Returns the cache key for a compilation.
+
+    :param parts: The things that affect the compilation besides the sources, such as the language and the command
+     line.
+    :param files: The source files as {path relative to the run directory: absolute path}.
+    """
+    return hashlib.sha256(
+        json.dumps(
+            [parts, sorted((rel, hash_file(p)) for rel, p in files.items())]
+        ).encode()
+    ).hexdigest()
+
+
+def is_safe_relpath(rel: str) -> bool:
+    rel = os.path.normpath(rel)
+    return not (os.path.isabs(rel) or rel == ".." or rel.startswith("../"))
+
+
+def find_compiled_outputs(compile_dir: str, sources: dict[str, str]) -> dict[str, str]:
+    """Returns the files that a compilation produced in compile_dir.
+
+    :param compile_dir: The scratch directory where the sources were compiled.
+    :param sources: The source files as {path relative to compile_dir: sha256}.
+    :return: The new and changed files as {path relative to compile_dir: sha256}, excluding the run directory.
+    """
+    outputs = {}
+    for root, dirs, names in os.walk(compile_dir):
+        if root == compile_dir and "run" in dirs:
+            dirs.remove("run")
+        for name in names:
+            p = os.path.join(root, name)
+            if os.path.islink(p) or not os.path.isfile(p):
+                continue
+            rel = os.path.relpath(p, compile_dir)
+            digest = hash_file(p)
+            if sources.get(rel) != digest:
+                outputs[rel] = digest
+    return outputs
+
+
+class CompileCache:
+    def __init__(self, path: str, max_size: int):
+        self.path = Path(path)
+        self.max_size = max_size
+
+    def restore(self, key: str, run_dir: str) -> tuple[str, str] | None:
+        """Copies the outputs of the entry to the run directory.
+
+        :return: The stdout and stderr of the compilation on a hit, None on a miss.
+        """
+        entry = self.path / key
+        try:
+            with open(entry / MANIFEST) as f:
+                manifest = json.load(f)
+            if not all(is_safe_relpath(rel) for rel in manifest["files"]):
+                return None
+            for rel in manifest["files"]:
+                dest = os.path.join(run_dir, rel)
+                os.makedirs(os.path.dirname(dest), exist_ok=True)
+                if os.path.islink(dest):
+                    os.remove(dest)
+                shutil.copyfile(entry / "files" / rel, dest)
+            os.utime(entry / MANIFEST)
+            return manifest["stdout"], manifest["stderr"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def store(
+        self,
+        key: str,
+        compile_dir: str,
+        outputs: dict[str, str],
+        stdout: str = "",
+        stderr: str = "",
+    ) -> bool:
+        """Stores the outputs of a compilation.
+
+        The entry is not stored if an output does not match its hash anymore.
+
+        :param key: The key of the compilation.
+        :param compile_dir: The directory where the sources were compiled.
+        :param outputs: The outputs as {path relative to compile_dir: sha256}.
+        :param stdout: The stdout of the compilation.
+        :param stderr: The stderr of the compilation.
+        :return: True if the entry was stored.
+        """
+        if (
+            not outputs
+            or not all(is_safe_relpath(rel) for rel in outputs)
+            or (self.path / key).exists()
+        ):
+            return False
+        self.path.mkdir(parents=True, exist_ok=True)
+        tmp = Path(tempfile.mkdtemp(dir=self.path, prefix=".tmp"))
+        try:
+            size = 0
+            for rel, digest in outputs.items():
+                src = os.path.join(compile_dir, rel)
+                if os.path.islink(src) or not os.path.isfile(src):
+                    return False
+                dest = tmp / "files" / rel
+                dest.parent.mkdir(parents=True, exist_ok=True)
+                shutil.copyfile(src, dest)
+                if hash_file(str(dest)) != digest:
+                    return False
+                size += dest.stat().st_size
+            if size > self.max_size:
+                return False
+            with open(tmp / MANIFEST, "w") as f:
+                json.dump(
+                    {
+                        "files": sorted(outputs),
+                        "size": size,
+                        "stdout": stdout,
+                        "stderr": stderr,
+                    },
+                    f,
+                )
+            try:
+                os.rename(tmp, self.path / key)
+            except OSError:
+                # Another process stored the same entry in the meantime.
+                return False
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+        self.evict()
+        return True
+
+    def evict(self) -> None:
+        """Removes the least recently used entries until the cache fits in max_size."""
+        with open(self.path / ".lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            entries = []
+            total = 0
+            for entry in self.path.iterdir():
+                if entry.name.startswith("."):
+                    continue
+                try:
+                    st = (entry / MANIFEST).stat()
+                    with open(entry / MANIFEST) as f:
+                        size = json.load(f)["size"]
+                except (OSError, ValueError, KeyError):
+                    continue
+                entries.append((st.st_mtime, size, entry))
+                total += size
+            entries.sort(key=lambda e: e[0])
+            for _, size, entry in entries:
+                if total <= self.max_size:
+                    break
+                shutil.rmtree(entry, ignore_errors=True)
+                total -= size
@@ -0,0 +1,554 @@
+"""A pool of pre-started sandbox containers for run2.
+
+Starting a new container is most of the latency of a short run, so when CSPLUGIN_POOL_SIZE is positive,
+run2 executes the run in a warm container with "docker exec" instead of "docker run":
+
+* Runs that use the same image and the same mappings share a pool of at most CSPLUGIN_POOL_SIZE containers.
+* A pooled container has a read-only root filesystem, so a run can only write to the home directory and the
+  tmpfs mounts listed by the backend (/tmp, /dev/shm etc.). Before each run they are all emptied and the run
+  directory of the user is copied to the home directory; after the run it is copied back.
+* A container is recycled (removed and started again when needed) after CSPLUGIN_POOL_MAX_RUNS runs and after
+  any suspicious event: a timeout, processes that survive the cleanup or writable directories that cannot be reset.
+* If all containers are busy, the run waits for a free one. At most CSPLUGIN_POOL_QUEUE_SIZE runs may wait and
+  only for CSPLUGIN_POOL_QUEUE_TIMEOUT seconds, after which the run is rejected with PoolBusy.
+
+csplugin handles each request in a forked process, so the state of the pools is kept in lock files under
+CSPLUGIN_POOL_DIR instead of memory. The same goes for the per-language statistics (see get_pool_stats).
+"""
+import fcntl
+import hashlib
+import io
+import itertools
+import json
+import os
+import shutil
+import subprocess
+import tarfile
+import time
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+POOL_LABEL = "tim.cspool"
+
+# How often a waiting run checks for a free container, in seconds.
+POLL_INTERVAL = 0.05
+
+# Empties the home directory ($1) and the other writable directories (the rest of the arguments) and extracts the
+# new home directory from stdin. Each directory is a mount of its own, so find does not cross into other mounts;
+# mount points cannot be removed and are the only entries allowed to remain (with the directories containing
+# them). Fails if anything else survived.
+RESET_SCRIPT = (
+    'find "$@" -mindepth 1 -xdev -delete 2>/dev/null; '
+    'mounts="$(cut -d " " -f 5 /proc/self/mountinfo)"; '
+    'if [ -n "$(find "$@" -mindepth 1 -xdev ! -type d -print | grep -vxF "$mounts")" ]; then exit 1; fi; '
+    'tar -x -C "$1"'
+)
+
+# Runs the command so that the processes it leaves in the background do not hold the output of the exec.
+RUN_SCRIPT = (
+    'out="$1"; shift; '
+    '"$@" >"$out.out" 2>"$out.err" </dev/null; code=$?; '
+    'cat "$out.out"; cat "$out.err" >&2; exit $code'
+)
+
+# Kills everything the run left behind, removes its System V IPC objects and lists the processes that survived.
+CLEANUP_SCRIPT = (
+    "kill -9 -1 2>/dev/null; sleep 0.1; "
+    "ipcrm --all 2>/dev/null; "
+    "for p in /proc/[0-9]*; do "
+    'pid="${p#/proc/}"; '
+    'if [ "$pid" = 1 ] || [ "$pid" = $$ ]; then continue; fi; '
+    'read -r _ _ state _ <"$p/stat" 2>/dev/null || continue; '
+    'if [ "$state" != Z ]; then echo "$pid"; fi; '
+    "done"
+)
+
+
+@dataclass
+class PoolConfig:
+    size: int
+    max_runs: int
+    queue_size: int
+    queue_timeout: float
+    pool_dir: str
+
+
+def get_pool_config() -> PoolConfig:
+    return PoolConfig(
+        size=int(os.environ.get("CSPLUGIN_POOL_SIZE", "0")),
+        max_runs=int(os.environ.get("CSPLUGIN_POOL_MAX_RUNS", "50")),
+        queue_size=int(os.environ.get("CSPLUGIN_POOL_QUEUE_SIZE", "20")),
+        queue_timeout=float(os.environ.get("CSPLUGIN_POOL_QUEUE_TIMEOUT", "10")),
+        pool_dir=os.environ.get("CSPLUGIN_POOL_DIR", "/tmp/.cspool"),
+    )
+
+
+class PoolBusy(Exception):
+    pass
+
+
+@dataclass
+class PoolRunResult:
+    returncode: int
+    stdout: bytes
+    stderr: bytes
+    timed_out: bool = False
+
+
+class PoolBackend:
+    """Starts, stops and executes commands in the containers of a pool."""
+
+    def start(self, name: str) -> None:
+        raise NotImplementedError
+
+    def stop(self, name: str) -> None:
+        raise NotImplementedError
+
+    def exec(
+        self,
+        name: str,
+        args: list[str],
+        stdin: bytes | None = None,
+        timeout: float | None = None,
+    ) -> subprocess.CompletedProcess:
+        """Runs the command in the home directory of the container."""
+        raise NotImplementedError
+
+    def cleanup(self, name: str) -> bool:
+        """Kills the processes left behind by a run.
+
+        :return: False if something could not be cleaned up and the container should not be used anymore.
+        """
+        raise NotImplementedError
+
+    def home_dir(self, name: str) -> str:
+        """Returns the home directory of the container."""
+        raise NotImplementedError
+
+    def tmp_dir(self, name: str) -> str:
+        """Returns a directory in the container that is not copied back."""
+        raise NotImplementedError
+
+    def writable_dirs(self, name: str) -> list[str]:
+        """Returns every directory other than the home directory that a run can write to.
+
+        They are emptied before each run, so the list must be complete for runs to be isolated from each other.
+        """
+        raise NotImplementedError
+
+
+class DockerBackend(PoolBackend):
+    home = "/home/agent"
+    # The writable mounts besides the home directory. The image has volumes under the home directory; they are
+    # tmpfs mounts too so that they are cleaned. /dev/shm and /dev/mqueue are created by Docker.
+    tmpfs_dirs = [
+        f"{home}/.local",
+        f"{home}/.nuget/packages",
+        "/tmp",
+        "/var/tmp",
+        "/cs",
+    ]
+
+    def __init__(self, image: str, run_args: list[str]):
+        """
+        :param image: The image of the containers.
+        :param run_args: Extra arguments for "docker run", such as the volume mappings and the network.
+        """
+        self.image = image
+        self.run_args = run_args
+
+    def start(self, name: str) -> None:
+        subprocess.run(
+            [
+                "docker",
+                "run",
+                "--detach",
+                "--rm=true",
+                "--name",
+                name,
+                "--label",
+                f"{POOL_LABEL}={os.environ.get('COMPOSE_PROJECT_NAME', '')}",
+                "--read-only",
+                "--tmpfs",
+                f"{self.home}:exec,mode=1777",
+                *itertools.chain.from_iterable(
+                    ["--tmpfs", f"{d}:exec,mode=1777"] for d in self.tmpfs_dirs
+                ),
+                *self.run_args,
+                "-w",
+                self.home,
+                self.image,
+                "sleep",
+                "infinity",
+            ],
+            check=True,
+            capture_output=True,
+        )
+
+    def stop(self, name: str) -> None:
+        subprocess.run(["docker", "rm", "--force", name], capture_output=True)
+
+    def exec(
+        self,
+        name: str,
+        args: list[str],
+        stdin: bytes | None = None,
+        timeout: float | None = None,
+    ) -> subprocess.CompletedProcess:
+        return subprocess.run(
+            ["docker", "exec", "-i", "-w", self.home, name, *args],
+            input=stdin or b"",
+            capture_output=True,
+            timeout=timeout,
+        )
+
+    def cleanup(self, name: str) -> bool:
+        p = self.exec(name, ["sh", "-c", CLEANUP_SCRIPT])
+        return p.returncode == 0 and not p.stdout.strip()
+
+    def home_dir(self, name: str) -> str:
+        return self.home
+
+    def tmp_dir(self, name: str) -> str:
+        return "/tmp"
+
+    def writable_dirs(self, name: str) -> list[str]:
+        return [*self.tmpfs_dirs, "/dev/shm", "/dev/mqueue"]
+
+
+class SubprocessBackend(PoolBackend):
+    """Runs the commands as plain processes in a directory per container.
+
+    There is no sandbox at all, so this is only meant for testing the pool without Docker.
+    """
+
+    def __init__(self, root: str):
+        self.root = Path(root)
+
+    def start(self, name: str) -> None:
+        (self.root / name / "home").mkdir(parents=True)
+        (self.root / name / "tmp").mkdir()
+        (self.root / name / "shm").mkdir()
+
+    def stop(self, name: str) -> None:
+        shutil.rmtree(self.root / name, ignore_errors=True)
+
+    def exec(
+        self,
+        name: str,
+        args: list[str],
+        stdin: bytes | None = None,
+        timeout: float | None = None,
+    ) -> subprocess.CompletedProcess:
+        home = self.root / name / "home"
+        if not home.is_dir():
+            return subprocess.CompletedProcess(args, 1, b"", b"No such container")
+        return subprocess.run(
+            args,
+            cwd=home,
+            input=stdin or b"",
+            capture_output=True,
+            timeout=timeout,
+        )
+
+    def cleanup(self, name: str) -> bool:
+        return True
+
+    def home_dir(self, name: str) -> str:
+        return str(self.root / name / "home")
+
+    def tmp_dir(self, name: str) -> str:
+        return str(self.root / name / "tmp")
+
+    def writable_dirs(self, name: str) -> list[str]:
+        return [self.tmp_dir(name), str(self.root / name / "shm")]
+
+
+@dataclass
+class PoolSlot:
+    index: int
+    lock_file: Any
+    container: str | None
+    runs: int
+
+
+class ContainerPool:
+    def __init__(self, key: str, backend: PoolBackend, config: PoolConfig):
+        """
+        :param key: Identifies the pool; runs with the same key may share containers.
+        :param backend: The backend for the containers.
+        :param config: The pool configuration.
+        """
+        self.key = key
+        self.backend = backend
+        self.config = config
+        self.dir = Path(config.pool_dir) / key
+        self.dir.mkdir(parents=True, exist_ok=True)
+
+    def run(
+        self,
+        cwd: str,
+        args: list[str],
+        timeout: float | None,
+        language: str = "",
+    ) -> PoolRunResult:
+        """Runs the command in a pooled container with the contents of cwd as the home directory.
+
+        :param cwd: The directory that is copied to the home directory of the container and back.
+        :param args: The command to run in the home directory.
+        :param timeout: Maximum time for the command in seconds.
+        :param language: The language for the statistics.
+        :return: The result of the command.
+        """
+        start = time.monotonic()
+        try:
+            slot = self._acquire()
+        except PoolBusy:
+            update_pool_stats(self.config, language, rejected=1)
+            raise
+        waited = time.monotonic() - start
+        recycled = 0
+        try:
+            home = pack_dir(cwd)
+            if not self._reset(slot, home):
+                # The container may have been removed or broken; try once more with a new one.
+                self._recycle(slot)
+                recycled += 1
+                if not self._reset(slot, home):
+                    self._recycle(slot)
+                    raise OSError("Could not prepare a container for the run")
+            slot.runs += 1
+            run_start = time.monotonic()
+            try:
+                p = self.backend.exec(
+                    slot.container,
+                    [
+                        "sh",
+                        "-c",
+                        RUN_SCRIPT,
+                        "run",
+                        f"{self.backend.tmp_dir(slot.container)}/.run",
+                        *args,
+                    ],
+                    timeout=timeout,
+                )
+                result = PoolRunResult(p.returncode, p.stdout, p.stderr)
+            except subprocess.TimeoutExpired:
+                result = PoolRunResult(-9, b"", b"", timed_out=True)
+            run_time = time.monotonic() - run_start
+            clean = not result.timed_out and self.backend.cleanup(slot.container)
+            if clean:
+                p = self.backend.exec(
+                    slot.container,
+                    ["tar", "-c", "-C", self.backend.home_dir(slot.container), "."],
+                )
+                clean = p.returncode == 0
+                if clean:
+                    unpack_dir(p.stdout, cwd)
+            if not clean or slot.runs >= self.config.max_runs:
+                self._recycle(slot)
+                recycled += 1
+        finally:
+            self._release(slot)
+        update_pool_stats(
+            self.config,
+            language,
+            runs=1,
+            wait_time=waited,
+            run_time=run_time,
+            recycled=recycled,
+            timeouts=int(result.timed_out),
+        )
+        return result
+
+    def _reset(self, slot: PoolSlot, home: bytes) -> bool:
+        if not slot.container:
+            slot.container = f"cspool-{self.key}-{slot.index}-{uuid.uuid4().hex[:8]}"
+            slot.runs = 0
+            try:
+                self.backend.start(slot.container)
+            except (OSError, subprocess.CalledProcessError):
+                slot.container = None
+                return False
+        p = self.backend.exec(
+            slot.container,
+            [
+                "sh",
+                "-c",
+                RESET_SCRIPT,
+                "reset",
+                self.backend.home_dir(slot.container),
+                *self.backend.writable_dirs(slot.container),
+            ],
+            stdin=home,
+        )
+        return p.returncode == 0
+
+    def _recycle(self, slot: PoolSlot) -> None:
+        if slot.container:
+            self.backend.stop(slot.container)
+        slot.container = None
+        slot.runs = 0
+
+    def _acquire(self) -> PoolSlot:
+        deadline = time.monotonic() + self.config.queue_timeout
+        ticket = None
+        try:
+            while True:
+                for i in range(self.config.size):
+                    f = try_lock(self.dir / f"slot-{i}.lock")
+                    if f:
+                        f.seek(0)
+                        state = json.loads(f.read() or "{}")
+                        return PoolSlot(
+                            i, f, state.get("container"), state.get("runs", 0)
+                        )
+                if ticket is None:
+                    ticket = self._take_ticket()
+                    if ticket is None:
+                        raise PoolBusy("Too many runs are waiting")
+                if time.monotonic() > deadline:
+                    raise PoolBusy("Timed out while waiting for a free container")
+                time.sleep(POLL_INTERVAL)
+        finally:
+            if ticket:
+                ticket.close()
+
+    def _take_ticket(self):
+        for i in range(self.config.queue_size):
+            f = try_lock(self.dir / f"queue-{i}.lock")
+            if f:
+                return f
+        return None
+
+    def _release(self, slot: PoolSlot) -> None:
+        f = slot.lock_file
+        f.seek(0)
+        f.truncate()
+        f.write(json.dumps({"container": slot.container, "runs": slot.runs}))
+        f.flush()
+        f.close()
+
+
+def try_lock(path: Path):
+    f = open(path, "a+")
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        f.close()
+        return None
+    return f
+
+
+def get_pool_key(image: str, run_args: list[str]) -> str:
+    return hashlib.sha256(json.dumps([image, run_args]).encode()).hexdigest()[:16]
+
+
+def pack_dir(path: str) -> bytes:
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode="w") as tar:
+        for name in sorted(os.listdir(path)):
+            tar.add(os.path.join(path, name), arcname=name)
+    return buf.getvalue()
+
+
+def is_safe_member(m: tarfile.TarInfo) -> bool:
+    """Checks that extracting the member cannot write or point outside the target directory."""
+    name = os.path.normpath(m.name)
+    if os.path.isabs(name) or name == ".." or name.startswith("../"):
+        return False
+    if m.issym():
+        target = os.path.normpath(os.path.join(os.path.dirname(name), m.linkname))
+        return not (
+            os.path.isabs(m.linkname) or target == ".." or target.startswith("../")
+        )
+    return m.isfile() or m.isdir()
+
+
+def unpack_dir(data: bytes, path: str) -> None:
+    """Makes the directory match the tar archive: the members are extracted and other entries are removed.
+
+    Members that could escape the directory (absolute or outside symlinks, devices etc.) are skipped.
+    """
+    with tarfile.open(fileobj=io.BytesIO(data)) as tar:
+        members = [
+            m
+            for m in tar.getmembers()
+            if os.path.normpath(m.name) != "." and is_safe_member(m)
+        ]
+        names = {os.path.normpath(m.name) for m in members}
+        for root, dirs, files in os.walk(path, topdown=False):
+            for n in files + dirs:
+                p = os.path.join(root, n)
+                if os.path.relpath(p, path) in names:
+                    continue
+                if os.path.isdir(p) and not os.path.islink(p):
+                    shutil.rmtree(p, ignore_errors=True)
+                else:
+                    os.remove(p)
+        for m in members:
+            # Replace existing entries instead of writing through them (they may be symlinks).
+            p = os.path.join(path, os.path.normpath(m.name))
+            if os.path.islink(p) or (
+                os.path.lexists(p) and not (m.isdir() and os.path.isdir(p))
+            ):
+                if os.path.isdir(p) and not os.path.islink(p):
+                    shutil.rmtree(p)
+                else:
+                    os.remove(p)
+        if hasattr(tarfile, "fully_trusted_filter"):
+            tar.extractall(path, members=members, filter="fully_trusted")
+        else:
+            tar.extractall(path, members=members)
+
+
+def update_pool_stats(config: PoolConfig, language: str, **values: float) -> None:
+    path = Path(config.pool_dir) / "stats.json"
+    with open(path, "a+") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        f.seek(0)
+        stats = json.loads(f.read() or "{}")
+        lang_stats = stats.setdefault(language or "unknown", {})
+        for k, v in values.items():
+            lang_stats[k] = lang_stats.get(k, 0) + v
+        f.seek(0)
+        f.truncate()
+        f.write(json.dumps(stats))
+
+
+def get_pool_stats(config: PoolConfig) -> dict[str, dict[str, float]]:
+    """Returns the statistics of the pooled runs per language.
+
+    The counters are runs, timeouts, recycled (containers) and rejected (runs), and the total wait_time and
+    run_time in seconds.
+    """
+    try:
+        with open(Path(config.pool_dir) / "stats.json") as f:
+            fcntl.flock(f, fcntl.LOCK_SH)
+            return json.loads(f.read() or "{}")
+    except FileNotFoundError:
+        return {}
+
+
+def remove_pool_containers() -> None:
+    """Removes the pooled containers of this TIM instance and forgets the pool state.
+
+    Called when csplugin starts, so that containers of old images or mappings do not stay around.
+    """
+    p = subprocess.run(
+        [
+            "docker",
+            "ps",
+            "--all",
+            "--quiet",
+            "--filter",
+            f"label={POOL_LABEL}={os.environ.get('COMPOSE_PROJECT_NAME', '')}",
+        ],
+        capture_output=True,
+    )
+    ids = p.stdout.decode().split()
+    if ids:
+        subprocess.run(["docker", "rm", "--force", *ids], capture_output=True)
+    shutil.rmtree(get_pool_config().pool_dir, ignore_errors=True)
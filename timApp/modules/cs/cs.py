@@ -23,6 +23,7 @@ from subprocess import Popen, PIPE, check_output
 from traceback import print_exc
 from urllib.request import urlopen
 
+from containerpool import get_pool_config, get_pool_stats, remove_pool_containers
 from cs_logging import get_logger
 from cs_utils import replace_code, check_parsons
 from file_handler import FileHandler
@@ -1322,6 +1323,10 @@ class TIMServer(http.server.BaseHTTPRequestHandler):
             )
             return
 
+        if path.endswith("/poolstats"):
+            self.wout(json.dumps(get_pool_stats(get_pool_config())))
+            return
+
         if is_gethtml:
             scripts = get_param(query, "scripts", "")
             inchtml = get_param(query, "html", "")
@@ -1772,6 +1777,7 @@ class TIMServer(http.server.BaseHTTPRequestHandler):
             language.compile_commandline = cmdline.replace(
                 language.prgpath, "/home/agent"
             )
+            language.compile_cache_commandline = language.compile_commandline
 
             language.prgpath = sanitize_cmdline(language.prgpath)
 
@@ -2027,6 +2033,11 @@ class TIMServer(http.server.BaseHTTPRequestHandler):
         web["error"] = err + warnmessage
         web["pwd"] = cs_min_sanitize(pwddir.strip())
         web["language"] = language.web_data()
+        if language.compile_cache_hits or language.compile_cache_misses:
+            web["compileCache"] = {
+                "hits": language.compile_cache_hits,
+                "misses": language.compile_cache_misses,
+            }
 
         t2 = time.time()
         ts = f"{(t2 - t1start):7.3f} {t_run_time:7.3f}"
@@ -2079,6 +2090,8 @@ else:
 
 if __name__ == "__main__":
     init_directories()
+    if get_pool_config().size > 0:
+        remove_pool_containers()
     server = ThreadedHTTPServer(("", PORT), TIMServer)
     print("Starting server, use <Ctrl-C> to stop")
     server.serve_forever()
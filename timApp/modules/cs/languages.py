@@ -7,6 +7,7 @@ import re
 import shlex
 import shutil
 import subprocess
+import tempfile
 import time
 from base64 import b64encode
 from io import BytesIO
@@ -17,6 +18,14 @@ from zipfile import ZipFile
 
 import requests
 
+from compilecache import (
+    CompileCache,
+    find_compiled_outputs,
+    get_compile_cache_dir,
+    get_compile_cache_key,
+    get_compile_cache_max_size,
+    hash_file,
+)
 from file_util import File, default_filename, write_safe, rm_safe
 from modifiers import Modifier
 from points import give_points
@@ -96,8 +105,14 @@ def file_hash(s):
     return h.hexdigest()
 
 
+def get_compile_cache() -> CompileCache:
+    return CompileCache(get_compile_cache_dir(), get_compile_cache_max_size())
+
+
 class Language:
     ttype = "_language"
+    compile_cache_extensions: tuple[str, ...] = ()
+    """Extensions of the source files for the compile cache. Empty if the language does not use the cache."""
 
     def __init__(self, query: QueryClass | None, sourcefiles=""):
         """
@@ -148,6 +163,10 @@ class Language:
         self.run_points_given = False  # Put this on if give run or test points
         self.readpoints_default = None  # what is default string for readpoints
         self.compile_commandline = ""
+        # compile_commandline without run-specific additions; set by cs.py
+        self.compile_cache_commandline = ""
+        self.compile_cache_hits = 0
+        self.compile_cache_misses = 0
         self.just_compile = False
         self.imgname = get_param(query, "imgname", None)
         self.imgsource = get_imgsource(query)
@@ -416,32 +435,164 @@ class Language:
         else:
             save_run_cmd = self.query.jso.get("markup", {}).get("saveRunCmd", None)
 
+        dockercontainer = df(dockercontainer, self.dockercontainer)
+        timeout = df(timeout, self.timeout)
+        env = df(env, dict(os.environ))
+        ulimit = df(ulimit, self.ulimit)
+        compile_commandline = self.compile_commandline
+        compile_out, compile_err = "", ""
+        cache_sources = self.get_compile_cache_sources(cwd, dockercontainer)
+        if cache_sources:
+            key, sources = cache_sources
+            cache = get_compile_cache()
+            compiled = cache.restore(key, self.prgpath)
+            if compiled:
+                self.compile_cache_hits += 1
+            else:
+                self.compile_cache_misses += 1
+                failed = self.compile_for_cache(
+                    key,
+                    sources,
+                    timeout=timeout,
+                    env=env,
+                    ulimit=ulimit,
+                    dockercontainer=dockercontainer,
+                    mounts=mounts,
+                    extra_mappings=extra_mappings,
+                )
+                if failed:
+                    # The same sources would fail the same way in the run directory, so do not compile again.
+                    code, out, err = failed
+                    return code, out, err, ""
+                compiled = cache.restore(key, self.prgpath)
+            if compiled:
+                compile_out, compile_err = compiled
+                # Keep the rest of the commands, e.g. removing the sources of a nocode task.
+                compile_commandline = (
+                    "true" + compile_commandline[len(self.compile_cache_commandline) :]
+                )
+
         code, out, err, pwddir = run2_subdir(
             args,
             dir=self.rootpath,
             cwd=df(cwd, self.prgpath),
             shell=df(shell, False),
             kill_tree=df(kill_tree, True),
-            timeout=df(timeout, self.timeout),
-            env=df(env, dict(os.environ)),
+            timeout=timeout,
+            env=env,
             stdin=df(stdin, self.stdin),
             uargs=uargs,
             code=df(code, "utf-8"),
             extra=extra_cmd,
-            ulimit=df(ulimit, self.ulimit),
+            ulimit=ulimit,
             no_x11=df(no_x11, self.no_x11),
             savestate=df(savestate, self.savestate),
-            dockercontainer=df(dockercontainer, self.dockercontainer),
-            compile_commandline=self.compile_commandline,
+            dockercontainer=dockercontainer,
+            compile_commandline=compile_commandline,
             mounts=mounts,
             extra_mappings=extra_mappings,
             save_run_cmd=save_run_cmd,
             save_test_run_cmd=save_test_run_cmd,
+            language=self.get_client_ttype(self.ttype),
         )
+        # The compiler output goes before the program output as when compiling in the same run.
+        out = compile_out + out
+        err = compile_err + err
         if self.just_compile and not err:
             return code, "", "Compiled " + self.filename, pwddir
         return code, out, err, pwddir
 
+    def get_compile_cache_sources(
+        self, cwd, dockercontainer
+    ) -> tuple[str, dict[str, str]] | None:
+        """Returns the compile cache key and the source files of the run, or None if the compilation cannot be cached.
+
+        The key consists of the language, the image, the compile command line and the hashes of the source files:
+        the files in the run directory with one of compile_cache_extensions and the files named in the command line.
+        The source files are returned as {path relative to the run directory: absolute path}.
+
+        Only compilations of files given by the task (extra files and master files) are cached. Submitted files
+        differ almost every time, so caching them would only cost an extra compile run for each submission.
+        """
+        base = self.compile_cache_commandline
+        if (
+            not self.compile_cache_extensions
+            or not base
+            or not self.compile_commandline.startswith(base)
+            or self.rootpath is not None
+            or (cwd is not None and cwd != self.prgpath)
+            or get_compile_cache_max_size() <= 0
+            or get_param(self.query, "uploadCopy", False)
+        ):
+            return None
+        home = self.prgpath
+        submitted = {os.path.normpath(f.path) for f in self.sourcefiles}
+        try:
+            tokens = set(shlex.split(base, posix=True))
+        except ValueError:
+            return None
+        files = {}
+        for root, dirs, names in os.walk(home):
+            if root == home and "run" in dirs:
+                dirs.remove("run")
+            for name in names:
+                p = os.path.join(root, name)
+                rel = os.path.relpath(p, home)
+                if os.path.islink(p) or not os.path.isfile(p):
+                    continue
+                if (
+                    name.endswith(self.compile_cache_extensions)
+                    or rel in tokens
+                    or f"/home/agent/{rel}" in tokens
+                ):
+                    if os.path.normpath(p) in submitted:
+                        return None
+                    files[rel] = p
+        key = get_compile_cache_key(
+            [self.__class__.__name__, dockercontainer, base], files
+        )
+        return key, files
+
+    def compile_for_cache(
+        self, key: str, sources: dict[str, str], **kwargs
+    ) -> tuple[int, str, str] | None:
+        """Compiles the sources in a separate run and stores the outputs in the compile cache.
+
+        Only the source files are copied to an empty scratch directory, and the outputs are hashed here before any
+        program is run, so neither leftover files in the run directory nor the user's program can affect the
+        stored outputs.
+
+        :param key: The compile cache key.
+        :param sources: The source files as {path relative to the run directory: absolute path}.
+        :param kwargs: Other run2 arguments.
+        :return: The error code, stdout and stderr of the compilation if it failed with a compile error, otherwise
+                 None. The outputs are in the cache afterwards unless the compilation failed for another reason.
+        """
+        scratch = tempfile.mkdtemp(dir="/tmp", prefix=".cscompile-")
+        try:
+            mkdirs(scratch)
+            digests = {}
+            for rel, p in sources.items():
+                dest = os.path.join(scratch, rel)
+                mkdirs(os.path.dirname(dest))
+                shutil.copyfile(p, dest)
+                digests[rel] = hash_file(dest)
+            code, out, err, _ = run2_subdir(
+                ["true"],
+                cwd=scratch,
+                compile_commandline=self.compile_cache_commandline,
+                language=self.get_client_ttype(self.ttype),
+                **kwargs,
+            )
+            if "Compile error" in err:
+                return code, out, err
+            if code == 0:
+                outputs = find_compiled_outputs(scratch, digests)
+                get_compile_cache().store(key, scratch, outputs, out, err)
+            return None
+        finally:
+            shutil.rmtree(scratch, ignore_errors=True)
+
     def copy_image(self, result, code, out, err, points_rule):
         if code == -9:
             out = "Runtime exceeded, maybe loop forever\n" + out
@@ -536,6 +687,7 @@ GLOBAL_NUGET_PACKAGES_PATH = "/cs_data/dotnet/nuget_cache"
 
 class CS(Language):
     ttype = ["cs", "c#", "csharp"]
+    compile_cache_extensions = (".cs",)
 
     def __init__(self, query, sourcecode):
         super().__init__(query, sourcecode)
@@ -619,6 +771,7 @@ class Elixir(Language):
 
 class GoLang(Language):
     ttype = ["go", "golang"]
+    compile_cache_extensions = (".go", ".mod", ".sum")
 
     def __init__(self, query, sourcecode):
         super().__init__(query, sourcecode)
@@ -939,6 +1092,7 @@ java_preview_warning_re = re.compile(
 
 class Java(Language):
     ttype = "java"
+    compile_cache_extensions = (".java",)
 
     def __init__(self, query, sourcecode):
         super().__init__(query, sourcecode)
@@ -985,6 +1139,7 @@ class Java(Language):
 
 class Kotlin(Java):
     ttype = "kotlin"
+    compile_cache_extensions = (".kt",)
 
     def __init__(self, query, sourcecode):
         super().__init__(query, sourcecode)
@@ -1162,6 +1317,7 @@ class Scala(Language):
 
 class CC(Language):
     ttype = "cc"
+    compile_cache_extensions = (".h", ".c", ".cc")
 
     def __init__(self, query, sourcecode):
         super().__init__(query, sourcecode)
@@ -1193,6 +1349,7 @@ class CC(Language):
 
 class CPP(CC):
     ttype = ["c++", "cpp"]
+    compile_cache_extensions = (".h", ".hpp", ".hh", ".cpp", ".cc")
 
     def __init__(self, query, sourcecode):
         super().__init__(query, sourcecode)
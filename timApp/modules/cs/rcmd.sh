@@ -6,8 +6,9 @@ export CLASSPATH=.:/cs/java/junit.jar:/cs/java/hamcrest-core.jar:/cs_data/java/c
 export PATH="$PATH:/cs/dotnet"
 
 # Create symlinks for some data folders as they are expected to be found in /cs
-ln -s /cs_data/MIRToolbox /cs/MIRToolbox
-ln -s /cs_data/simcir /cs/simcir
+# (-fn because a pooled container runs this many times)
+ln -sfn /cs_data/MIRToolbox /cs/MIRToolbox
+ln -sfn /cs_data/simcir /cs/simcir
 
 printf "\n" >~/run/time.txt
 if [ -e run/compile.sh ]
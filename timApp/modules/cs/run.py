@@ -9,6 +9,13 @@ import uuid
 from pathlib import PurePath, PureWindowsPath
 from subprocess import PIPE, Popen
 
+from containerpool import (
+    ContainerPool,
+    DockerBackend,
+    PoolBusy,
+    get_pool_config,
+    get_pool_key,
+)
 from file_util import write_safe, is_safe_path, rm_safe
 from tim_common.fileParams import mkdirs, tquote, get_param
 
@@ -119,7 +126,7 @@ def get_user_mappings(root_dir, mounts):
 
 
 class RunCleaner:
-    def __init__(self, p: Popen, container: str, files: list[str]):
+    def __init__(self, p: Popen | None, container: str, files: list[str]):
         self.p = p
         self.files = files
         self.container = container
@@ -128,7 +135,7 @@ class RunCleaner:
         pass
 
     def __exit__(self, type, value, traceback):
-        if self.p.returncode is None:
+        if self.p and self.p.returncode is None:
             self.p.kill()
             subprocess.run(["docker", "kill", self.container])
 
@@ -158,6 +165,7 @@ def run2(
     escape_pipe=False,
     save_run_cmd=None,
     save_test_run_cmd=None,
+    language="",
 ):
     """Run that is done by opening a new docker instance to run the command.  A script rcmd.sh is needed to fulfill the
     run inside docker.
@@ -183,8 +191,11 @@ def run2(
     :param escape_pipe: TODO: what
     :param save_run_cmd: filename to save run_cmd
     :param save_test_run_cmd: filename to save test_run_cmd
+    :param language: language of the run for the container pool statistics
     :return: error code, stdout text, stderr text
 
+    If the container pool is enabled (see containerpool.py), the run is done in a warm container instead.
+
     """
     s_in = ""
     pwddir = ""
@@ -322,35 +333,44 @@ def run2(
         else ["--network", f"{compose_proj}_csplugin_db"]
     )
 
-    dargs = [
-        "docker",
-        "run",
-        "--name",
-        tmpname,
-        "--rm=true",
-        "--tmpfs",
-        "/cs",
+    run_args = [
         *itertools.chain.from_iterable(path_mappings),
         *itertools.chain.from_iterable(user_mappings),
         "-v",
-        f"/tmp/{compose_proj}_uhome/{udir}/:/home/agent/",
-        "-v",
         f"{compose_proj}_csplugin_data:/cs_data:ro",
         *network_args,
-        "-w",
-        "/home/agent",
-        dockercontainer,
-        "/cs/rcmd.sh",
-        urndname + ".sh",
-        str(no_x11),
-        str(savestate),
     ]
-    # dargs = ["docker", "exec", "kana",
-    #         "/cs/rcmd.sh", urndname + ".sh", str(no_x11), str(savestate)]
-    # print(" ".join(dargs))
-    p = Popen(
-        dargs, shell=shell, cwd="/cs", stdout=PIPE, stderr=PIPE, env=env
-    )  # , timeout=timeout)
+    rcmd_args = ["/cs/rcmd.sh", urndname + ".sh", str(no_x11), str(savestate)]
+    pool_config = get_pool_config()
+    pool = None
+    p = None
+    if pool_config.size > 0:
+        pool = ContainerPool(
+            get_pool_key(dockercontainer, run_args),
+            DockerBackend(dockercontainer, run_args),
+            pool_config,
+        )
+    else:
+        dargs = [
+            "docker",
+            "run",
+            "--name",
+            tmpname,
+            "--rm=true",
+            "--tmpfs",
+            "/cs",
+            "-v",
+            f"/tmp/{compose_proj}_uhome/{udir}/:/home/agent/",
+            *run_args,
+            "-w",
+            "/home/agent",
+            dockercontainer,
+            *rcmd_args,
+        ]
+        # print(" ".join(dargs))
+        p = Popen(
+            dargs, shell=shell, cwd="/cs", stdout=PIPE, stderr=PIPE, env=env
+        )  # , timeout=timeout)
     errcode = 0
     errtxt = ""
 
@@ -358,7 +378,13 @@ def run2(
         p, tmpname, [cwd + "/" + stdoutf, cwd + "/" + stderrf, cwd + "/pwd.txt"]
     ):
         try:
-            stdout, stderr = p.communicate(timeout=timeout)
+            if pool:
+                result = pool.run(cwd, rcmd_args, timeout, language)
+                if result.timed_out:
+                    raise subprocess.TimeoutExpired(rcmd_args, timeout)
+                stdout, stderr = result.stdout, result.stderr
+            else:
+                stdout, stderr = p.communicate(timeout=timeout)
             # print("stdout: ", stdout[:100])
             # print("stderr: ", stderr)
             # print("Run2 done!")
@@ -414,6 +440,13 @@ def run2(
             # print("stderr", stderr)
         except subprocess.TimeoutExpired:
             return -9, "", "", pwddir
+        except PoolBusy:
+            return (
+                -3,
+                "",
+                "Run error: Too many programs are running, please try again in a moment.",
+                pwddir,
+            )
         except OSError as e:
             return -2, "", ("IO Error" + str(e)), pwddir
     return errcode, stdout, errtxt + stderr, pwddir
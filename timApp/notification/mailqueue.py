@@ -0,0 +1,234 @@
+"""A queue for sending email over a small pool of persistent SMTP connections.
+
+Each worker thread owns one SMTP connection. A worker takes up to batch_size messages from the queue at a time
+and sends them over its connection, which is kept open until it has been idle for idle_timeout seconds.
+Sending is limited to rate_limit messages per second over all workers.
+
+Messages that fail because of a connection problem or a temporary (4xx) SMTP error are retried with an
+exponential backoff. Permanent errors are logged and the message is dropped.
+"""
+import atexit
+import os
+import queue
+import smtplib
+import threading
+import time
+from dataclasses import dataclass, field
+
+from timApp.util.logger import log_error, log_warning
+
+
+@dataclass(eq=False)
+class MailJob:
+    mail_from: str
+    rcpts: list[str]
+    message: str
+    attempt: int = 0
+    error: str | None = None
+    done: threading.Event = field(default_factory=threading.Event)
+
+    def join(self, timeout: float | None = None) -> bool:
+        """Waits until the message has been sent or dropped.
+
+        :return: True if the message was handled within the timeout.
+        """
+        return self.done.wait(timeout)
+
+
+class RateLimiter:
+    """A token bucket that allows rate events per second on average."""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.capacity = max(rate, 1)
+        self.tokens = self.capacity
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.last) * self.rate
+                )
+                self.last = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class MailQueue:
+    def __init__(
+        self,
+        host: str,
+        pool_size: int = 2,
+        batch_size: int = 50,
+        rate_limit: float = 0,
+        max_retries: int = 3,
+        retry_delay: float = 5,
+        idle_timeout: float = 30,
+        port: int = 0,
+    ):
+        self.host = host
+        self.port = port
+        self.pool_size = pool_size
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.idle_timeout = idle_timeout
+        self.limiter = RateLimiter(rate_limit)
+        self.queue: queue.Queue[MailJob] = queue.Queue()
+        self.pending: set[MailJob] = set()
+        self.lock = threading.Lock()
+        self.pid: int | None = None
+
+    def submit(self, mail_from: str, rcpts: list[str], message: str) -> MailJob:
+        """Queues a message for sending.
+
+        :param mail_from: The envelope sender.
+        :param rcpts: The envelope recipients.
+        :param message: The whole message including the headers.
+        :return: The job; call join to wait until the message has been sent.
+        """
+        self._ensure_started()
+        job = MailJob(mail_from, rcpts, message)
+        with self.lock:
+            self.pending.add(job)
+        self.queue.put(job)
+        return job
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """Waits until all submitted messages have been sent or dropped.
+
+        :return: True if everything was handled within the timeout.
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self.lock:
+            jobs = list(self.pending)
+        for job in jobs:
+            remaining = (
+                None if deadline is None else max(deadline - time.monotonic(), 0)
+            )
+            if not job.join(remaining):
+                return False
+        return True
+
+    def _ensure_started(self) -> None:
+        # Threads do not survive forking, so the workers are started lazily in each process.
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            self.pending.clear()
+            self.queue = queue.Queue()
+        for _ in range(self.pool_size):
+            threading.Thread(target=self._work, daemon=True).start()
+
+    def _work(self) -> None:
+        q = self.queue
+        conn: smtplib.SMTP | None = None
+        while True:
+            try:
+                job = q.get(timeout=self.idle_timeout if conn else None)
+            except queue.Empty:
+                conn = self._close(conn)
+                continue
+            batch = [job]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(q.get_nowait())
+                except queue.Empty:
+                    break
+            for job in batch:
+                self.limiter.acquire()
+                try:
+                    if conn is None:
+                        conn = smtplib.SMTP(self.host, self.port)
+                    conn.sendmail(job.mail_from, job.rcpts, job.message)
+                except (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError) as e:
+                    conn = self._close(conn)
+                    self._fail(job, str(e), retry=True)
+                except smtplib.SMTPResponseException as e:
+                    # A failed transaction leaves the connection usable; reset it for the next message.
+                    conn = self._reset(conn)
+                    self._fail(job, str(e), retry=400 <= e.smtp_code < 500)
+                except smtplib.SMTPException as e:
+                    conn = self._reset(conn)
+                    self._fail(job, str(e), retry=False)
+                except OSError as e:
+                    conn = self._close(conn)
+                    self._fail(job, str(e), retry=True)
+                except Exception as e:
+                    conn = self._close(conn)
+                    self._fail(job, str(e), retry=False)
+                else:
+                    self._finish(job)
+
+    def _fail(self, job: MailJob, error: str, retry: bool) -> None:
+        if retry and job.attempt < self.max_retries:
+            delay = self.retry_delay * 2**job.attempt
+            job.attempt += 1
+            log_warning(
+                f"Sending mail to {job.rcpts} failed, retrying in {delay} s: {error}"
+            )
+            timer = threading.Timer(delay, self.queue.put, (job,))
+            timer.daemon = True
+            timer.start()
+            return
+        log_error(f"Sending mail to {job.rcpts} failed: {error}")
+        job.error = error
+        self._finish(job)
+
+    def _finish(self, job: MailJob) -> None:
+        with self.lock:
+            self.pending.discard(job)
+        job.done.set()
+
+    @staticmethod
+    def _reset(conn: smtplib.SMTP | None) -> smtplib.SMTP | None:
+        if conn is None:
+            return None
+        try:
+            conn.rset()
+            return conn
+        except OSError:
+            return MailQueue._close(conn)
+
+    @staticmethod
+    def _close(conn: smtplib.SMTP | None) -> None:
+        if conn is None:
+            return None
+        try:
+            conn.quit()
+        except OSError:
+            conn.close()
+        return None
+
+
+_mail_queue: MailQueue | None = None
+_mail_queue_lock = threading.Lock()
+
+
+def get_mail_queue() -> MailQueue:
+    """Returns the mail queue of the process, configured from the app config."""
+    global _mail_queue
+    with _mail_queue_lock:
+        if _mail_queue is None:
+            from timApp.tim_app import app
+
+            _mail_queue = MailQueue(
+                host=app.config["MAIL_HOST"],
+                pool_size=app.config["MAIL_POOL_SIZE"],
+                batch_size=app.config["MAIL_BATCH_SIZE"],
+                rate_limit=app.config["MAIL_RATE_LIMIT"],
+                max_retries=app.config["MAIL_MAX_RETRIES"],
+                retry_delay=app.config["MAIL_RETRY_DELAY"],
+                idle_timeout=app.config["MAIL_IDLE_TIMEOUT"],
+            )
+            atexit.register(_mail_queue.flush, app.config["MAIL_EXIT_TIMEOUT"])
+        return _mail_queue
@@ -1,7 +1,6 @@
 import urllib.parse
 from collections import defaultdict
 from dataclasses import dataclass
-from threading import Thread
 from typing import DefaultDict, Callable
 
 from flask import current_app
@@ -28,12 +27,14 @@ from timApp.notification.pending_notification import (
     GroupingKey,
     AnswerNotification,
 )
+from timApp.notification.mailqueue import MailJob
 from timApp.notification.send_email import send_email
 from timApp.tim_app import app
 from timApp.timdb.exceptions import TimDbException
 from timApp.timdb.sqa import db, run_sql
 from timApp.user.user import User
 from timApp.util.flask.responsehelper import json_response, ok_response
+from timApp.util.flask.searchindex import update_search_index
 from timApp.util.flask.typedblueprint import TypedBlueprint
 from timApp.util.utils import get_current_time, seq_to_str
 
@@ -109,6 +110,7 @@ def notify_doc_watchers(
     me = curr_user if curr_user else get_current_user_object()
     new_version = doc.document.get_version()
     if notify_type.is_document_modification:
+        update_search_index([doc.id])
         p = DocumentNotification(
             user=me,
             doc_id=doc.id,
@@ -379,7 +381,7 @@ def force_process():
 def process_pending_notifications():
     pns = get_pending_notifications()
     grouped_pns: DefaultDict[GroupingKey, list[PendingNotification]] = defaultdict(list)
-    email_threads: list[Thread] = []
+    email_jobs: list[MailJob] = []
     for p in pns:
         grouped_pns[p.grouping_key].append(p)
     for (doc_id, t), ps in grouped_pns.items():
@@ -472,13 +474,13 @@ def process_pending_notifications():
                 reply_to=reply_to,
             )
             if result:
-                email_threads.append(result)
+                email_jobs.append(result)
         for p in ps:
             p.processed = get_current_time()
             # To save database space, we null the text for all document notifications.
             # The document history already exists elsewhere, so we don't need it to store it.
             if isinstance(p, DocumentNotification):
                 p.text = None
-    for t in email_threads:
-        t.join()
+    for j in email_jobs:
+        j.join()
     db.session.commit()
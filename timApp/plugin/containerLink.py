@@ -1,7 +1,8 @@
 import json
 import re
+import time
 from dataclasses import dataclass
-from functools import lru_cache
+from functools import lru_cache, partial
 from re import Pattern
 from typing import Any
 
@@ -12,10 +13,12 @@ from requests import Response
 from timApp.document.docsettings import DocSettings
 from timApp.plugin.plugin import Plugin, AUTOMD
 from timApp.plugin.pluginOutputFormat import PluginOutputFormat
+from timApp.plugin.pluginconnection import get_circuit_breaker, get_plugin_session
 from timApp.plugin.pluginexception import PluginException
 from timApp.plugin.timtable import timTable
 from timApp.util.locale import get_locale
 from timApp.util.logger import log_warning
+from timApp.util.timtiming import add_trace_time
 from tim_common.dumboclient import call_dumbo, DumboOptions
 from tim_common.timjsonencoder import TimJsonEncoder
 
@@ -272,7 +275,7 @@ def call_plugin_generic(
             headers = {}
         headers["Accept-Language"] = locale
     try:
-        r = do_request(method, url, data, params, headers, read_timeout)
+        r = do_request(plug.name, method, url, data, params, headers, read_timeout)
     except (
         requests.exceptions.ConnectTimeout,
         requests.exceptions.ConnectionError,
@@ -289,6 +292,7 @@ def call_plugin_generic(
 
 
 def do_request(
+    plugin: str,
     method: str,
     url: str,
     data: Any,
@@ -296,18 +300,62 @@ def do_request(
     headers: Any,
     read_timeout: int,
 ) -> requests.Response:
-    resp = requests.request(
-        method,
-        url,
-        data=data,
-        timeout=(current_app.config["PLUGIN_CONNECT_TIMEOUT"], read_timeout),
-        headers=headers,
-        params=params,
-    )
+    breaker = get_circuit_breaker(plugin)
+    if not breaker.allow_request():
+        raise PluginException(
+            f"Plugin {plugin} is temporarily unavailable. Please try again later."
+        )
+    connect_timeout = current_app.config["PLUGIN_CONNECT_TIMEOUT"]
+    start = time.perf_counter()
+    try:
+        resp = get_plugin_session(plugin).request(
+            method,
+            url,
+            data=data,
+            timeout=(connect_timeout, read_timeout),
+            headers=headers,
+            params=params,
+        )
+    except requests.exceptions.ConnectionError:
+        # This includes connect timeouts.
+        elapsed = time.perf_counter() - start
+        add_trace_time("plugin", elapsed)
+        record_plugin_failure(plugin, elapsed, connect_timeout)
+        raise
+    except requests.exceptions.ReadTimeout:
+        # The plugin accepted the request but the answer took too long, for example because a student's program ran
+        # until the plugin's own time limit. This does not mean that the plugin is down, so it is not a failure.
+        add_trace_time("plugin", time.perf_counter() - start)
+        raise
+    elapsed = time.perf_counter() - start
+    add_trace_time("plugin", elapsed)
+    if resp.status_code >= 500:
+        record_plugin_failure(plugin, elapsed, connect_timeout)
+    else:
+        breaker.record_success(elapsed)
     resp.encoding = "utf-8"
     return resp
 
 
+def record_plugin_failure(plugin: str, seconds: float, connect_timeout: float) -> None:
+    """Records a failed plugin call in the circuit breaker of the plugin, unless the breaker is disabled."""
+    threshold = current_app.config["PLUGIN_BREAKER_FAILURE_THRESHOLD"]
+    if threshold > 0:
+        get_circuit_breaker(plugin).record_failure(
+            seconds,
+            threshold=threshold,
+            probe=partial(probe_plugin, plugin, connect_timeout),
+            interval=current_app.config["PLUGIN_BREAKER_PROBE_INTERVAL"],
+        )
+
+
+def probe_plugin(plugin: str, connect_timeout: float) -> bool:
+    """Checks whether the plugin responds to the reqs route."""
+    url = get_plugin(plugin).host + "reqs"
+    r = get_plugin_session(plugin).get(url, timeout=(connect_timeout, 5))
+    return r.status_code < 500
+
+
 # Not used currently.
 plugin_request_fn = do_request
 
@@ -315,6 +363,20 @@ plugin_request_fn = do_request
 def render_plugin(
     docsettings: DocSettings, plugin: Plugin, output_format: PluginOutputFormat
 ) -> str:
+    return send_plugin_render(
+        plugin.type,
+        prepare_plugin_render(docsettings, plugin, output_format),
+        output_format,
+    )
+
+
+def prepare_plugin_render(
+    docsettings: DocSettings, plugin: Plugin, output_format: PluginOutputFormat
+) -> dict:
+    """Builds the data that is sent to the plugin for rendering a single block.
+
+    This may access the database, so it must be called in the request context.
+    """
     plugin_data = plugin.render_json()
     if docsettings.plugin_md():
         convert_md(
@@ -324,8 +386,15 @@ def render_plugin(
             ),
             outtype="md" if output_format == PluginOutputFormat.HTML else "latex",
         )
+    return plugin_data
+
+
+def send_plugin_render(
+    plugin: str, plugin_data: dict, output_format: PluginOutputFormat
+) -> str:
+    """Renders a single block prepared with :func:`prepare_plugin_render`. Does not access the database."""
     return call_plugin_generic(
-        plugin.type,
+        plugin,
         "post",
         output_format.value,
         data=json.dumps(plugin_data, cls=TimJsonEncoder),
@@ -442,6 +511,26 @@ def render_plugin_multi(
     plugin_output_format: PluginOutputFormat = PluginOutputFormat.HTML,
     default_auto_md: bool = False,
 ) -> str:
+    return send_plugin_render_multi(
+        plugin,
+        prepare_plugin_render_multi(
+            docsettings, plugin, plugin_data, plugin_output_format, default_auto_md
+        ),
+        plugin_output_format,
+    )
+
+
+def prepare_plugin_render_multi(
+    docsettings: DocSettings,
+    plugin: str,
+    plugin_data: list[Plugin],
+    plugin_output_format: PluginOutputFormat = PluginOutputFormat.HTML,
+    default_auto_md: bool = False,
+) -> list[dict]:
+    """Builds the data that is sent to the plugin for rendering several blocks at once.
+
+    This may access the database, so it must be called in the request context.
+    """
     opts = docsettings.get_dumbo_options()
     plugin_dumbo_opts = [p.par.get_dumbo_options(base_opts=opts) for p in plugin_data]
     plugin_dicts = [p.render_json() for p in plugin_data]
@@ -476,7 +565,26 @@ def render_plugin_multi(
             if plugin_output_format == PluginOutputFormat.HTML
             else "latex",
         )
+    return plugin_dicts
+
+
+def is_remote_render(plugin: str, plugin_output_format: PluginOutputFormat) -> bool:
+    """Returns whether rendering the plugin is done by an HTTP call instead of calling TIM's own plugin code."""
+    return not (
+        get_plugin(plugin).instance and plugin_output_format == PluginOutputFormat.HTML
+    )
+
 
+def send_plugin_render_multi(
+    plugin: str,
+    plugin_dicts: list[dict],
+    plugin_output_format: PluginOutputFormat = PluginOutputFormat.HTML,
+) -> str:
+    """Renders blocks prepared with :func:`prepare_plugin_render_multi`.
+
+    Remote plugins do not access the database, so they can be rendered concurrently.
+    """
+    plugin_reg = get_plugin(plugin)
     if plugin_reg.instance and plugin_output_format == PluginOutputFormat.HTML:
         return plugin_reg.instance.multihtml_direct_call(plugin_dicts)
 
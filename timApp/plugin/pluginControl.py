@@ -1,14 +1,19 @@
 """Functions for dealing with plugin paragraphs."""
 import json
+import time
 from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
 from dataclasses import dataclass
+from functools import partial
 from itertools import chain
-from typing import Optional, Union, DefaultDict
+from typing import Optional, Union, DefaultDict, Callable
 from xml.sax.saxutils import quoteattr
 
 import attr
 import yaml
 import yaml.parser
+from flask import current_app
 from sqlalchemy import func, select
 
 from timApp.answer.answer import Answer
@@ -24,7 +29,14 @@ from timApp.document.usercontext import UserContext
 from timApp.document.viewcontext import ViewContext
 from timApp.document.yamlblock import YamlBlock
 from timApp.plugin.containerLink import plugin_reqs, get_plugin
-from timApp.plugin.containerLink import render_plugin_multi, render_plugin, get_plugins
+from timApp.plugin.containerLink import (
+    get_plugins,
+    is_remote_render,
+    prepare_plugin_render,
+    prepare_plugin_render_multi,
+    send_plugin_render,
+    send_plugin_render_multi,
+)
 from timApp.plugin.plugin import (
     Plugin,
     PluginRenderOptions,
@@ -59,7 +71,7 @@ from timApp.util.utils import (
     get_error_html,
 )
 from tim_common.dumboclient import call_dumbo
-from tim_common.html_sanitize import sanitize_html
+from tim_common.html_sanitize import sanitize_html, sanitize_html_batch
 
 
 def get_error_plugin(
@@ -417,6 +429,55 @@ class PluginifyResult:
     has_errors: bool
 
 
+@dataclass
+class PluginRenderJob:
+    """A request for rendering one or more blocks of a single plugin."""
+
+    plugin_name: str
+    blocks: dict[KeyType, Plugin]
+    plugin_lazy: bool
+    multi: bool
+    """Whether the blocks are rendered with the multihtml/multimd route."""
+    remote: bool
+    """Whether the plugin is rendered by an HTTP call, which makes it safe to run concurrently."""
+    render: Callable[[], str]
+    result: str | None = None
+    error: PluginException | None = None
+    elapsed: float = 0.0
+
+    def run(self) -> None:
+        start = time.perf_counter()
+        try:
+            self.result = self.render()
+        except PluginException as e:
+            self.error = e
+        self.elapsed = time.perf_counter() - start
+
+
+def run_render_jobs(jobs: list[PluginRenderJob]) -> None:
+    """Runs the given render jobs, calling remote plugins concurrently.
+
+    Plugins that are part of TIM are rendered in the current thread because they may access the database.
+    The results are stored in the jobs, so they keep their order.
+    """
+    remote_jobs = [j for j in jobs if j.remote]
+    max_workers = min(current_app.config["PLUGIN_RENDER_CONCURRENCY"], len(remote_jobs))
+    if max_workers > 1:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # Each job gets a copy of the current context so that it can access the app and the request.
+            futures = [executor.submit(copy_context().run, j.run) for j in remote_jobs]
+            for j in jobs:
+                if not j.remote:
+                    j.run()
+            for f in futures:
+                f.result()
+    else:
+        for j in jobs:
+            j.run()
+    for j in jobs:
+        taketime("plg e", j.plugin_name, len(j.blocks), elapsed=j.elapsed)
+
+
 def pluginify(
     doc: Document,
     pars: list[DocParagraph],
@@ -464,8 +525,7 @@ def pluginify(
                 if p.is_translation_unchecked():
                     p.add_class("checktr")
     if sanitize:
-        for par in pars:
-            par.sanitize_html()
+        DocParagraph.sanitize_htmls(pars)
 
     # init these for performance as they stay the same for all pars
     md_out = output_format == PluginOutputFormat.MD
@@ -626,6 +686,7 @@ def pluginify(
     taketime("glb/ucu", "done")
     settings = doc.get_settings()
     all_plugins = []
+    render_jobs: list[PluginRenderJob] = []
     for plugin_name, plugin_block_map in plugins.items():
         taketime("plg", plugin_name)
         try:
@@ -679,42 +740,33 @@ def pluginify(
 
         if (html_out and reqs.get("multihtml")) or (md_out and reqs.get("multimd")):
             try:
-                # taketime("plg m", plugin_name)
-                response = render_plugin_multi(
+                plugin_dicts = prepare_plugin_render_multi(
                     settings,
                     plugin_name,
                     list(plugin_block_map.values()),
                     plugin_output_format=output_format,
                     default_auto_md=default_auto_md,
                 )
-                taketime("plg e", plugin_name)
             except PluginException as e:
                 has_errors = True
                 for idx, r in plugin_block_map.keys():
                     placements[idx].set_error(r, str(e))
                 continue
-            try:
-                plugin_htmls = json.loads(response)
-            except ValueError as e:
-                has_errors = True
-                for idx, r in plugin_block_map.keys():
-                    placements[idx].set_error(
-                        r, f"Failed to parse plugin response from multihtml route: {e}"
-                    )
-                continue
-            if not isinstance(plugin_htmls, list):
-                for (idx, r), plugin in plugin_block_map.items():
-                    plugin.plugin_lazy = plugin_lazy
-                    placements[idx].set_error(
-                        r,
-                        f"Multihtml response of {plugin_name} was not a list: {plugin_htmls}",
-                    )
-            else:
-                for ((idx, r), plugin), html in zip(
-                    plugin_block_map.items(), plugin_htmls
-                ):
-                    plugin.plugin_lazy = plugin_lazy
-                    placements[idx].set_output(r, html)
+            render_jobs.append(
+                PluginRenderJob(
+                    plugin_name=plugin_name,
+                    blocks=plugin_block_map,
+                    plugin_lazy=plugin_lazy,
+                    multi=True,
+                    remote=is_remote_render(plugin_name, output_format),
+                    render=partial(
+                        send_plugin_render_multi,
+                        plugin_name,
+                        plugin_dicts,
+                        output_format,
+                    ),
+                )
+            )
         else:
             for (idx, r), plugin in plugin_block_map.items():
                 if md_out:
@@ -726,16 +778,60 @@ def pluginify(
                     placements[idx].set_error(r, err_msg_md)
                 else:
                     try:
-                        html = render_plugin(
-                            docsettings=settings,
-                            plugin=plugin,
-                            output_format=output_format,
+                        plugin_data = prepare_plugin_render(
+                            settings, plugin, output_format
                         )
                     except PluginException as e:
                         has_errors = True
                         placements[idx].set_error(r, str(e))
                         continue
-                    placements[idx].set_output(r, html)
+                    render_jobs.append(
+                        PluginRenderJob(
+                            plugin_name=plugin_name,
+                            blocks={(idx, r): plugin},
+                            plugin_lazy=plugin_lazy,
+                            multi=False,
+                            remote=True,
+                            render=partial(
+                                send_plugin_render,
+                                plugin.type,
+                                plugin_data,
+                                output_format,
+                            ),
+                        )
+                    )
+
+    run_render_jobs(render_jobs)
+    for job in render_jobs:
+        if job.error is not None:
+            has_errors = True
+            for idx, r in job.blocks.keys():
+                placements[idx].set_error(r, str(job.error))
+            continue
+        if not job.multi:
+            ((idx, r),) = job.blocks.keys()
+            placements[idx].set_output(r, job.result)
+            continue
+        try:
+            plugin_htmls = json.loads(job.result)
+        except ValueError as e:
+            has_errors = True
+            for idx, r in job.blocks.keys():
+                placements[idx].set_error(
+                    r, f"Failed to parse plugin response from multihtml route: {e}"
+                )
+            continue
+        if not isinstance(plugin_htmls, list):
+            for (idx, r), plugin in job.blocks.items():
+                plugin.plugin_lazy = job.plugin_lazy
+                placements[idx].set_error(
+                    r,
+                    f"Multihtml response of {job.plugin_name} was not a list: {plugin_htmls}",
+                )
+        else:
+            for ((idx, r), plugin), html in zip(job.blocks.items(), plugin_htmls):
+                plugin.plugin_lazy = job.plugin_lazy
+                placements[idx].set_output(r, html)
     taketime("plg m", "Plugins done")
 
     taketime("plc", "Placement start")
@@ -759,15 +855,18 @@ def pluginify(
             htmls_to_dumbo.append({"content": html_pars[k].output, **v.dict()})
             settings_to_dumbo.append(v)
         taketime("dumbo", "start 2")
-        for h, (idx, s) in zip(
+        dumbo_htmls = []
+        for h, idx in zip(
             call_dumbo(htmls_to_dumbo, options=doc.get_settings().get_dumbo_options()),
-            dumbo_opts.items(),
+            dumbo_opts.keys(),
         ):
             par = html_pars[idx]
             for plugin_key, plugin_html in par.plugin_htmls.items():
                 h = h.replace(plugin_key, plugin_html)
             par.plugin_htmls = None
-            par.output = sanitize_html(h)
+            dumbo_htmls.append(h)
+        for h, idx in zip(sanitize_html_batch(dumbo_htmls), dumbo_opts.keys()):
+            html_pars[idx].output = h
     elif output_format == PluginOutputFormat.MD:
         # No dumbo, just insert raw MD
         for par in html_pars:
@@ -0,0 +1,179 @@
+"""Pooled HTTP sessions, circuit breakers and latency statistics for plugin calls.
+
+Everything here is per worker process. Each plugin has its own keep-alive session and circuit breaker.
+
+A breaker opens after a number of consecutive connection failures, connect timeouts or server errors. Read timeouts do
+not count, because a slow answer usually comes from the task (for example a long-running student program) and not from
+a broken plugin. While a breaker is open, calls to the plugin fail immediately instead of waiting for the timeout, so a hanging plugin container does not stall every page that
+embeds it. A background task probes the plugin periodically and closes the breaker once the plugin responds again.
+"""
+
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Any, Callable
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from timApp.util.logger import log_info, log_warning
+
+# Upper bounds of the latency histogram buckets in milliseconds. The last bucket is unbounded.
+LATENCY_BUCKETS_MS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000]
+
+SESSION_POOL_SIZE = 32
+
+
+class LatencyHistogram:
+    def __init__(self) -> None:
+        self.counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.total = 0
+        self.sum_ms = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float) -> None:
+        ms = seconds * 1000
+        with self._lock:
+            self.counts[bisect_left(LATENCY_BUCKETS_MS, ms)] += 1
+            self.total += 1
+            self.sum_ms += ms
+
+    def to_json(self) -> dict[str, Any]:
+        with self._lock:
+            buckets = {
+                f"le_{bound}": count
+                for bound, count in zip(LATENCY_BUCKETS_MS, self.counts)
+            }
+            buckets["inf"] = self.counts[-1]
+            return {
+                "count": self.total,
+                "sum_ms": round(self.sum_ms, 1),
+                "buckets": buckets,
+            }
+
+
+class PluginCircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+
+    def __init__(self, plugin: str) -> None:
+        self.plugin = plugin
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at: float | None = None
+        self.rejected = 0
+        self.failures = 0
+        self.latency = LatencyHistogram()
+        self._lock = threading.Lock()
+
+    def allow_request(self) -> bool:
+        if self.state == self.OPEN:
+            with self._lock:
+                self.rejected += 1
+            return False
+        return True
+
+    def record_success(self, seconds: float) -> None:
+        self.latency.observe(seconds)
+        with self._lock:
+            self.consecutive_failures = 0
+
+    def record_failure(
+        self, seconds: float, threshold: int, probe: Callable[[], bool], interval: float
+    ) -> None:
+        """Records a connection failure, a connect timeout or a server error and opens the breaker if there are too
+        many of them.
+
+        :param seconds: The duration of the failed call.
+        :param threshold: The number of consecutive failures that opens the breaker.
+        :param probe: A function that checks whether the plugin responds again.
+        :param interval: Seconds between the probes.
+        """
+        self.latency.observe(seconds)
+        with self._lock:
+            self.failures += 1
+            self.consecutive_failures += 1
+            if self.state == self.OPEN or self.consecutive_failures < threshold:
+                return
+            self.state = self.OPEN
+            self.opened_at = time.time()
+        log_warning(
+            f"Circuit breaker for plugin {self.plugin} opened after {threshold} consecutive failures"
+        )
+        threading.Thread(
+            target=self._probe_until_recovered, args=(probe, interval), daemon=True
+        ).start()
+
+    def _probe_until_recovered(
+        self, probe: Callable[[], bool], interval: float
+    ) -> None:
+        while True:
+            time.sleep(interval)
+            try:
+                recovered = probe()
+            except Exception:
+                recovered = False
+            if recovered:
+                break
+        with self._lock:
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+            self.opened_at = None
+        log_info(f"Circuit breaker for plugin {self.plugin} closed")
+
+    def to_json(self) -> dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "opened_at": self.opened_at,
+            "failures": self.failures,
+            "rejected": self.rejected,
+            "latency": self.latency.to_json(),
+        }
+
+
+_sessions: dict[str, requests.Session] = {}
+_breakers: dict[str, PluginCircuitBreaker] = {}
+_pid: int | None = None
+_registry_lock = threading.Lock()
+
+
+def _reset_after_fork() -> None:
+    global _pid
+    pid = os.getpid()
+    if _pid != pid:
+        _sessions.clear()
+        _breakers.clear()
+        _pid = pid
+
+
+def get_plugin_session(plugin: str) -> requests.Session:
+    """Returns the keep-alive session of the given plugin."""
+    with _registry_lock:
+        _reset_after_fork()
+        session = _sessions.get(plugin)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=SESSION_POOL_SIZE)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _sessions[plugin] = session
+        return session
+
+
+def get_circuit_breaker(plugin: str) -> PluginCircuitBreaker:
+    with _registry_lock:
+        _reset_after_fork()
+        breaker = _breakers.get(plugin)
+        if breaker is None:
+            breaker = PluginCircuitBreaker(plugin)
+            _breakers[plugin] = breaker
+        return breaker
+
+
+def get_plugin_connection_stats() -> dict[str, dict[str, Any]]:
+    """Returns the circuit breaker state and latency histogram of each plugin called by this process."""
+    with _registry_lock:
+        _reset_after_fork()
+        return {name: b.to_json() for name, b in sorted(_breakers.items())}
@@ -22,7 +22,12 @@ plugin_bp = Blueprint("plugin", __name__, url_prefix="")
 
 
 def return_resource_response(resp):
-    headers = {k: v for k, v in resp.headers.items() if k not in ("transfer-encoding",)}
+    # X-Accel-Redirect would make Caddy send a file from the TIM files directory without access checks.
+    headers = {
+        k: v
+        for k, v in resp.headers.items()
+        if k.lower() not in ("transfer-encoding", "x-accel-redirect")
+    }
     return resp.raw.read(), resp.status_code, headers
 
 
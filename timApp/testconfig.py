@@ -55,7 +55,13 @@ SESSION_COOKIE_SECURE = (
 
 MINIMUM_SCHEDULED_FUNCTION_INTERVAL = 1
 
+# Celery workers are not running in tests.
+GEN_CACHE_CELERY = False
+SEARCH_INDEX_UPDATE_CELERY = False
+
 INTERNAL_PLUGIN_DOMAIN = "localhost"
+# Some plugins are not running in the test environment, so their errors must stay the same in every test.
+PLUGIN_BREAKER_FAILURE_THRESHOLD = 0
 
 MESSAGE_LISTS_ENABLED = True
 MAILMAN_URL = "http://mailman-test:8001/3.1"
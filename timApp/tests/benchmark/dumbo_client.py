@@ -0,0 +1,117 @@
+"""Benchmarks Dumbo calls against a local mock Dumbo server.
+
+The mock server handles each request in its own thread and sleeps for a fixed time per converted item to simulate
+Pandoc, so it shows the effect of connection reuse and of converting chunks concurrently. Run with::
+
+    python -m timApp.tests.benchmark.dumbo_client --items 2000
+"""
+
+import argparse
+import json
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable
+
+import requests
+
+from tim_common import dumboclient
+from tim_common.dumboclient import call_dumbo, DumboOptions
+
+
+class MockDumboHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately, which would otherwise stall keep-alive connections.
+    disable_nagle_algorithm = True
+    item_delay = 0.0
+
+    def do_POST(self) -> None:
+        length = int(self.headers["Content-Length"])
+        content = json.loads(self.rfile.read(length))["content"]
+        time.sleep(self.item_delay * len(content))
+        body = json.dumps(
+            [f"<p>{c if isinstance(c, str) else c['content']}</p>" for c in content]
+        ).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+def start_mock_server(item_delay: float) -> ThreadingHTTPServer:
+    MockDumboHandler.item_delay = item_delay
+    server = ThreadingHTTPServer(("127.0.0.1", 0), MockDumboHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def call_unpooled(data: list[str]) -> list[str]:
+    """The previous implementation: one request with a fresh connection."""
+    r = requests.post(
+        url=dumboclient.DUMBO_URL,
+        data=json.dumps({"content": data, **DumboOptions.default().dict()}),
+    )
+    return r.json()
+
+
+def measure(name: str, fn: Callable[[], object], rounds: int) -> None:
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    print(
+        f"{name:<28} median {statistics.median(timings) * 1000:8.1f} ms, "
+        f"min {min(timings) * 1000:8.1f} ms"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--items", type=int, default=2000)
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument(
+        "--item-delay",
+        type=float,
+        default=0.0005,
+        help="Simulated conversion time per item in seconds",
+    )
+    args = parser.parse_args()
+
+    server = start_mock_server(args.item_delay)
+    dumboclient.DUMBO_URL = f"http://127.0.0.1:{server.server_port}"
+    large = [f"paragraph {i}" for i in range(args.items)]
+    small = large[:1]
+    try:
+        measure(
+            "single item, new connection",
+            lambda: [call_unpooled(small) for _ in range(50)],
+            args.rounds,
+        )
+        measure(
+            "single item, pooled",
+            lambda: [call_dumbo(small) for _ in range(50)],
+            args.rounds,
+        )
+        measure(
+            f"{args.items} items, one request",
+            lambda: call_unpooled(large),
+            args.rounds,
+        )
+        assert call_dumbo(large) == call_unpooled(large)
+        measure(
+            f"{args.items} items, chunked",
+            lambda: call_dumbo(large),
+            args.rounds,
+        )
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
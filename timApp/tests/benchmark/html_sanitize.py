@@ -0,0 +1,123 @@
+"""Benchmarks sanitize_html against the memoized and batch versions.
+
+By default, the fragments are typical paragraph HTML generated by Dumbo (headings, lists, code, tables, math as
+SVG data URLs and plugin placeholders). To use a real document, save the HTML of a document view page
+(e.g. /view/<path>) and pass it with --html; the contents of its paragraphs are used as the fragments.
+Run inside the TIM container with::
+
+    python -m timApp.tests.benchmark.html_sanitize --html document.html
+"""
+
+import argparse
+import statistics
+import time
+from typing import Callable
+
+from lxml.html import document_fromstring, tostring
+
+from tim_common.html_sanitize import (
+    c_no_style,
+    get_sanitize_cache,
+    sanitize_html,
+    sanitize_html_batch,
+    sanitize_with_cleaner,
+)
+
+SAMPLE_FRAGMENTS = [
+    '<h1 id="introduction">Introduction</h1>',
+    "<p>This is a paragraph with <strong>bold</strong>, <em>italic</em> and "
+    '<a href="https://tim.jyu.fi/">a link</a>.</p>',
+    "<ul>\n<li>First item</li>\n<li>Second item with <code>code</code></li>\n"
+    "<li>Third item</li>\n</ul>",
+    '<div class="sourceCode" id="cb1"><pre class="sourceCode java"><code class="sourceCode java">'
+    '<span id="cb1-1"><span class="kw">public</span> <span class="dt">static</span> '
+    '<span class="dt">void</span> <span class="fu">main</span>(String[] args) {</span>\n'
+    '<span id="cb1-2">    System.<span class="fu">out</span>.<span class="fu">println</span>'
+    '(<span class="st">&quot;Hello&quot;</span>);</span>\n<span id="cb1-3">}</span></code></pre></div>',
+    "<table>\n<thead>\n<tr><th>Name</th><th>Points</th></tr>\n</thead>\n<tbody>\n"
+    "<tr><td>Task 1</td><td>2</td></tr>\n<tr><td>Task 2</td><td>3</td></tr>\n</tbody>\n</table>",
+    '<p>The formula <span class="math inline"><img style="width:5em" '
+    'src="data:image/svg+xml;base64,PHN2ZyB4bWxucz0iaHR0cDovL3d3dy53My5vcmcvMjAwMC9zdmciPjwvc3ZnPg=="'
+    ' title="x^2 + y^2"></span> is shown as an image.</p>',
+    '<tim-plugin-loader type="full" answer-id="" class="csRunDiv" task-id="1.t1" plugin="/cs">'
+    '<div id="1.t1" data-plugin="/cs"><cs-runner json="eyJtYXJrdXAiOiB7fX0="></cs-runner></div>'
+    "</tim-plugin-loader>",
+    '<blockquote>\n<p>A quote with <span class="red">a class</span>.</p>\n</blockquote>',
+]
+
+
+def read_document_fragments(path: str) -> list[str]:
+    with open(path, encoding="utf-8") as f:
+        doc = document_fromstring(f.read())
+    fragments = []
+    for el in doc.find_class("parContent"):
+        fragments.append(
+            (el.text or "")
+            + "".join(tostring(c, encoding="unicode") for c in el.iterchildren())
+        )
+    return fragments
+
+
+def measure(name: str, fn: Callable[[], object], rounds: int, cold: bool) -> None:
+    timings = []
+    for _ in range(rounds):
+        if cold:
+            get_sanitize_cache().clear()
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    print(
+        f"{name:<28} median {statistics.median(timings) * 1000:8.1f} ms, "
+        f"min {min(timings) * 1000:8.1f} ms"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--html", help="HTML of a document view page")
+    parser.add_argument(
+        "--pars", type=int, default=1000, help="Number of sample paragraphs"
+    )
+    parser.add_argument("--rounds", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.html:
+        fragments = read_document_fragments(args.html)
+    else:
+        fragments = [
+            # Each fragment is unique so that the cold cache results are not affected by duplicates.
+            f"<p>Paragraph {i}.</p>\n{SAMPLE_FRAGMENTS[i % len(SAMPLE_FRAGMENTS)]}"
+            for i in range(args.pars)
+        ]
+    print(f"{len(fragments)} fragments, {sum(map(len, fragments))} characters")
+    assert sanitize_html_batch(fragments) == [
+        sanitize_with_cleaner(f, c_no_style) for f in fragments
+    ]
+    measure(
+        "uncached",
+        lambda: [sanitize_with_cleaner(f, c_no_style) for f in fragments],
+        args.rounds,
+        cold=True,
+    )
+    measure(
+        "batch, cold cache",
+        lambda: sanitize_html_batch(fragments),
+        args.rounds,
+        cold=True,
+    )
+    measure(
+        "single, warm cache",
+        lambda: [sanitize_html(f) for f in fragments],
+        args.rounds,
+        cold=False,
+    )
+    measure(
+        "batch, warm cache",
+        lambda: sanitize_html_batch(fragments),
+        args.rounds,
+        cold=False,
+    )
+
+
+if __name__ == "__main__":
+    main()
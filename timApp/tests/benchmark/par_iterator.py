@@ -0,0 +1,89 @@
+"""Benchmarks the native (Rust) paragraph reader against the Python reader.
+
+A synthetic document is written to a temporary files directory, so no database is needed.
+Run inside the TIM container with::
+
+    python -m timApp.tests.benchmark.par_iterator --pars 5000
+"""
+
+import argparse
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable
+
+from timApp.document.docparagraph import DocParagraph
+from timApp.document.document import (
+    Document,
+    DocParagraphIter,
+    ParallelParagraphIter,
+    read_all_blocks,
+)
+from timApp.document.parcache import get_paragraph_cache
+from timApp.document.randutils import random_paragraph
+from timApp.tim_app import app
+from timApp.timdb.dbaccess import get_files_path
+
+DOC_ID = 1
+
+
+def create_synthetic_document(num_pars: int) -> None:
+    d = Document(DOC_ID)
+    d.create()
+    lines = []
+    for i in range(num_pars):
+        md = f"# Heading {i}" if i % 20 == 0 else random_paragraph()
+        p = DocParagraph.create(doc=d, md=md, attrs={"classes": ["c"]})
+        p.store()
+        p.set_latest()
+        lines.append(f"{p.get_id()}/{p.get_hash()}\n")
+    (d.get_doc_dir() / "1").mkdir()
+    (d.get_doc_dir() / "1" / "0").write_text("".join(lines))
+
+
+def measure(
+    name: str,
+    iter_factory: Callable[[Document], object],
+    rounds: int,
+    warm: bool,
+) -> None:
+    timings = []
+    for _ in range(rounds):
+        if not warm:
+            get_paragraph_cache().clear()
+        d = Document(DOC_ID)
+        start = time.perf_counter()
+        count = sum(1 for _ in iter_factory(d))
+        timings.append(time.perf_counter() - start)
+    cache = "warm" if warm else "cold"
+    print(
+        f"{name:<8} {cache} process cache: {count} pars, "
+        f"median {statistics.median(timings) * 1000:.1f} ms, "
+        f"min {min(timings) * 1000:.1f} ms"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pars", type=int, default=5000)
+    parser.add_argument("--rounds", type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as files_dir, app.app_context():
+        app.config["FILES_PATH"] = files_dir
+        get_files_path.cache_clear()
+        assert get_files_path() == Path(files_dir)
+        print(f"Creating a document with {args.pars} paragraphs in {files_dir}")
+        create_synthetic_document(args.pars)
+
+        for warm in (False, True):
+            measure("python", DocParagraphIter, args.rounds, warm)
+            if read_all_blocks is not None:
+                measure("native", ParallelParagraphIter, args.rounds, warm)
+        if read_all_blocks is None:
+            print("tim_rust is not available; native reader was not measured")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+from unittest.mock import patch
+
+from timApp.document.automacrocache import (
+    VersionedParCache,
+    get_cached_auto_macros,
+)
+from timApp.document.docparagraph import DocParagraph
+from timApp.document.document import Document
+from timApp.document.viewcontext import default_view_ctx
+from timApp.tests.db.timdbtest import TimDbTest
+
+
+class AutoMacroCacheTest(TimDbTest):
+    def test_flush_does_not_overwrite(self):
+        c1 = VersionedParCache("test", 1, (1, 0))
+        c1.clear()
+        c2 = VersionedParCache("test", 1, (1, 0))
+        c1["a"] = {"h": {1: 1}}
+        c2["a"] = {"h": {1: 2}}
+        c2["b"] = []
+        c1.flush()
+        c2.flush()
+        loaded = VersionedParCache("test", 1, (1, 0)).load()
+        self.assertEqual({"a": {"h": {1: 1}}, "b": []}, dict(loaded.items()))
+        self.assertEqual(
+            {"b": []}, dict(VersionedParCache("test", 1, (1, 0)).load(["b"]).items())
+        )
+        self.assertEqual({}, dict(VersionedParCache("test", 1, (2, 0)).load().items()))
+        loaded.clear()
+        self.assertEqual({}, dict(VersionedParCache("test", 1, (1, 0)).load().items()))
+
+    def test_preload_stores_auto_macros(self):
+        d = self.create_doc().document
+        d.add_paragraph("# First")
+        p = d.add_paragraph("# Second")
+        d.get_paragraph(p.get_id()).get_html(default_view_ctx, no_persist=False)
+        self.assertEqual(
+            {1: 1, 2: 0, 3: 0, 4: 0, 5: 0, 6: 0},
+            get_cached_auto_macros(d.doc_id, d.get_version(), p.get_id())["h"],
+        )
+
+    def test_incremental_recomputation(self):
+        d = self.create_doc().document
+        pars = [d.add_paragraph(f"# Heading {i}\n\ntext") for i in range(20)]
+        DocParagraph.preload_htmls(
+            d.get_paragraphs(), d.get_settings(), default_view_ctx
+        )
+
+        def get_h(par_id):
+            return get_cached_auto_macros(d.doc_id, d.get_version(), par_id)["h"][1]
+
+        self.assertEqual(19, get_h(pars[-1].get_id()))
+
+        # Editing a paragraph without changing its headings only recomputes the next paragraph.
+        d.modify_paragraph(pars[5].get_id(), "# Heading 5 edited\n\ntext")
+        d.clear_mem_cache()
+        with patch.object(
+            Document,
+            "get_previous_par",
+            autospec=True,
+            side_effect=Document.get_previous_par,
+        ) as m:
+            DocParagraph.preload_htmls(
+                d.get_paragraphs(), d.get_settings(), default_view_ctx
+            )
+        self.assertEqual(1, m.call_count)
+        self.assertEqual(19, get_h(pars[-1].get_id()))
+
+        # Removing a heading changes the values of all the following paragraphs.
+        d.modify_paragraph(pars[10].get_id(), "text")
+        d.clear_mem_cache()
+        DocParagraph.preload_htmls(
+            d.get_paragraphs(), d.get_settings(), default_view_ctx
+        )
+        self.assertEqual(10, get_h(pars[10].get_id()))
+        self.assertEqual(10, get_h(pars[11].get_id()))
+        self.assertEqual(18, get_h(pars[-1].get_id()))
+
+        new_par = d.insert_paragraph("# Inserted", insert_before_id=pars[3].get_id())
+        d.clear_mem_cache()
+        DocParagraph.preload_htmls(
+            d.get_paragraphs(), d.get_settings(), default_view_ctx
+        )
+        self.assertEqual(3, get_h(new_par.get_id()))
+        self.assertEqual(4, get_h(pars[3].get_id()))
+        self.assertEqual(19, get_h(pars[-1].get_id()))
@@ -1,14 +1,24 @@
 """Unit tests for Document class.
 """
 
+import os
 import random
-
-from timApp.document.document import Document
+import unittest
+
+from timApp.document.docparagraph import DocParagraph
+from timApp.document.document import (
+    Document,
+    DocParagraphIter,
+    ParallelParagraphIter,
+    read_all_blocks,
+)
 from timApp.document.documentparser import DocumentParser
 from timApp.document.documents import import_document_from_file
 from timApp.document.documentwriter import DocumentWriter
 from timApp.document.exceptions import DocExistsError
+from timApp.document.parcache import get_paragraph_cache
 from timApp.document.randutils import random_paragraph
+from timApp.document.versionstore import SNAPSHOT_INTERVAL
 from timApp.document.viewcontext import default_view_ctx
 from timApp.tests.db.timdbtest import TimDbTest
 from timApp.timdb.exceptions import TimDbException
@@ -483,3 +493,150 @@ a: 1
         self.assertEqual({"x": 2, "source_document": 10}, s2.get_dict())
         self.assertIsNone(src1)
         self.assertEqual(10, src2.doc_id)
+
+    def test_changelog_newest_first(self):
+        d = self.create_doc().document
+        pars = [d.add_paragraph(random_paragraph()) for _ in range(0, 5)]
+        d.modify_paragraph(pars[0].get_id(), "modified")
+        entries = d.get_changelog(2).entries
+        self.assertEqual(2, len(entries))
+        self.assertEqual((5, 1), tuple(entries[0].version))
+        self.assertEqual((5, 0), tuple(entries[1].version))
+        self.assertEqual(6, len(d.get_changelog(-1).entries))
+        self.assertEqual([], d.get_changelog(0).entries)
+
+    def test_changelog_legacy_migration(self):
+        d = self.create_doc().document
+        for _ in range(0, 3):
+            d.add_paragraph(random_paragraph())
+        clf = d.get_changelog_file()
+        old_lines = clf.read_newest(-1)
+        clf.legacy_path.write_text("\n".join(old_lines) + "\n")
+        clf.log_path.unlink()
+        clf.index_path.unlink()
+
+        self.assertEqual(3, len(d.get_changelog().entries))
+        self.assertFalse(clf.legacy_path.exists())
+        d.add_paragraph("new")
+        entries = d.get_changelog(2).entries
+        self.assertEqual((4, 0), tuple(entries[0].version))
+        self.assertEqual((3, 0), tuple(entries[1].version))
+
+    def test_version_deltas(self):
+        d = self.create_doc().document
+        pars = [d.add_paragraph(random_paragraph()) for _ in range(0, 5)]
+        store = d.get_version_store()
+        self.assertFalse(store.is_delta((1, 0)))
+        self.assertTrue(store.is_delta((5, 0)))
+        expected = {}
+        for i in range(0, SNAPSHOT_INTERVAL + 5):
+            d.modify_paragraph(pars[i % 5].get_id(), f"text {i}")
+            expected[d.get_version()] = d.export_markdown()
+        d.delete_paragraph(pars[0].get_id())
+        d.insert_paragraph("inserted", insert_after_id=pars[2].get_id())
+        expected[d.get_version()] = d.export_markdown()
+        self.assertTrue(
+            any(not store.is_delta(v) for v in expected), "no snapshot was written"
+        )
+        for ver, md in expected.items():
+            self.assertEqual(md, d.get_doc_version(ver).export_markdown())
+
+        converted, _ = store.compact(keep_materialized=d.get_version())
+        self.assertEqual(0, converted)
+        d.clear_mem_cache()
+        for ver, md in expected.items():
+            self.assertEqual(md, d.get_doc_version(ver).export_markdown())
+
+    def test_version_stale_document(self):
+        d = self.create_doc().document
+        p1 = d.add_paragraph("first")
+        p2 = d.add_paragraph("second")
+        other = Document(d.doc_id)
+        other.get_version()
+        other.ensure_par_ids_loaded()
+        # The other object has not seen these edits, but its own edits are computed from the latest version.
+        d.delete_paragraph(p1.get_id())
+        d.modify_paragraph(p2.get_id(), "second changed")
+        other.add_paragraph("third")
+        other.modify_paragraph(p2.get_id(), "second again")
+        d.clear_mem_cache()
+        self.assertEqual(
+            ["second again", "third"], [p.get_markdown() for p in d.get_paragraphs()]
+        )
+        self.assertEqual((4, 1), d.get_version())
+        with self.assertRaises(ValueError):
+            d.get_version_store().write_version((4, 1), (4, 0), [], [])
+
+    def test_version_materialized_latest_only(self):
+        d = self.create_doc().document
+        pars = [d.add_paragraph(random_paragraph()) for _ in range(0, 5)]
+        store = d.get_version_store()
+        materialized = store.get_materialized_dir()
+        for i in range(0, 3):
+            # Older versions are rebuilt in memory.
+            d.get_doc_version((i + 2, 0)).export_markdown()
+            self.assertEqual([], list(materialized.glob("*/*")))
+            path = d.get_version_path()
+            self.assertEqual(store.get_materialized_file(d.get_version()), path)
+            self.assertEqual([path], list(materialized.glob("*/*")))
+            d.modify_paragraph(pars[i].get_id(), f"text {i}")
+            self.assertEqual([], list(materialized.glob("*/*")))
+
+    def test_version_compact_full_copies(self):
+        d = self.create_doc().document
+        for _ in range(0, 5):
+            d.add_paragraph(random_paragraph())
+        store = d.get_version_store()
+        expected = {}
+        for ver in store.list_versions():
+            path = store.get_version_file(ver)
+            path.write_text("".join(l + "\n" for l in store.read_lines(ver)))
+            expected[ver] = d.get_doc_version(ver).export_markdown()
+        converted, saved = store.compact()
+        self.assertEqual(4, converted)
+        self.assertGreater(saved, 0)
+        for ver, md in expected.items():
+            self.assertEqual(md, d.get_doc_version(ver).export_markdown())
+
+    def test_paragraph_cache(self):
+        d = self.create_doc().document
+        p = d.add_paragraph("cached", attrs={"classes": ["a"]})
+        cache = get_paragraph_cache()
+        hits = cache.hits
+        p1 = DocParagraph.get(d, p.get_id(), p.get_hash())
+        p2 = DocParagraph.get(d, p.get_id(), p.get_hash())
+        self.assertEqual(hits + 2, cache.hits)
+        self.assertEqual("cached", p1.get_markdown())
+        p1.add_class("b")
+        self.assertEqual(["a"], p2.classes)
+        self.assertEqual(["a"], DocParagraph.get(d, p.get_id(), p.get_hash()).classes)
+
+    @unittest.skipIf(read_all_blocks is None, "tim_rust is not available")
+    def test_native_iterator(self):
+        d = self.create_doc().document
+        pars = [d.add_paragraph(random_paragraph()) for _ in range(0, 10)]
+        get_paragraph_cache().clear()
+        d.clear_mem_cache()
+        d.get_paragraph(pars[3].get_id())
+        native = list(ParallelParagraphIter(d))
+        self.assertEqual([p.get_id() for p in pars], [p.get_id() for p in native])
+        self.assertEqual(
+            [p.get_markdown() for p in pars], [p.get_markdown() for p in native]
+        )
+        self.assertIs(d.single_par_cache[pars[3].get_id()], native[3])
+        d.clear_mem_cache()
+        python = list(DocParagraphIter(d))
+        self.assertEqual([p.get_hash() for p in native], [p.get_hash() for p in python])
+
+    @unittest.skipIf(read_all_blocks is None, "tim_rust is not available")
+    def test_native_iterator_missing_file(self):
+        d = self.create_doc().document
+        pars = [d.add_paragraph(random_paragraph()) for _ in range(0, 3)]
+        get_paragraph_cache().clear()
+        d.clear_mem_cache()
+        os.remove(pars[1].get_path())
+        with self.assertRaises(TimDbException):
+            list(ParallelParagraphIter(d))
+        self.assertNotIn(
+            (d.doc_id, pars[1].get_id(), pars[1].get_hash()), get_paragraph_cache()
+        )
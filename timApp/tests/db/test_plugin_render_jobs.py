@@ -0,0 +1,51 @@
+import threading
+import time
+
+from timApp.plugin.pluginControl import PluginRenderJob, run_render_jobs
+from timApp.plugin.pluginexception import PluginException
+from timApp.tests.db.timdbtest import TimDbTest
+
+
+class PluginRenderJobsTest(TimDbTest):
+    def make_job(self, name: str, render, remote=True) -> PluginRenderJob:
+        return PluginRenderJob(
+            plugin_name=name,
+            blocks={},
+            plugin_lazy=False,
+            multi=False,
+            remote=remote,
+            render=render,
+        )
+
+    def test_remote_jobs_run_concurrently(self):
+        main_thread = threading.get_ident()
+        threads = {}
+
+        def render(name, delay):
+            def f():
+                time.sleep(delay)
+                threads[name] = threading.get_ident()
+                return name
+
+            return f
+
+        def fail():
+            raise PluginException("broken")
+
+        jobs = [
+            self.make_job("slow", render("slow", 0.3)),
+            self.make_job("local", render("local", 0), remote=False),
+            self.make_job("fast", render("fast", 0.1)),
+            self.make_job("broken", fail),
+            self.make_job("slow2", render("slow2", 0.3)),
+        ]
+        start = time.perf_counter()
+        run_render_jobs(jobs)
+        self.assertLess(time.perf_counter() - start, 0.6)
+        self.assertEqual(
+            ["slow", "local", "fast", None, "slow2"], [j.result for j in jobs]
+        )
+        self.assertEqual("broken", str(jobs[3].error))
+        self.assertEqual(main_thread, threads["local"])
+        self.assertNotEqual(main_thread, threads["slow"])
+        self.assertGreaterEqual(jobs[0].elapsed, 0.3)
@@ -1,4 +1,3 @@
-import glob
 import os
 import sys
 import unittest
@@ -13,6 +12,7 @@ import timApp.timdb.init
 from timApp.document.docentry import DocEntry
 from timApp.document.docinfo import DocInfo
 from timApp.document.document import Document
+from timApp.document.parcache import get_paragraph_cache
 from timApp.messaging.messagelist.listinfo import Channel
 from timApp.tim_app import app
 from timApp.timdb.sqa import db
@@ -20,6 +20,7 @@ from timApp.user.user import User
 from timApp.user.usercontact import ContactOrigin
 from timApp.user.usergroup import UserGroup
 from timApp.util.filemodehelper import change_permission_and_retry
+from timApp.util.redisclient import rclient
 from timApp.util.utils import del_content, remove_prefix, temp_folder_path
 
 
@@ -35,12 +36,12 @@ class TimDbTest(unittest.TestCase):
             # Safety mechanism
             assert cls.test_files_path.as_posix() != "/tim_files"
             del_content(cls.test_files_path, onerror=change_permission_and_retry)
-            for f in glob.glob("/tmp/heading_cache_*"):
-                os.remove(f)
-            for f in glob.glob("/tmp/tim_auto_macros_*"):
-                os.remove(f)
         else:
             cls.test_files_path.mkdir()
+        get_paragraph_cache().clear()
+        for pattern in ("tim-automacros-*", "tim-headings-*"):
+            for key in rclient.scan_iter(match=pattern, count=1000):
+                rclient.delete(key)
         # Safety mechanism to make sure we are not wiping some production database
         assert app.config["SQLALCHEMY_DATABASE_URI"].endswith("-test"), (
             "Wrong test db URI. This probably means that "
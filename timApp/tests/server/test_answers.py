@@ -6,10 +6,14 @@ from sqlalchemy import select
 from timApp import tim_celery
 from timApp.admin.answer_cli import delete_old_answers
 from timApp.answer.answer import Answer
+from timApp.answer.answer_models import UserTaskTally
 from timApp.answer.answers import (
     get_users_for_tasks,
     save_answer,
     get_existing_answers_info,
+    get_users_for_tasks_py,
+    get_users_for_tasks_tally,
+    AnswerCountRule,
 )
 from timApp.answer.backup import get_backup_answer_file
 from timApp.auth.accesstype import AccessType
@@ -390,3 +394,58 @@ class AnswerTest(TimRouteTest):
         )
 
         self.assertEqual(2, len(ans), "Each user should have one answer")
+
+    def test_user_task_tally(self):
+        d = self.create_doc()
+        u1, u2 = self.test_user_1, self.test_user_2
+        t1, t2 = TaskId.parse(f"{d.id}.t1"), TaskId.parse(f"{d.id}.t2")
+
+        def entry_key(e):
+            return e["user"].id, e["doc_id"], e["task_id"]
+
+        def check():
+            db.session.commit()
+            for rule in AnswerCountRule:
+                for group_by_user, group_by_doc in (
+                    (True, False),
+                    (False, True),
+                    (False, False),
+                ):
+                    args = dict(
+                        task_ids=[t1, t2],
+                        group_by_user=group_by_user,
+                        group_by_doc=group_by_doc,
+                        with_answer_time=True,
+                        count_rule=rule,
+                    )
+                    self.assertEqual(
+                        sorted(get_users_for_tasks_py(**args), key=entry_key),
+                        sorted(get_users_for_tasks_tally(**args), key=entry_key),
+                    )
+
+        save_answer([u1, u2], t1, "a", 1, [], True)
+        save_answer([u1], t1, "b", 2, [], False)
+        save_answer([u2], t2, "c", 3, [], True)
+        check()
+        a = save_answer([u1], t2, "d", 4, [], True)
+        u2.answers.append(
+            Answer(task_id=t2.doc_task, points=5, content="e", valid=False)
+        )
+        check()
+        a.valid = False
+        check()
+        a.points = 6
+        check()
+        a.users_all.remove(u1)
+        check()
+        save_answer([u1], t1, "f", 7, [], True, overwrite_existing=True)
+        check()
+        save_answer([u2], t1, "g", 8, [], True)
+        delete_old_answers(d, ["t1", "t2"])
+        check()
+
+        tally = run_sql(
+            select(UserTaskTally).filter_by(task_id=t1.doc_task, user_id=u1.id)
+        ).scalar_one()
+        self.assertEqual(1, tally.answer_count)
+        self.assertEqual(tally.latest_answer_id, tally.latest_valid_answer_id)
@@ -3,13 +3,18 @@ import re
 from unittest.mock import patch, Mock
 
 from timApp.auth.accesstype import AccessType
-from timApp.document.caching import clear_doc_cache
+from timApp.document.caching import (
+    clear_doc_cache,
+    get_doc_cache_index_key,
+    get_user_cache_index_key,
+)
 from timApp.document.docentry import DocEntry
 from timApp.item import routes
 from timApp.item.routes import render_doc_view
 from timApp.tests.server.timroutetest import TimRouteTest, get_note_id_from_json
 from timApp.user.usergroup import UserGroup
 from timApp.user.userutils import grant_access
+from timApp.util.redisclient import rclient
 
 
 class CachingTest(TimRouteTest):
@@ -149,6 +154,77 @@ class CachingTest(TimRouteTest):
         # The line self.test_user_3.add_to_group seems to trigger the error.
         self.refresh_client()
 
+    def test_cache_pregenerate_shared_render(self):
+        self.login_test1()
+        d = self.create_doc(initial_par="test", settings={"cache": True})
+        self.test_user_2.grant_access(d, AccessType.view)
+        self.test_user_3.grant_access(d, AccessType.view)
+        self.commit_db()
+        clear_doc_cache(d, None)
+        with patch.object(
+            routes, render_doc_view.__name__, wraps=render_doc_view
+        ) as m:  # type: Mock
+            self.get(
+                f"/generateCache/{d.path}",
+                expect_content="""
+1/3 testuser1: ok
+2/3 testuser2: ok
+3/3 testuser3: ok (shared)
+        """.strip()
+                + "\n",
+            )
+        self.assertEqual(2, m.call_count)
+        self.login_test3()
+        self.check_is_cached(d)
+
+        # User macros prevent sharing.
+        self.login_test1()
+        d.document.add_text("%%username%%")
+        self.get(
+            f"/generateCache/{d.path}",
+            expect_content="""
+1/3 testuser1: ok
+2/3 testuser2: ok
+3/3 testuser3: ok
+        """.strip()
+            + "\n",
+        )
+
+    def test_cache_index(self):
+        self.login_test1()
+        d = self.create_doc(initial_par="test", settings={"cache": True})
+        self.test_user_2.grant_access(d, AccessType.view)
+        self.commit_db()
+        clear_doc_cache(d, None)
+        self.get(f"/generateCache/{d.path}")
+        doc_index = get_doc_cache_index_key(d.id)
+        user_index = get_user_cache_index_key(self.test_user_2.id)
+
+        def user_doc_keys():
+            return [
+                k
+                for k in rclient.zrange(user_index, 0, -1)
+                if k.startswith(f"timdoc-{d.id}-".encode())
+            ]
+
+        self.assertEqual(2, rclient.zcard(doc_index))
+        self.assertEqual(1, len(user_doc_keys()))
+
+        clear_doc_cache(d, self.test_user_2)
+        self.assertEqual(1, rclient.zcard(doc_index))
+        self.assertEqual([], user_doc_keys())
+        self.login_test2()
+        self.check_not_cached_and_then_cached(d)
+
+        clear_doc_cache(None, self.test_user_2)
+        self.check_not_cached_and_then_cached(d)
+        self.login_test1()
+        self.check_is_cached(d)
+
+        clear_doc_cache(d, None)
+        self.assertEqual(0, rclient.zcard(doc_index))
+        self.check_not_cached(d)
+
     def test_cache_generate_exam_mode(self):
         self.login_test1()
         d = self.create_doc(settings={"exam_mode": "view", "cache": True})
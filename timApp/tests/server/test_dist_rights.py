@@ -19,6 +19,7 @@ from timApp.item.distribute_rights import (
     RightOp,
     RightLog,
     ConfirmGroupOp,
+    right_log_states,
 )
 from timApp.tests.server.timroutetest import TimRouteTest
 from timApp.tim_app import app
@@ -232,6 +233,64 @@ class DistRightsTest(TimRouteTest):
         r = processor.undoconfirm(1, twosecs)
         check(r, 1, True, None, None, None, 0, 1 * h)
 
+    def test_rights_snapshot(self):
+        processor, base_date, check = self.init_processor("test_rights_snapshot")
+        self.login_test1()
+        ug = UserGroup.create("tg_snapshot1")
+        self.test_user_1.add_to_group(ug, None)
+        db.session.commit()
+        self.write_initial(
+            processor,
+            Right(
+                require_confirm=True,
+                duration_from=None,
+                duration_to=None,
+                duration=None,
+                accessible_from=processor.dt,
+                accessible_to=processor.dt + timedelta(hours=1),
+            ),
+            [],
+        )
+        fp = Path(app.config["FILES_PATH"])
+        snapshot_path = fp / f"{processor.target_name}.rights.snapshot"
+        twosecs = timedelta(seconds=2)
+        with self.temp_config({"DIST_RIGHTS_SNAPSHOT_INTERVAL": 3}):
+            processor.confirmgroup("tg_snapshot1", twosecs)
+            processor.changetime(1, twosecs, 60)
+            processor.quit(2, twosecs)
+            get_current_rights(processor.target_name)
+            self.assertTrue(snapshot_path.exists())
+            processor.undoquit(2, twosecs)
+            processor.changetimegroup("tg_snapshot1", twosecs, 30)
+
+        def check_all(r: RightLog):
+            check(r, 1, False, None, None, None, 0, 1 * h + 90)
+            check(r, 2, True, None, None, None, 0, 1 * h)
+            check(r, 3, True, None, None, None, 0, 1 * h)
+
+        # From the state of this process.
+        r, _ = get_current_rights(processor.target_name)
+        check_all(r)
+
+        # From the snapshot and the rest of the log.
+        right_log_states.clear()
+        r, _ = get_current_rights(processor.target_name)
+        check_all(r)
+
+        # Changed group memberships invalidate the snapshot.
+        self.test_user_2.add_to_group(ug, None)
+        db.session.commit()
+        right_log_states.clear()
+        r, _ = get_current_rights(processor.target_name)
+        check(r, 1, False, None, None, None, 0, 1 * h + 90)
+        check(r, 2, False, None, None, None, 0, 1 * h + 30)
+
+        # Full replay.
+        snapshot_path.unlink()
+        right_log_states.clear()
+        r, _ = get_current_rights(processor.target_name)
+        check(r, 2, False, None, None, None, 0, 1 * h + 30)
+
     def test_distribute_rights(self):
         processor, base_date, check = self.init_processor("test")
         self.login_test1()
@@ -1,7 +1,12 @@
 from timApp.auth.accesstype import AccessType
-from timApp.item.tag import TagType
+from timApp.folder.folder import Folder
+from timApp.item.blockrelevance import BlockRelevance
+from timApp.item.routes import get_document_relevance
+from timApp.item.tag import TagType, Tag
 from timApp.tests.server.timroutetest import TimRouteTest
 from timApp.timdb.sqa import db
+from timApp.util.flask.search import preload_search_metadata
+from timApp.util.flask.searchindex import SearchIndexBuilder
 
 
 class SearchTest(TimRouteTest):
@@ -668,3 +673,100 @@ class SearchTest(TimRouteTest):
                 "word_result_count": 0,
             },
         )
+
+    def test_search_index_incremental_update(self):
+        self.make_admin(self.test_user_1)
+        self.login_test1()
+        d = self.create_doc(initial_par="The aardvark sleeps.")
+        self.get(f"search/createContentFile")
+        url = "search?ignoreRelevance=true&folder=&searchContent=true&query="
+
+        def get_par_results(query: str) -> list[tuple[str, str]]:
+            r = self.get(url + query)
+            return [
+                (p["par_id"], p["preview"])
+                for doc_result in r["content_results"]
+                if doc_result["doc"]["id"] == d.id
+                for p in doc_result["par_results"]
+            ]
+
+        first = d.document.get_paragraphs()[0]
+        self.assertEqual(
+            [(first.get_id(), "The aardvark sleeps.")], get_par_results("aardvark")
+        )
+        self.new_par(d.document, "An okapi eats leaves.")
+        self.post_par(d.document, "The armadillo sleeps.", first.get_id())
+        d.document.clear_mem_cache()
+        second = d.document.get_paragraphs()[1]
+        self.assertEqual([], get_par_results("aardvark"))
+        self.assertEqual(
+            [(first.get_id(), "The armadillo sleeps.")], get_par_results("madil")
+        )
+        self.assertEqual(
+            [(second.get_id(), "An okapi eats leaves.")], get_par_results("okapi eat")
+        )
+        self.assertEqual([], get_par_results("okapi eat&searchWholeWords=true"))
+        self.delete_par(d, second.get_id())
+        self.assertEqual([], get_par_results("okapi"))
+
+        # Inserting a paragraph moves the following ones.
+        self.new_par(d.document, "The okapi sleeps.", first.get_id())
+        d.document.clear_mem_cache()
+        inserted = d.document.get_paragraphs()[0]
+        self.assertEqual(
+            [inserted.get_id(), first.get_id()],
+            [par_id for par_id, _ in get_par_results("sleeps")],
+        )
+
+    def test_search_index_metadata_update(self):
+        self.make_admin(self.test_user_1)
+        self.login_test1()
+        d = self.create_doc(title="Zebra notes", initial_par="Some content.")
+        self.get(f"search/createContentFile")
+        url = "search?ignoreRelevance=true&folder=&searchContent=false&searchTitles=true&query="
+
+        def get_title_results(query: str) -> list[int]:
+            r = self.get(url + query)
+            return [result["doc"]["id"] for result in r["title_results"]]
+
+        self.assertEqual([d.id], get_title_results("zebra"))
+        self.json_put(f"/changeTitle/{d.id}", {"new_title": "Giraffe notes"})
+        self.assertEqual([], get_title_results("zebra"))
+        self.assertEqual([d.id], get_title_results("giraffe"))
+
+    def test_search_index_rebuild_journal(self):
+        self.make_admin(self.test_user_1)
+        self.login_test1()
+        d = self.create_doc(initial_par="The aardvark sleeps.")
+        self.get(f"search/createContentFile")
+        url = "search?ignoreRelevance=true&folder=&searchContent=true&query="
+
+        # Edits made while a rebuild is in progress are replayed to the new index.
+        builder = SearchIndexBuilder()
+        self.new_par(d.document, "An okapi eats leaves.")
+        builder.finish()
+        r = self.get(url + "okapi")
+        self.assertEqual(
+            [d.id], [result["doc"]["id"] for result in r["content_results"]]
+        )
+
+    def test_preload_search_metadata(self):
+        self.login_test1()
+        d1 = self.create_doc(self.get_personal_item_path("relevance/inner/doc1"))
+        d2 = self.create_doc(self.get_personal_item_path("relevance/inner/doc2"))
+        d3 = self.create_doc(self.get_personal_item_path("doc3"))
+        Folder.find_by_path(
+            self.get_personal_item_path("relevance")
+        ).block.relevance = BlockRelevance(relevance=3)
+        d2.block.relevance = BlockRelevance(relevance=7)
+        d2.block.tags.append(Tag(name="animals", type=TagType.Regular))
+        db.session.commit()
+
+        preloaded = preload_search_metadata()
+        self.assertEqual(3, preloaded[d1.id].relevance)
+        self.assertEqual(7, preloaded[d2.id].relevance)
+        for d in (d1, d2, d3):
+            self.assertEqual(get_document_relevance(d), preloaded[d.id].relevance)
+        self.assertEqual(
+            ["animals"], [t.name for t in preloaded[d2.id].doc_info.block.tags]
+        )
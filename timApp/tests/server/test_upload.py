@@ -7,7 +7,7 @@ from timApp.document.document import Document
 from timApp.folder.folder import Folder
 from timApp.tests.server.timroutetest import TimRouteTest
 from timApp.timdb.sqa import db
-from timApp.upload.uploadedfile import StampedPDF, UploadedFile
+from timApp.upload.uploadedfile import FileTooLargeError, StampedPDF, UploadedFile
 from timApp.user.usergroup import UserGroup
 
 
@@ -97,6 +97,45 @@ class UploadTest(TimRouteTest):
         db.session.commit()
         self.get_no_warn(f'/files/{j["file"]}', expect_content="test file")
 
+    def test_upload_deduplicated(self):
+        self.login_test1()
+        d = self.create_doc()
+        j1 = self.upload_file(d, b"same content", "a.txt")
+        j2 = self.upload_file(d, b"same content", "b.txt")
+        j3 = self.upload_file(d, b"other content", "c.txt")
+        f1, f2, f3 = (
+            UploadedFile.find_by_id(int(j["file"].split("/")[0])) for j in (j1, j2, j3)
+        )
+        self.assertTrue(f1.filesystem_path.samefile(f2.filesystem_path))
+        self.assertFalse(f1.filesystem_path.samefile(f3.filesystem_path))
+        self.get_no_warn(f'/files/{j2["file"]}', expect_content="same content")
+        with f1.open() as f:
+            self.assertEqual(b"same", f.read(4))
+        with self.assertRaises(FileTooLargeError):
+            f1.read_data(max_size=4)
+        self.assertEqual(b"same content", f1.read_data(max_size=12))
+
+    def test_upload_accel_redirect(self):
+        self.login_test1()
+        d = self.create_doc()
+        j = self.upload_file(d, b"test file", "test.md")
+        f = UploadedFile.find_by_id(int(j["file"].split("/")[0]))
+        with self.temp_config({"UPLOAD_ACCEL_REDIRECT": True}):
+            r = self.client.get(f'/files/{j["file"]}')
+        self.assertEqual(200, r.status_code)
+        self.assertEqual(b"", r.data)
+        self.assertEqual(
+            f"/blocks/files/{f.relative_filesystem_path.as_posix()}",
+            r.headers["X-Accel-Redirect"],
+        )
+        self.assertEqual("text/plain; charset=utf-8", r.headers["Content-Type"])
+
+        self.login_test2()
+        with self.temp_config({"UPLOAD_ACCEL_REDIRECT": True}):
+            r = self.client.get(f'/files/{j["file"]}')
+        self.assertEqual(403, r.status_code)
+        self.assertNotIn("X-Accel-Redirect", r.headers)
+
     def test_upload_image(self):
         self.login_test1()
         di, j = self.create_doc_with_image()
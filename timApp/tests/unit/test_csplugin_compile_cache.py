@@ -0,0 +1,91 @@
+import hashlib
+import os
+import tempfile
+import unittest
+
+from timApp.modules.cs.compilecache import (
+    CompileCache,
+    find_compiled_outputs,
+    get_compile_cache_key,
+)
+
+
+def sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class CompileCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = self.tmp.name
+        self.run_dir = os.path.join(self.root, "user")
+        os.makedirs(os.path.join(self.run_dir, "run"))
+        self.cache = CompileCache(os.path.join(self.root, "cache"), 1000)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, rel: str, data: bytes, run_dir=None) -> str:
+        path = os.path.join(run_dir or self.run_dir, rel)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+    def test_store_restore(self):
+        self.write("Main.java", b"source")
+        self.write("a/Main.class", b"class")
+        self.write("run/compile.sh", b"javac")
+        outputs = find_compiled_outputs(self.run_dir, {"Main.java": sha256(b"source")})
+        self.assertEqual({"a/Main.class": sha256(b"class")}, outputs)
+        self.assertTrue(self.cache.store("k", self.run_dir, outputs, "out", "warning"))
+        self.assertFalse(self.cache.store("k", self.run_dir, outputs))
+
+        other = os.path.join(self.root, "other")
+        os.mkdir(other)
+        self.assertIsNone(self.cache.restore("missing", other))
+        self.assertEqual(("out", "warning"), self.cache.restore("k", other))
+        with open(os.path.join(other, "a/Main.class"), "rb") as f:
+            self.assertEqual(b"class", f.read())
+
+    def test_changed_output_not_stored(self):
+        self.write("Main.class", b"changed")
+        self.assertFalse(
+            self.cache.store("k", self.run_dir, {"Main.class": sha256(b"class")})
+        )
+        self.assertIsNone(self.cache.restore("k", self.run_dir))
+        self.assertEqual([], os.listdir(self.cache.path))
+
+    def test_evict_least_recently_used(self):
+        for key in ["a", "b", "c"]:
+            self.write("out", key.encode() * 400)
+            self.assertTrue(
+                self.cache.store(key, self.run_dir, {"out": sha256(key.encode() * 400)})
+            )
+            os.utime(self.cache.path / key / "manifest.json", (0, ord(key)))
+            if key == "b":
+                # Using an entry makes it the most recently used one.
+                self.assertTrue(self.cache.restore("a", self.run_dir))
+        self.assertTrue((self.cache.path / "a").exists())
+        self.assertFalse((self.cache.path / "b").exists())
+        self.assertTrue((self.cache.path / "c").exists())
+
+    def test_unsafe_paths(self):
+        for rel in ["../x", "/etc/passwd"]:
+            self.assertFalse(self.cache.store("k", self.run_dir, {rel: sha256(b"x")}))
+
+    def test_key_depends_on_sources(self):
+        main = self.write("Main.java", b"class Main {}")
+        key = get_compile_cache_key(["Java", "javac Main.java"], {"Main.java": main})
+        self.assertEqual(
+            key,
+            get_compile_cache_key(["Java", "javac Main.java"], {"Main.java": main}),
+        )
+        self.assertNotEqual(
+            key,
+            get_compile_cache_key(["Java", "javac -g Main.java"], {"Main.java": main}),
+        )
+        self.write("Main.java", b"class Main { }")
+        self.assertNotEqual(
+            key, get_compile_cache_key(["Java", "javac Main.java"], {"Main.java": main})
+        )
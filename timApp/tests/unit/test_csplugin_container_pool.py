@@ -0,0 +1,144 @@
+import io
+import os
+import tarfile
+import tempfile
+import unittest
+
+from timApp.modules.cs.containerpool import (
+    ContainerPool,
+    PoolBusy,
+    PoolConfig,
+    SubprocessBackend,
+    get_pool_stats,
+    unpack_dir,
+)
+
+
+class ContainerPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = self.tmp.name
+        self.cwd = os.path.join(self.root, "user")
+        os.mkdir(self.cwd)
+        self.backend = SubprocessBackend(os.path.join(self.root, "containers"))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def create_pool(self, **kwargs) -> ContainerPool:
+        config = PoolConfig(
+            **{
+                "size": 1,
+                "max_runs": 10,
+                "queue_size": 5,
+                "queue_timeout": 1,
+                "pool_dir": os.path.join(self.root, "pool"),
+                **kwargs,
+            }
+        )
+        return ContainerPool("test", self.backend, config)
+
+    def containers(self) -> list[str]:
+        return os.listdir(self.backend.root)
+
+    def test_run_copies_home(self):
+        pool = self.create_pool()
+        with open(os.path.join(self.cwd, "in.txt"), "w") as f:
+            f.write("hello")
+        with open(os.path.join(self.cwd, "remove.txt"), "w") as f:
+            f.write("x")
+        r = pool.run(
+            self.cwd,
+            ["sh", "-c", "cat in.txt; echo err >&2; cp in.txt out.txt; rm remove.txt"],
+            timeout=5,
+            language="shell",
+        )
+        self.assertEqual((0, b"hello", b"err\n"), (r.returncode, r.stdout, r.stderr))
+        self.assertEqual(["in.txt", "out.txt"], sorted(os.listdir(self.cwd)))
+
+        # The next run gets a clean home directory in the same container.
+        containers = self.containers()
+        os.remove(os.path.join(self.cwd, "out.txt"))
+        r = pool.run(self.cwd, ["ls", "-A"], timeout=5, language="shell")
+        self.assertEqual(b"in.txt\n", r.stdout)
+        self.assertEqual(containers, self.containers())
+
+        stats = get_pool_stats(pool.config)["shell"]
+        self.assertEqual(2, stats["runs"])
+        self.assertEqual(0, stats["recycled"])
+
+    def test_writable_dirs_are_emptied(self):
+        pool = self.create_pool()
+        pool.run(self.cwd, ["true"], timeout=5)
+        [container] = self.containers()
+        dirs = self.backend.writable_dirs(container)
+        pool.run(
+            self.cwd,
+            ["sh", "-c", "; ".join(f"mkdir {d}/sub; touch {d}/sub/left" for d in dirs)],
+            timeout=5,
+        )
+        # The run itself writes its output to tmp_dir, so only look for the files of the previous run.
+        r = pool.run(self.cwd, ["find", *dirs, "-name", "sub*"], timeout=5)
+        self.assertEqual(b"", r.stdout)
+        self.assertEqual([container], self.containers())
+
+    def test_recycle_after_max_runs(self):
+        pool = self.create_pool(max_runs=2)
+        pool.run(self.cwd, ["true"], timeout=5)
+        first = self.containers()
+        pool.run(self.cwd, ["true"], timeout=5)
+        self.assertEqual([], self.containers())
+        pool.run(self.cwd, ["true"], timeout=5)
+        self.assertEqual(1, len(self.containers()))
+        self.assertNotEqual(first, self.containers())
+
+    def test_timeout_recycles(self):
+        pool = self.create_pool()
+        r = pool.run(self.cwd, ["sleep", "5"], timeout=0.2, language="shell")
+        self.assertTrue(r.timed_out)
+        self.assertEqual([], self.containers())
+        self.assertEqual(1, get_pool_stats(pool.config)["shell"]["timeouts"])
+
+    def test_busy(self):
+        pool = self.create_pool(queue_size=0)
+        slot = pool._acquire()
+        try:
+            with self.assertRaises(PoolBusy):
+                pool.run(self.cwd, ["true"], timeout=5, language="shell")
+        finally:
+            pool._release(slot)
+        self.assertEqual(1, get_pool_stats(pool.config)["shell"]["rejected"])
+        pool.run(self.cwd, ["true"], timeout=5)
+
+    def test_queue_timeout(self):
+        pool = self.create_pool(queue_timeout=0.1)
+        slot = pool._acquire()
+        try:
+            with self.assertRaises(PoolBusy):
+                pool.run(self.cwd, ["true"], timeout=5)
+        finally:
+            pool._release(slot)
+
+
+class UnpackDirTest(unittest.TestCase):
+    def test_skips_unsafe_members(self):
+        buf = io.BytesIO()
+        with tarfile.open(fileobj=buf, mode="w") as tar:
+            for name, target in [
+                ("ok", "a.txt"),
+                ("abs", "/etc/passwd"),
+                ("up", "../x"),
+            ]:
+                info = tarfile.TarInfo(name)
+                info.type = tarfile.SYMTYPE
+                info.linkname = target
+                tar.addfile(info)
+            info = tarfile.TarInfo("a.txt")
+            info.size = 1
+            tar.addfile(info, io.BytesIO(b"a"))
+        with tempfile.TemporaryDirectory() as d:
+            with open(os.path.join(d, "old.txt"), "w") as f:
+                f.write("old")
+            unpack_dir(buf.getvalue(), d)
+            self.assertEqual(["a.txt", "ok"], sorted(os.listdir(d)))
+            self.assertEqual("a.txt", os.readlink(os.path.join(d, "ok")))
@@ -0,0 +1,54 @@
+import unittest
+from unittest.mock import patch
+
+import requests
+
+from tim_common import dumboclient
+from tim_common.dumboclient import call_dumbo, DumboOptions
+from timApp.tests.benchmark.dumbo_client import start_mock_server
+
+
+class DumboClientTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = start_mock_server(0)
+        cls.url = f"http://127.0.0.1:{cls.server.server_port}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def test_chunks_keep_order(self):
+        data = [f"p{i}" for i in range(25)]
+        opts = [DumboOptions.default()] * 25
+        with patch.object(dumboclient, "DUMBO_URL", self.url), patch.object(
+            dumboclient, "DUMBO_CHUNK_SIZE", 4
+        ):
+            self.assertEqual([f"<p>p{i}</p>" for i in range(25)], call_dumbo(data))
+            self.assertEqual(
+                [f"<p>p{i}</p>" for i in range(25)],
+                call_dumbo(data, path="/mdkeys", data_opts=opts),
+            )
+
+    def test_retry_on_connection_reset(self):
+        session = dumboclient.get_dumbo_session()
+        self.assertIs(session, dumboclient.get_dumbo_session())
+        original_post = session.post
+        calls = []
+
+        def flaky_post(*args, **kwargs):
+            calls.append(1)
+            if len(calls) == 1:
+                raise requests.ConnectionError("Connection reset by peer")
+            return original_post(*args, **kwargs)
+
+        with patch.object(dumboclient, "DUMBO_URL", self.url), patch.object(
+            session, "post", flaky_post
+        ):
+            self.assertEqual(["<p>x</p>"], call_dumbo(["x"]))
+        self.assertEqual(2, len(calls))
+
+    def test_no_server(self):
+        with patch.object(dumboclient, "DUMBO_URL", "http://127.0.0.1:1"):
+            with self.assertRaisesRegex(Exception, "Failed to connect to Dumbo"):
+                call_dumbo(["x"])
@@ -0,0 +1,45 @@
+import json
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from timApp.util.flask import search
+from timApp.util.flask.search import GrepScan
+
+
+class GrepScanTest(unittest.TestCase):
+    def setUp(self):
+        f = tempfile.NamedTemporaryFile("w", suffix=".log", delete=False)
+        for i in range(50):
+            f.write(json.dumps({"doc_id": i, "doc_title": f"title {i}"}) + "\n")
+        f.close()
+        self.path = Path(f.name)
+
+    def tearDown(self):
+        self.path.unlink()
+
+    def test_streams_all_items_in_batches(self):
+        with patch.object(search, "SEARCH_BATCH_SIZE", 8):
+            scan = GrepScan(["grep", "-F", "title"], self.path, "title").start()
+            try:
+                batches = list(scan.iter_batches(time.time() + 10))
+            finally:
+                scan.close()
+        self.assertEqual(7, len(batches))
+        self.assertEqual(list(range(50)), [i for b in batches for i in b])
+        self.assertIsNone(scan.error)
+        self.assertFalse(scan.timed_out)
+
+    def test_close_stops_unfinished_scan(self):
+        scan = GrepScan(["sh", "-c", "exec sleep 10", "--"], self.path, "title")
+        scan.start()
+        self.assertEqual([], list(scan.iter_batches(time.time() + 0.2)))
+        self.assertTrue(scan.timed_out)
+        scan.close()
+        self.assertIsNotNone(scan.process.returncode)
+
+    def test_missing_file(self):
+        with self.assertRaises(Exception):
+            GrepScan(["grep", "x"], self.path.with_name("missing.log"), "title")
@@ -0,0 +1,40 @@
+import unittest
+from unittest.mock import patch
+
+from timApp.markdown import htmlcache
+from timApp.markdown.htmlcache import call_dumbo_cached, get_dumbo_html_cache
+from tim_common.dumboclient import DumboOptions, MathType
+
+
+def fake_dumbo(texts, options):
+    return [f"<p>{t if isinstance(t, str) else t['content']}</p>" for t in texts]
+
+
+class HtmlCacheTest(unittest.TestCase):
+    def setUp(self):
+        get_dumbo_html_cache().clear()
+
+    def test_converts_only_uncached_texts(self):
+        opts = DumboOptions.default()
+        with patch.object(htmlcache, "call_dumbo", side_effect=fake_dumbo) as m:
+            self.assertEqual(
+                ["<p>a</p>", "<p>b</p>", "<p>a</p>"],
+                call_dumbo_cached(["a", "b", "a"], opts),
+            )
+            m.assert_called_once_with(["a", "b"], options=opts)
+            self.assertEqual(
+                ["<p>c</p>", "<p>b</p>", "<p>a</p>"],
+                call_dumbo_cached(["c", "b", "a"], opts),
+            )
+            self.assertEqual(["c"], m.call_args.args[0])
+            call_dumbo_cached(["a", "b", "c"], opts)
+            self.assertEqual(2, m.call_count)
+
+    def test_options_are_part_of_key(self):
+        opts = DumboOptions.default()
+        svg_opts = opts._replace(math_type=MathType.SVG)
+        with patch.object(htmlcache, "call_dumbo", side_effect=fake_dumbo) as m:
+            call_dumbo_cached(["a"], opts)
+            call_dumbo_cached(["a"], svg_opts)
+            call_dumbo_cached([{"content": "a", **svg_opts.dict()}], opts)
+            self.assertEqual(3, m.call_count)
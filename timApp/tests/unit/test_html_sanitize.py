@@ -0,0 +1,75 @@
+import unittest
+
+from tim_common.html_sanitize import (
+    c_no_style,
+    get_sanitize_cache,
+    sanitize_html,
+    sanitize_html_batch,
+    sanitize_many_with_cleaner,
+    sanitize_with_cleaner,
+)
+
+FRAGMENTS = [
+    "<p>Hello <b>world</b></p>",
+    "plain text",
+    "text with <i>tags</i> & entities &lt;",
+    "<p>a</p><p>b</p>",
+    "\n<p>surrounded by whitespace</p>\n",
+    "<div>a div</div>",
+    "<div>a</div><div>b</div>",
+    "<div>a</div>tail",
+    "text<div>a</div>",
+    "<div class='par'><p>nested</p></div>",
+    '<p onclick="alert(1)">attrs</p><a href="javascript:alert(1)">x</a>',
+    "<script>alert(1)</script>",
+    "<script>alert(1)</script><p>after</p>",
+    "<iframe src='https://example.com'></iframe>",
+    "<!-- comment -->",
+    "<style>p { color: red; }</style>",
+    '<img src="data:image/svg+xml;base64,PHN2Zz48L3N2Zz4=">',
+    "<p>ääkkönen</p>",
+    "<table><tr><td>unclosed",
+    "<p>unclosed paragraph",
+    "",
+    "   ",
+    "<html><body><p>full document</p></body></html>",
+    "<tim-plugin-loader task-id='1.t'>plugin</tim-plugin-loader>",
+]
+
+
+class SanitizeHtmlBatchTest(unittest.TestCase):
+    def setUp(self):
+        get_sanitize_cache().clear()
+
+    def test_batch_matches_single(self):
+        expected = [sanitize_with_cleaner(f, c_no_style) for f in FRAGMENTS]
+        self.assertEqual(expected, sanitize_many_with_cleaner(FRAGMENTS, c_no_style))
+        self.assertEqual(expected, sanitize_html_batch(FRAGMENTS))
+        self.assertEqual(expected, [sanitize_html(f) for f in FRAGMENTS])
+
+    def test_batch_with_each_fragment(self):
+        # Some of the fragments break out of their wrapper, which makes the whole batch fall back to single
+        # sanitization, so each fragment is also batched with a well-formed one.
+        for f in FRAGMENTS:
+            with self.subTest(f):
+                self.assertEqual(
+                    [sanitize_with_cleaner(f, c_no_style), "<p>x</p>"],
+                    sanitize_many_with_cleaner([f, "<p>x</p>"], c_no_style),
+                )
+
+    def test_breaking_out_of_wrapper(self):
+        fragments = ["<p>a</p></div><p>b</p>", "<div><p>c", "<p>d</p>"]
+        self.assertEqual(
+            [sanitize_with_cleaner(f, c_no_style) for f in fragments],
+            sanitize_many_with_cleaner(fragments, c_no_style),
+        )
+
+    def test_cache(self):
+        cache = get_sanitize_cache()
+        sanitize_html_batch(["<p>a</p>", "<p>b</p>", "<p>a</p>"])
+        self.assertEqual(2, len(cache))
+        hits = cache.hits
+        self.assertEqual("<p>a</p>", sanitize_html("<p>a</p>"))
+        self.assertEqual(hits + 1, cache.hits)
+        sanitize_html("<p>a</p>", allow_styles=True)
+        self.assertEqual(3, len(cache))
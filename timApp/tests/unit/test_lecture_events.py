@@ -0,0 +1,47 @@
+import os
+import threading
+import time
+import unittest
+
+from timApp.lecture.lectureevents import LectureEventListener
+
+
+class LectureEventListenerTest(unittest.TestCase):
+    def create_listener(self, connected: bool) -> LectureEventListener:
+        listener = LectureEventListener()
+        # Pretend that the listener thread is already running.
+        listener.pid = os.getpid()
+        listener.connected = connected
+        return listener
+
+    def publish(self, listener: LectureEventListener, lecture_id: int) -> None:
+        with listener.cond:
+            listener.sequences[lecture_id] += 1
+            listener.cond.notify_all()
+
+    def test_wakes_on_own_lecture_only(self):
+        listener = self.create_listener(connected=True)
+        seq = listener.get_sequence(1)
+        threading.Timer(0.05, self.publish, (listener, 2)).start()
+        threading.Timer(0.1, self.publish, (listener, 1)).start()
+        start = time.monotonic()
+        self.assertTrue(listener.wait(1, seq, 5))
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual(seq + 1, listener.get_sequence(1))
+
+    def test_event_before_wait_is_not_missed(self):
+        listener = self.create_listener(connected=True)
+        seq = listener.get_sequence(1)
+        self.publish(listener, 1)
+        self.assertTrue(listener.wait(1, seq, 0.01))
+
+    def test_timeout(self):
+        listener = self.create_listener(connected=True)
+        self.assertFalse(listener.wait(1, listener.get_sequence(1), 0.05))
+
+    def test_fallback_polling_without_redis(self):
+        listener = self.create_listener(connected=False)
+        start = time.monotonic()
+        self.assertTrue(listener.wait(1, listener.get_sequence(1), 5))
+        self.assertLess(time.monotonic() - start, 2)
+        self.assertFalse(listener.wait(1, listener.get_sequence(1), 0))
@@ -0,0 +1,140 @@
+import socketserver
+import threading
+import time
+import unittest
+
+from timApp.notification.mailqueue import MailQueue, RateLimiter
+
+
+class SMTPStandIn(socketserver.ThreadingTCPServer):
+    """A minimal SMTP server that records the messages it receives."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), SMTPHandler)
+        self.messages: list[tuple[str, list[str], str]] = []
+        self.connections = 0
+        self.temporary_failures = 0
+        self.lock = threading.Lock()
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    server: SMTPStandIn
+
+    def reply(self, line: str) -> None:
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self) -> None:
+        with self.server.lock:
+            self.server.connections += 1
+        self.reply("220 localhost")
+        mail_from, rcpts = "", []
+        for raw in self.rfile:
+            cmd = raw.decode().rstrip("\r\n")
+            verb = cmd.split(" ", 1)[0].upper()
+            if verb in ("EHLO", "HELO", "NOOP"):
+                self.reply("250 localhost")
+            elif verb == "MAIL":
+                mail_from, rcpts = cmd.split(":", 1)[1].strip("<> "), []
+                self.reply("250 OK")
+            elif verb == "RCPT":
+                rcpt = cmd.split(":", 1)[1].strip("<> ")
+                if rcpt.startswith("refused"):
+                    self.reply("550 No such user")
+                else:
+                    rcpts.append(rcpt)
+                    self.reply("250 OK")
+            elif verb == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                lines = []
+                for data_line in self.rfile:
+                    if data_line == b".\r\n":
+                        break
+                    lines.append(data_line.decode())
+                with self.server.lock:
+                    fail = self.server.temporary_failures > 0
+                    if fail:
+                        self.server.temporary_failures -= 1
+                    else:
+                        self.server.messages.append((mail_from, rcpts, "".join(lines)))
+                self.reply("451 Try again later" if fail else "250 OK")
+            elif verb == "RSET":
+                mail_from, rcpts = "", []
+                self.reply("250 OK")
+            elif verb == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Not implemented")
+
+
+class MailQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.server = SMTPStandIn()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def create_queue(self, **kwargs) -> MailQueue:
+        return MailQueue("127.0.0.1", port=self.server.port, retry_delay=0.01, **kwargs)
+
+    def test_reuses_connections(self):
+        q = self.create_queue(pool_size=2)
+        jobs = [
+            q.submit("tim@example.com", [f"user{i}@example.com"], f"Subject: {i}\n\nx")
+            for i in range(30)
+        ]
+        self.assertTrue(q.flush(10))
+        self.assertTrue(all(j.error is None for j in jobs))
+        self.assertEqual(
+            {f"user{i}@example.com" for i in range(30)},
+            {r for _, rcpts, _ in self.server.messages for r in rcpts},
+        )
+        self.assertLessEqual(self.server.connections, 2)
+
+    def test_retries_temporary_failures(self):
+        self.server.temporary_failures = 2
+        q = self.create_queue(pool_size=1)
+        job = q.submit("tim@example.com", ["user@example.com"], "Subject: x\n\nx")
+        self.assertTrue(job.join(10))
+        self.assertIsNone(job.error)
+        self.assertEqual(2, job.attempt)
+        self.assertEqual(1, len(self.server.messages))
+
+    def test_gives_up_after_max_retries(self):
+        self.server.temporary_failures = 10
+        q = self.create_queue(pool_size=1, max_retries=1)
+        job = q.submit("tim@example.com", ["user@example.com"], "Subject: x\n\nx")
+        self.assertTrue(job.join(10))
+        self.assertIn("Try again later", job.error)
+        self.assertEqual(1, job.attempt)
+
+    def test_permanent_failure_is_not_retried(self):
+        q = self.create_queue(pool_size=1)
+        failed = q.submit("tim@example.com", ["refused@example.com"], "Subject: x\n\nx")
+        ok = q.submit("tim@example.com", ["user@example.com"], "Subject: y\n\ny")
+        self.assertTrue(q.flush(10))
+        self.assertIsNotNone(failed.error)
+        self.assertEqual(0, failed.attempt)
+        self.assertIsNone(ok.error)
+        self.assertEqual(
+            [["user@example.com"]], [r for _, r, _ in self.server.messages]
+        )
+        self.assertEqual(1, self.server.connections)
+
+
+class RateLimiterTest(unittest.TestCase):
+    def test_limits_rate(self):
+        limiter = RateLimiter(100)
+        start = time.monotonic()
+        for _ in range(150):
+            limiter.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, 0.45)
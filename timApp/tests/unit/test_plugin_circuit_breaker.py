@@ -0,0 +1,97 @@
+import threading
+import unittest
+from unittest.mock import patch, Mock
+
+import requests
+from flask import Flask
+
+from timApp.plugin.containerLink import do_request
+from timApp.plugin.pluginconnection import (
+    LatencyHistogram,
+    PluginCircuitBreaker,
+    LATENCY_BUCKETS_MS,
+    get_circuit_breaker,
+)
+
+
+class PluginCircuitBreakerTest(unittest.TestCase):
+    def test_opens_after_consecutive_failures_and_recovers(self):
+        b = PluginCircuitBreaker("test")
+        probed = threading.Event()
+        recovered = threading.Event()
+        probe_results = iter([False, True])
+
+        def probe():
+            probed.set()
+            result = next(probe_results)
+            if result:
+                recovered.set()
+            return result
+
+        b.record_failure(1, threshold=2, probe=probe, interval=0.01)
+        b.record_success(0.01)
+        b.record_failure(1, threshold=2, probe=probe, interval=0.01)
+        self.assertTrue(b.allow_request())
+        b.record_failure(1, threshold=2, probe=probe, interval=0.01)
+        self.assertFalse(b.allow_request())
+        self.assertEqual("open", b.to_json()["state"])
+        self.assertEqual(1, b.to_json()["rejected"])
+        self.assertTrue(recovered.wait(5))
+        for _ in range(100):
+            if b.allow_request():
+                break
+            threading.Event().wait(0.01)
+        self.assertEqual("closed", b.state)
+        self.assertEqual(0, b.consecutive_failures)
+        self.assertEqual(3, b.failures)
+
+    def test_histogram(self):
+        h = LatencyHistogram()
+        h.observe(0.001)
+        h.observe(0.005)
+        h.observe(0.2)
+        h.observe(100)
+        j = h.to_json()
+        self.assertEqual(4, j["count"])
+        self.assertEqual(2, j["buckets"]["le_5"])
+        self.assertEqual(1, j["buckets"]["le_250"])
+        self.assertEqual(1, j["buckets"]["inf"])
+        self.assertEqual(len(LATENCY_BUCKETS_MS) + 1, len(j["buckets"]))
+
+
+class DoRequestBreakerTest(unittest.TestCase):
+    def setUp(self):
+        app = Flask(__name__)
+        app.config["PLUGIN_CONNECT_TIMEOUT"] = 1
+        app.config["PLUGIN_BREAKER_FAILURE_THRESHOLD"] = 100
+        app.config["PLUGIN_BREAKER_PROBE_INTERVAL"] = 60
+        ctx = app.app_context()
+        ctx.push()
+        self.addCleanup(ctx.pop)
+
+    def request_with(self, plugin: str, result) -> None:
+        session = Mock()
+        if isinstance(result, Exception):
+            session.request.side_effect = result
+        else:
+            session.request.return_value = result
+        with patch(
+            "timApp.plugin.containerLink.get_plugin_session", return_value=session
+        ):
+            try:
+                do_request(plugin, "get", "http://plugin/", None, None, None, 1)
+            except requests.exceptions.RequestException:
+                pass
+
+    def test_read_timeout_is_not_a_failure(self):
+        self.request_with("test_read_timeout", requests.exceptions.ReadTimeout())
+        self.assertEqual(0, get_circuit_breaker("test_read_timeout").failures)
+
+    def test_connect_errors_and_server_errors_are_failures(self):
+        plugin = "test_connect_error"
+        self.request_with(plugin, requests.exceptions.ConnectTimeout())
+        self.request_with(plugin, requests.exceptions.ConnectionError())
+        self.request_with(plugin, Mock(status_code=503))
+        self.assertEqual(3, get_circuit_breaker(plugin).failures)
+        self.request_with(plugin, Mock(status_code=200))
+        self.assertEqual(0, get_circuit_breaker(plugin).consecutive_failures)
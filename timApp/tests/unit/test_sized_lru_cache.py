@@ -0,0 +1,40 @@
+from unittest import TestCase
+
+from tim_common.collections import SizedLRUCache
+
+
+class SizedLRUCacheTest(TestCase):
+    def test_evicts_least_recently_used(self):
+        c = SizedLRUCache(10)
+        c.put("a", 1, 4)
+        c.put("b", 2, 4)
+        self.assertEqual(1, c.get("a"))
+        c.put("c", 3, 4)
+        self.assertIsNone(c.get("b"))
+        self.assertEqual(1, c.get("a"))
+        self.assertEqual(3, c.get("c"))
+        self.assertEqual(8, c.total_size)
+        self.assertEqual(
+            {
+                "entries": 2,
+                "size": 8,
+                "max_size": 10,
+                "hits": 3,
+                "misses": 1,
+                "evictions": 1,
+            },
+            c.stats(),
+        )
+
+    def test_replace_and_oversized(self):
+        c = SizedLRUCache(10)
+        c.put("a", 1, 4)
+        c.put("a", 2, 6)
+        self.assertEqual(6, c.total_size)
+        self.assertEqual(2, c.get("a"))
+        c.put("b", 3, 11)
+        self.assertIsNone(c.get("b"))
+        self.assertEqual(1, len(c))
+        c.clear()
+        self.assertEqual(0, len(c))
+        self.assertEqual(0, c.total_size)
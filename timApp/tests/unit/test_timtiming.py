@@ -0,0 +1,59 @@
+import unittest
+
+from flask import Flask, Response
+
+from timApp.util.timtiming import (
+    RequestTrace,
+    taketime,
+    add_trace_time,
+    start_request_trace,
+    finish_request_trace,
+    get_current_trace,
+)
+
+
+class RequestTraceTest(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config["TRACE_SERVER_TIMING"] = True
+        self.app.config["TRACE_LOG_SAMPLE_PERCENT"] = 0
+
+    def test_no_trace_outside_request(self):
+        taketime("probe")
+        add_trace_time("db", 1)
+        self.assertIsNone(get_current_trace())
+
+    def test_server_timing(self):
+        with self.app.test_request_context():
+            start_request_trace()
+            taketime("view begin")
+            taketime("plg e", "csPlugin", 3, elapsed=0.25)
+            add_trace_time("db", 0.01)
+            add_trace_time("db", 0.02)
+            add_trace_time("dumbo", 0.5)
+            resp = Response()
+            finish_request_trace(resp)
+            trace = get_current_trace()
+        self.assertEqual(
+            ["view begin", "plg e csPlugin 3"], [name for name, _ in trace.spans]
+        )
+        self.assertEqual(0.25, trace.spans[1][1])
+        header = resp.headers["Server-Timing"]
+        parts = header.split(", ")
+        self.assertTrue(parts[0].startswith("total;dur="))
+        self.assertEqual('db;dur=30.0;desc="2 calls"', parts[1])
+        self.assertEqual('dumbo;dur=500.0;desc="1 calls"', parts[2])
+        self.assertTrue(parts[3].startswith("0_view_begin;dur="))
+        self.assertEqual(
+            '1_plg_e_csPlugin_3;dur=250.0;desc="plg e csPlugin 3"', parts[4]
+        )
+        self.assertEqual(5, len(parts))
+
+    def test_to_json(self):
+        trace = RequestTrace()
+        trace.add("plugin", 0.123456)
+        trace.mark("x", elapsed=1)
+        d = trace.to_json()
+        self.assertEqual({"time": 0.1235, "count": 1}, d["plugin"])
+        self.assertEqual({"time": 0, "count": 0}, d["db"])
+        self.assertEqual([["x", 1]], d["spans"])
@@ -1,5 +1,6 @@
 import time
 import traceback
+from functools import partial
 from urllib.parse import urlparse
 
 import bs4
@@ -98,9 +99,15 @@ from timApp.util.flask.search import search_routes
 from timApp.util.locale import get_locale
 from timApp.util.logger import log_info, log_debug
 from timApp.util.testing import register_testing_routes
+from timApp.util.timtiming import (
+    start_request_trace,
+    finish_request_trace,
+    add_trace_time,
+)
 from timApp.util.utils import get_current_time
 from timApp.velp.annotation import annotations
 from timApp.velp.velp import velps
+from tim_common import dumboclient
 
 cache.init_app(app)
 
@@ -307,6 +314,29 @@ if app.config["TESTING"]:
 if app.config["DEBUG_SQL"]:
     install_sql_hook()
 
+
+def install_trace_hooks():
+    with app.app_context():
+
+        @event.listens_for(db.engine, "before_cursor_execute")
+        def receive_before_cursor_execute(
+            conn, cursor, statement, parameters, context, executemany
+        ):
+            conn.info.setdefault("trace_query_start", []).append(time.perf_counter())
+
+        @event.listens_for(db.engine, "after_cursor_execute")
+        def receive_after_cursor_execute(
+            conn, cursor, statement, parameters, context, executemany
+        ):
+            add_trace_time(
+                "db", time.perf_counter() - conn.info["trace_query_start"].pop()
+            )
+
+    dumboclient.dumbo_call_listener = partial(add_trace_time, "dumbo")
+
+
+install_trace_hooks()
+
 LOG_BEFORE_REQUESTS = app.config["LOG_BEFORE_REQUESTS"]
 
 
@@ -314,6 +344,7 @@ LOG_BEFORE_REQUESTS = app.config["LOG_BEFORE_REQUESTS"]
 def preprocess_request():
     session.permanent = True
     g.request_start_time = time.monotonic()
+    start_request_trace()
     # Log the request before it is processed.
     if LOG_BEFORE_REQUESTS:
         log_info(get_request_message(include_time=False, is_before=True))
@@ -390,6 +421,12 @@ def robots_request(response: Response):
     return response
 
 
+@app.after_request
+def report_request_trace(resp: Response):
+    finish_request_trace(resp)
+    return resp
+
+
 @app.after_request
 def after_request(resp: Response):
     token = generate_csrf()
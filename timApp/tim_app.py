@@ -18,7 +18,12 @@ from werkzeug.middleware.proxy_fix import ProxyFix
 from flask_babel import Babel
 
 from timApp.answer.answer import Answer, AnswerSaver
-from timApp.answer.answer_models import AnswerTag, AnswerUpload, UserAnswer
+from timApp.answer.answer_models import (
+    AnswerTag,
+    AnswerUpload,
+    UserAnswer,
+    UserTaskTally,
+)
 from timApp.auth.auth_models import AccessTypeModel, BlockAccess
 from timApp.auth.logincodes.model import UserLoginCode
 from timApp.auth.oauth2.models import OAuth2Token, OAuth2AuthorizationCode
@@ -139,6 +144,9 @@ from timApp.velp.velp_models import (
 )
 from tim_common.timjsonencoder import TimJsonProvider
 
+# Registers the session hooks that keep UserTaskTally up to date.
+import timApp.answer.usertasktally
+
 # All SQLAlchemy models must be imported in this module.
 all_models = (
     AccessTypeModel,
@@ -220,6 +228,7 @@ all_models = (
     UserLoginCode,
     UserNote,
     UserSession,
+    UserTaskTally,
     Velp,
     VelpContent,
     VelpGroup,
@@ -13,6 +13,7 @@ from typing import Any
 from celery import Celery
 from celery.signals import after_setup_logger
 from celery.utils.log import get_task_logger
+from flask import g
 from marshmallow import EXCLUDE, ValidationError
 from sqlalchemy import delete
 
@@ -30,6 +31,7 @@ from timApp.timdb.sqa import db, run_sql
 from timApp.user.user import User
 from timApp.user.verification.verification import Verification
 from timApp.util.flask.search import create_search_files
+from timApp.util.flask.searchindex import apply_search_index_update
 from timApp.util.utils import get_current_time, collect_errors_from_hosts
 from tim_common.vendor.requests_futures import FuturesSession
 
@@ -80,6 +82,32 @@ def update_search_files():
     create_search_files()
 
 
+@celery.task(ignore_result=True)
+def update_search_index_task(doc_ids: list[int], content: bool):
+    """
+    Updates the search index after documents have been edited, renamed, moved or tagged.
+    """
+    apply_search_index_update(doc_ids, content)
+
+
+@celery.task
+def render_doc_cache(
+    doc_id: int,
+    user_ids: list[int],
+    requester_id: int,
+    force: bool,
+    verify_share: bool,
+):
+    """
+    Renders and caches a document for a group of users. Used by the generateCache route.
+    """
+    from timApp.item.cachegen import render_cache_job
+
+    with app.test_request_context():
+        g.user = User.get_by_id(requester_id)
+        return render_cache_job(doc_id, user_ids, force, verify_share)
+
+
 @celery.task(ignore_result=True)
 def process_notifications():
     """
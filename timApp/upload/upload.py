@@ -5,14 +5,15 @@ import posixpath
 import subprocess
 from dataclasses import dataclass
 from pathlib import Path, PurePosixPath
-from urllib.parse import unquote, urlparse
+from urllib.parse import quote, unquote, urlparse
 
 from PIL import Image
 from PIL import UnidentifiedImageError
 from PIL.Image import DecompressionBombError, registered_extensions
-from flask import Blueprint, request, send_file, Response, url_for
+from flask import Blueprint, request, send_file, Response, url_for, current_app
 from img2pdf import convert
 from sqlalchemy import case, select
+from werkzeug.datastructures import FileStorage
 from werkzeug.utils import secure_filename
 
 from timApp.auth.accesshelper import (
@@ -43,11 +44,13 @@ from timApp.plugin.taskid import TaskId, TaskIdAccess
 from timApp.timdb.dbaccess import get_files_path
 from timApp.timdb.sqa import db, run_sql
 from timApp.upload.uploadedfile import (
+    FileTooLargeError,
     PluginUpload,
     PluginUploadInfo,
     UploadedFile,
     get_mimetype,
     is_script_safe_mimetype,
+    store_object,
 )
 from timApp.user.user import User
 from timApp.util.file_utils import guess_image_type, guess_image_mime
@@ -102,10 +105,39 @@ ALLOWED_EXTENSIONS = set(PIC_EXTENSIONS + DOC_EXTENSIONS)
 default_attachment_folder = get_files_path() / "blocks/files"
 
 
+def send_stored_file(
+    path: Path, mimetype: str, conditional: bool = True, etag: bool = True
+) -> Response:
+    """Sends a file from the TIM files directory.
+
+    If UPLOAD_ACCEL_REDIRECT is enabled, the response has no body, only an X-Accel-Redirect header with the path
+    of the file relative to the files directory. Caddy replaces the response with the file, keeping the other
+    headers, so that large files do not tie up a worker.
+
+    :param path: The file to send.
+    :param mimetype: The MIME type of the file.
+    :param conditional: Whether to support conditional and range requests when sending the file from TIM.
+    :param etag: Whether to add an ETag when sending the file from TIM.
+    :return: The response.
+    """
+    if current_app.config["UPLOAD_ACCEL_REDIRECT"]:
+        try:
+            relpath = path.relative_to(get_files_path())
+        except ValueError:
+            pass
+        else:
+            resp = Response(mimetype=mimetype)
+            resp.headers["X-Accel-Redirect"] = quote(f"/{relpath.as_posix()}")
+            return resp
+    return send_file(
+        path.as_posix(), mimetype=mimetype, conditional=conditional, etag=etag
+    )
+
+
 @upload.get("/uploads/<path:relfilename>")
 def get_upload(relfilename: str):
     mt, up = get_pluginupload(relfilename)
-    return send_file(up.filesystem_path.as_posix(), mimetype=mt, etag=False)
+    return send_stored_file(up.filesystem_path, mt, etag=False)
 
 
 def check_and_format_filename(relfilename: str) -> str:
@@ -251,17 +283,18 @@ def pluginupload_file(doc_id: int, task_id: str):
     file = request.files.get("file")
     if file is None:
         raise RouteException("Missing file")
-    content = file.read()
+    obj = store_uploaded_file(file)
     u = get_current_user_object()
     f = UploadedFile.save_new(
         file.filename,
         BlockType.Upload,
-        file_data=content,
+        original_file=obj,
         upload_info=PluginUploadInfo(task_id_name=task_id, user=u, doc=d),
     )
     f.block.set_owner(u.get_personal_group())
     grant_access_to_session_users(f)
-    if f.is_content_pdf:
+    # The same PDF is often uploaded many times, so the compressed version is stored with the original content.
+    if f.is_content_pdf and not f.replace_with_derived("compressed"):
         try:
             compress_pdf_if_not_already(f)
         except CompressionError:
@@ -269,6 +302,7 @@ def pluginupload_file(doc_id: int, task_id: str):
                 f"Failed to post-process {f.filesystem_path.name}. "
                 f"Please make sure the PDF is not broken."
             )
+        f.store_derived("compressed")
     p = task_access.plugin
     if p.type == "reviewcanvas":
         returninfo = convert_pdf_or_compress_image(f, u, d, task_id)
@@ -284,6 +318,19 @@ def pluginupload_file(doc_id: int, task_id: str):
     return json_response(returninfo)
 
 
+def store_uploaded_file(file) -> Path:
+    """Streams the content of an uploaded file to the object store.
+
+    :param file: The uploaded file, or another object with a read method that returns the whole content.
+    :return: The path of the object.
+    """
+    stream = file.stream if isinstance(file, FileStorage) else io.BytesIO(file.read())
+    try:
+        return store_object(stream, max_size=current_app.config["MAX_CONTENT_LENGTH"])
+    except FileTooLargeError as e:
+        raise RouteException(str(e))
+
+
 def simple_exif_transpose(image: Image):
     """
     Attempts to rotate an image according to exif data.
@@ -334,7 +381,10 @@ def _downsample_image_canvas(img_path: Path) -> None:
         # Ensure that JPEG does not have alpha channel
         if img_format == "JPEG" and img.mode != "RGB":
             img = img.convert("RGB")
-        img.save(img_path, format=img_format)
+        # The file may be a hard link to an object in the upload store, so it must not be overwritten in place.
+        tmp_path = img_path.with_name(f".{img_path.name}.tmp")
+        img.save(tmp_path, format=img_format)
+    os.replace(tmp_path, img_path)
 
 
 def convert_pdf_or_compress_image(f: UploadedFile, u: User, d: DocInfo, task_id: str):
@@ -568,9 +618,9 @@ def upload_and_stamp_attachment(
     """
 
     attachment_folder = default_attachment_folder
-    content = file.read()
+    obj = store_uploaded_file(file)
 
-    f = save_file_and_grant_access(d, content, file, BlockType.File)
+    f = save_file_and_grant_access(d, obj, file, BlockType.File)
 
     # Add the uploaded file path (the one to stamp) to stamp data.
 
@@ -599,17 +649,17 @@ def upload_image_or_file(d: DocInfo, file):
 
 
 def upload_image_or_file_impl(d: DocInfo, file):
-    content = file.read()
-    imgtype = guess_image_type(content)
+    obj = store_uploaded_file(file)
+    imgtype = guess_image_type(obj)
     type_str = "image" if imgtype else "file"
-    f = save_file_and_grant_access(d, content, file, BlockType.from_str(type_str))
+    f = save_file_and_grant_access(d, obj, file, BlockType.from_str(type_str))
     return f, type_str
 
 
 def save_file_and_grant_access(
-    d: DocInfo, content, file, block_type: BlockType
+    d: DocInfo, obj: Path, file, block_type: BlockType
 ) -> UploadedFile:
-    f = UploadedFile.save_new(file.filename, block_type, file_data=content)
+    f = UploadedFile.save_new(file.filename, block_type, original_file=obj)
     f.block.set_owner(get_current_user_object().get_personal_group())
     d.block.children.append(f.block)
     return f
@@ -624,15 +674,15 @@ def get_file(file_id: str, file_filename: str) -> Response:
     if not f:
         raise NotExist("File not found")
     verify_view_access(f, check_parents=True)
-    file_path = f.filesystem_path.as_posix()
+    file_path = f.filesystem_path
     send_plain = get_option(request, "plain", False)
     if send_plain:
         mime_type = "text/plain"
         conditional = False
     else:
-        mime_type = get_mimetype(file_path)
+        mime_type = get_mimetype(file_path.as_posix())
         conditional = True
-    res = send_file(file_path, mimetype=mime_type, conditional=conditional)
+    res = send_stored_file(file_path, mimetype=mime_type, conditional=conditional)
     # Some browsers (e.g. Firefox) seem to request ranges only when the server responds with Accept-Ranges: bytes
     # Here, we add the header to let the browser know they are supported
     if conditional:
@@ -662,7 +712,11 @@ def get_reviewcanvas_pdf(user_name: str, doc_id: int, task_id: str, answer_id: i
         )
     byte_images = []
     for block, file in zip(blocks, files):
-        img = Image.open(io.BytesIO(block.data))
+        try:
+            data = block.read_data(current_app.config["MAX_CONTENT_LENGTH"])
+        except FileTooLargeError as e:
+            raise RouteException(str(e))
+        img = Image.open(io.BytesIO(data))
         try:
             rotation = file["rotation"]
         except KeyError:
@@ -676,7 +730,7 @@ def get_reviewcanvas_pdf(user_name: str, doc_id: int, task_id: str, answer_id: i
             use_raw = False
             img = img.rotate(rotation * (-90), expand=True)
         if use_raw:
-            byte_images.append(block.data)
+            byte_images.append(data)
         else:
             img = simple_exif_transpose(img)
             img_byte_arr = io.BytesIO()
@@ -705,5 +759,4 @@ def get_image(image_id: str, image_filename: str) -> Response:
         return safe_redirect(
             url_for("upload.get_file", file_id=image_id, file_filename=image_filename)
         )
-    f = io.BytesIO(f.data)
-    return send_file(f, mimetype=imgtype)
+    return send_stored_file(f.filesystem_path, mimetype=imgtype)
@@ -1,7 +1,12 @@
+import errno
+import hashlib
+import io
 import os
 import re
+import shutil
+import tempfile
 from pathlib import Path
-from typing import Optional, NamedTuple, Union
+from typing import BinaryIO, Iterator, Optional, NamedTuple, Union
 
 import magic
 from sqlalchemy import select
@@ -42,11 +47,124 @@ def get_storage_path(block_type: BlockType):
     return get_files_path() / "blocks" / DIR_MAPPING[block_type]
 
 
+CHUNK_SIZE = 1024 * 1024
+
+
+class FileTooLargeError(Exception):
+    """Raised when a file is larger than the allowed maximum size."""
+
+    def __init__(self, max_size: int):
+        super().__init__(f"File is larger than {max_size} bytes")
+        self.max_size = max_size
+
+
+def iter_chunks(
+    stream: BinaryIO, max_size: int | None = None, chunk_size: int = CHUNK_SIZE
+) -> Iterator[bytes]:
+    """Reads the stream in chunks.
+
+    :param stream: The stream to read.
+    :param max_size: Maximum number of bytes to read. If the stream is longer, FileTooLargeError is raised.
+    :param chunk_size: Size of the chunks.
+    :return: The chunks.
+    """
+    total = 0
+    while chunk := stream.read(chunk_size):
+        total += len(chunk)
+        if max_size is not None and total > max_size:
+            raise FileTooLargeError(max_size)
+        yield chunk
+
+
+def read_limited(stream: BinaryIO, max_size: int) -> bytes:
+    """Reads the whole stream, raising FileTooLargeError if it is longer than max_size bytes."""
+    return b"".join(iter_chunks(stream, max_size))
+
+
+def get_object_store_path() -> Path:
+    """Gets the path of the content-addressed store of uploaded file contents.
+
+    Files with identical contents are hard links to the same object in the store.
+    """
+    return get_files_path() / "blocks" / "objects"
+
+
+def get_object_path(digest: str) -> Path:
+    return get_object_store_path() / digest[:2] / digest
+
+
+def store_object(stream: BinaryIO, max_size: int | None = None) -> Path:
+    """Stores the content of the stream in the object store.
+
+    The stream is written to disk in chunks while it is hashed, so the content is never held in memory as a whole.
+    If the store already has an object with the same content, that object is used.
+
+    :param stream: The content to store.
+    :param max_size: Maximum size of the content in bytes.
+    :return: The path of the object.
+    """
+    tmp_dir = get_object_store_path() / "tmp"
+    tmp_dir.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=tmp_dir)
+    try:
+        h = hashlib.sha256()
+        with os.fdopen(fd, "wb") as f:
+            for chunk in iter_chunks(stream, max_size):
+                h.update(chunk)
+                f.write(chunk)
+        os.chmod(tmp, 0o644)
+        obj = get_object_path(h.hexdigest())
+        obj.parent.mkdir(exist_ok=True)
+        try:
+            os.link(tmp, obj)
+        except FileExistsError:
+            pass
+        return obj
+    finally:
+        os.unlink(tmp)
+
+
+def store_file_object(path: Path) -> Path:
+    """Stores the content of the given file in the object store and returns the path of the object."""
+    try:
+        path.relative_to(get_object_store_path())
+        return path
+    except ValueError:
+        pass
+    with path.open(mode="rb") as f:
+        return store_object(f)
+
+
+def link_object(obj: Path, path: Path) -> None:
+    """Creates the file path with the content of the object.
+
+    The file is a hard link to the object if possible, and a copy otherwise.
+    Because of that, files that may be linked must not be modified in place; write a new file and
+    replace the old one instead.
+    """
+    try:
+        os.link(obj, path)
+    except OSError as e:
+        if e.errno not in (errno.EMLINK, errno.EXDEV, errno.EPERM):
+            raise
+        shutil.copyfile(obj, path)
+
+
+def replace_file(path: Path, obj: Path) -> None:
+    """Atomically replaces the file path with the content of the object."""
+    tmp = path.with_name(f".{path.name}.tmp")
+    tmp.unlink(missing_ok=True)
+    link_object(obj, tmp)
+    os.replace(tmp, path)
+
+
 class UploadedFile(ItemBase):
     """A file that has been uploaded by a user."""
 
     def __init__(self, b: Block):
         self._block = b
+        self.content_object: Path | None = None
+        """The object in the object store that has the original content of a newly saved file."""
 
     @staticmethod
     def find_by_id(block_id: int) -> Optional["UploadedFile"]:
@@ -175,6 +293,52 @@ class UploadedFile(ItemBase):
         with self.filesystem_path.open(mode="rb") as f:
             return f.read()
 
+    def open(self) -> BinaryIO:
+        """Opens the file for reading in binary mode."""
+        return self.filesystem_path.open(mode="rb")
+
+    def read_data(self, max_size: int) -> bytes:
+        """Reads the file, raising FileTooLargeError if it is larger than max_size bytes."""
+        with self.open() as f:
+            return read_limited(f, max_size)
+
+    def get_derived_path(self, name: str) -> Path | None:
+        """Gets the path where the result of processing the original content of the file is stored.
+
+        Processing steps (e.g. PDF compression) replace the file with their result. Because the result depends
+        only on the original content, it is stored next to the content object and reused when the same content
+        is uploaded again.
+
+        :param name: Name of the processing step.
+        :return: The path, or None if the file was not saved in this request.
+        """
+        if not self.content_object:
+            return None
+        return self.content_object.with_name(f"{self.content_object.name}.{name}")
+
+    def replace_with_derived(self, name: str) -> bool:
+        """Replaces the file with the stored result of the given processing step.
+
+        :return: True if there was a stored result.
+        """
+        derived = self.get_derived_path(name)
+        if not derived or not derived.exists():
+            return False
+        replace_file(self.filesystem_path, derived)
+        return True
+
+    def store_derived(self, name: str) -> None:
+        """Stores the current file as the result of the given processing step."""
+        derived = self.get_derived_path(name)
+        if not derived:
+            return
+        obj = store_file_object(self.filesystem_path)
+        replace_file(self.filesystem_path, obj)
+        try:
+            os.link(obj, derived)
+        except FileExistsError:
+            pass
+
     @property
     def size(self):
         return os.path.getsize(self.filesystem_path)
@@ -196,6 +360,17 @@ class UploadedFile(ItemBase):
         original_file: Path | None = None,
         upload_info: PluginUploadInfo | None = None,
     ) -> "UploadedFile":
+        """Saves a new file.
+
+        The content is stored in the content-addressed object store, so identical files share the same storage.
+
+        :param file_filename: Name of the file.
+        :param block_type: Type of the file block.
+        :param file_data: Content of the file.
+        :param original_file: File to move to the storage, or an object returned by store_object.
+        :param upload_info: Information about the plugin upload if the block type is Upload.
+        :return: The saved file.
+        """
         if file_data is None and original_file is None:
             raise TimDbException(
                 "Either file data or original file location must be given"
@@ -228,10 +403,13 @@ class UploadedFile(ItemBase):
         p = f.filesystem_path
         p.parent.mkdir(parents=True)
         if file_data is not None:
-            with p.open(mode="wb") as fi:
-                fi.write(file_data)
+            obj = store_object(io.BytesIO(file_data))
         else:
-            original_file.rename(p)
+            obj = store_file_object(original_file)
+            if obj != original_file:
+                original_file.unlink()
+        link_object(obj, p)
+        f.content_object = obj
         return f
 
 
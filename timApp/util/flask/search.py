@@ -4,16 +4,18 @@ import re
 import sre_constants
 import subprocess
 import time
+from collections import defaultdict
 from dataclasses import dataclass, field
-from io import StringIO
 from pathlib import Path
+from queue import Queue, Empty
 from re import Pattern
-from typing import Match, Type
+from threading import Thread
+from typing import Match, Type, Iterable, Iterator
 
 from flask import Blueprint, json, Request
 from flask import request
 from sqlalchemy import select
-from sqlalchemy.orm import selectinload, defaultload
+from sqlalchemy.orm import selectinload, defaultload, joinedload
 
 from timApp.auth.accesshelper import has_view_access, verify_admin, has_edit_access
 from timApp.auth.sessioninfo import get_current_user_object
@@ -23,7 +25,6 @@ from timApp.folder.folder import Folder
 from timApp.item.block import Block
 from timApp.item.routes import get_document_relevance
 from timApp.timdb.dbaccess import get_files_path
-from timApp.timdb.exceptions import InvalidReferenceException
 from timApp.timdb.sqa import run_sql
 from timApp.user.user import User
 from timApp.util.flask.requesthelper import (
@@ -33,8 +34,14 @@ from timApp.util.flask.requesthelper import (
     NotExist,
 )
 from timApp.util.flask.responsehelper import json_response
+from timApp.util.flask.searchindex import (
+    SEARCH_INDEX_PATH,
+    SearchIndex,
+    SearchIndexBuilder,
+    get_searchable_md,
+)
 from timApp.util.logger import log_error, log_info
-from timApp.util.utils import get_error_message, cache_folder_path, normalize_newlines
+from timApp.util.utils import get_error_message, cache_folder_path
 
 search_routes = Blueprint("search", __name__, url_prefix="/search")
 
@@ -50,6 +57,12 @@ PROCESSED_PATHS_FILE_PATH = SEARCH_CACHE_FOLDER / "paths_all_processed.log"
 PROCESSED_TAGS_FILE_PATH = SEARCH_CACHE_FOLDER / "tags_all_processed.log"
 RAW_CONTENT_FILE_PATH = SEARCH_CACHE_FOLDER / "all.log"
 DEFAULT_RELEVANCE = 10
+SEARCH_BATCH_SIZE = (
+    100  # Number of search file lines processed at a time while a scan is running.
+)
+SEARCH_QUEUE_SIZE = (
+    20  # Number of parsed batches buffered per scan before ripgrep has to wait.
+)
 
 
 @dataclass
@@ -367,8 +380,80 @@ docentry_eager_relevance_opt = (
 )
 
 
+@dataclass
+class SearchDocMetadata:
+    """Preloaded document data needed for writing the search files."""
+
+    doc_info: DocInfo
+    relevance: int
+
+
+def preload_search_metadata() -> dict[int, SearchDocMetadata]:
+    """
+    Loads the documents, their tags and relevance values in bulk for building the search files.
+
+    Translations are not included; they are looked up one by one as before.
+
+    :return: Dictionary of the document metadata keyed by document id.
+    """
+    folder_relevances = {
+        folder.path: folder.relevance.relevance
+        for folder in run_sql(
+            select(Folder).options(
+                joinedload(Folder._block).joinedload(Block.relevance)
+            )
+        )
+        .unique()
+        .scalars()
+        if folder.relevance
+    }
+    docs = run_sql(
+        select(DocEntry).options(
+            joinedload(DocEntry._block).joinedload(Block.relevance),
+            defaultload(DocEntry._block).selectinload(Block.tags),
+        )
+    ).unique()
+    result = {}
+    for doc_info in docs.scalars():
+        # Same as get_document_relevance, but using the preloaded folder relevances.
+        relevance = doc_info.relevance.relevance if doc_info.relevance else None
+        if relevance is None:
+            location = doc_info.location
+            while location and relevance is None:
+                relevance = folder_relevances.get(location)
+                location = location.rpartition("/")[0]
+        result[doc_info.id] = SearchDocMetadata(
+            doc_info, DEFAULT_RELEVANCE if relevance is None else relevance
+        )
+    return result
+
+
+def get_search_doc_metadata(
+    doc_id: int, preloaded: dict[int, SearchDocMetadata] | None = None
+) -> SearchDocMetadata | None:
+    """
+    Returns the metadata of a document for the search files, querying it if it was not preloaded.
+
+    :param doc_id: Document id.
+    :param preloaded: Metadata loaded with preload_search_metadata.
+    :return: The metadata or None if the document does not exist.
+    """
+    if preloaded is not None and doc_id in preloaded:
+        return preloaded[doc_id]
+    doc_info = DocEntry.find_by_id(
+        doc_id, docentry_load_opts=docentry_eager_relevance_opt
+    )
+    if not doc_info:
+        return None
+    return SearchDocMetadata(doc_info, get_document_relevance(doc_info))
+
+
 def add_doc_info_content_line(
-    doc_id: int, par_data, remove_deleted_pars: bool = True, add_title: bool = False
+    doc_id: int,
+    par_data,
+    remove_deleted_pars: bool = True,
+    add_title: bool = False,
+    preloaded: dict[int, SearchDocMetadata] | None = None,
 ) -> str | None:
     """
     Forms a JSON-compatible string with doc_id and list of paragraph data with id and md attributes.
@@ -377,19 +462,18 @@ def add_doc_info_content_line(
     :param par_data: List of paragraph dictionaries.
     :param remove_deleted_pars: Check paragraph existence and leave deleted ones out.
     :param add_title Add document title.
+    :param preloaded: Metadata loaded with preload_search_metadata.
     :return: String with paragraph data grouped under a document.
     """
     if not par_data:
         return None
-    doc_info = DocEntry.find_by_id(
-        doc_id, docentry_load_opts=docentry_eager_relevance_opt
-    )
-    if not doc_info:
+    metadata = get_search_doc_metadata(doc_id, preloaded)
+    if not metadata:
         return None
+    doc_info = metadata.doc_info
+    doc_relevance = metadata.relevance
     par_json_list = []
 
-    doc_relevance = get_document_relevance(doc_info)
-
     for par in par_data:
         par_dict = json.loads(f"{{{par}}}")
         par_id = par_dict["id"]
@@ -398,20 +482,7 @@ def add_doc_info_content_line(
             if not doc_info.document.has_paragraph(par_id):
                 continue
         # Resolve the markdown in full (including references) for better search
-        doc_par = doc_info.document.get_paragraph(par_id)
-        par_md_buf = StringIO()
-        if doc_par.is_par_reference() or doc_par.is_area_reference():
-            try:
-                ref_pars = doc_par.get_referenced_pars()
-            except InvalidReferenceException:
-                par_md_buf.write(doc_par.md)
-            else:
-                for p in ref_pars:
-                    par_md_buf.write(f"{p.md}\n")
-        else:
-            par_md_buf.write(doc_par.md)
-
-        par_md = normalize_newlines(par_md_buf.getvalue())
+        par_md = get_searchable_md(doc_info.document.get_paragraph(par_id))
         # Cherry pick attributes, because others are unnecessary for the search.
         par_attrs = par_dict["attrs"]
         par_json_list.append({"id": par_id, "attrs": par_attrs, "md": par_md})
@@ -439,20 +510,24 @@ def add_doc_info_content_line(
         )
 
 
-def add_doc_info_metadata_line(doc_id: int, target: str) -> str | None:
+def add_doc_info_metadata_line(
+    doc_id: int,
+    target: str,
+    preloaded: dict[int, SearchDocMetadata] | None = None,
+) -> str | None:
     """
     Forms a JSON-compatible string with doc id, relevance and metadata.
 
     :param doc_id: Document id.
     :param target: Search target (title, path, tags)
+    :param preloaded: Metadata loaded with preload_search_metadata.
     :return: String with doc data.
     """
-    doc_info = DocEntry.find_by_id(
-        doc_id, docentry_load_opts=docentry_eager_relevance_opt
-    )
-    if not doc_info:
+    doc_metadata = get_search_doc_metadata(doc_id, preloaded)
+    if not doc_metadata:
         return None
-    doc_relevance = get_document_relevance(doc_info)
+    doc_info = doc_metadata.doc_info
+    doc_relevance = doc_metadata.relevance
 
     match target:
         case "title":
@@ -521,6 +596,12 @@ def create_search_files(remove_deleted_pars=True) -> tuple[int, str]:
     index_log_file_name = SEARCH_CACHE_FOLDER / "index_log.log"
     f: Path = RAW_CONTENT_FILE_PATH.parent
     f.mkdir(exist_ok=True)
+    # Created before reading the paragraphs, so that the documents edited during the build are recorded.
+    index_builder = SearchIndexBuilder()
+
+    # Time spent in each phase of the build, written to the index log afterwards.
+    timings: dict[str, float] = defaultdict(float)
+    phase_start = time.time()
 
     try:
         subprocess.Popen(
@@ -529,13 +610,16 @@ def create_search_files(remove_deleted_pars=True) -> tuple[int, str]:
             shell=True,
         ).communicate()
     except Exception as e:
+        index_builder.abort()
         return (
             400,
             f"Failed to create preliminary file {RAW_CONTENT_FILE_PATH}: {get_error_message(e)}",
         )
+    timings["grep"] = time.time() - phase_start
     try:
         raw_file = RAW_CONTENT_FILE_PATH.open("r", encoding="utf-8")
     except FileNotFoundError:
+        index_builder.abort()
         return 400, f"Failed to open preliminary file {RAW_CONTENT_FILE_PATH}"
     try:
         with raw_file, temp_content_file_name.open(
@@ -551,6 +635,65 @@ def create_search_files(remove_deleted_pars=True) -> tuple[int, str]:
         ) as index_log_file:
             current_doc, current_pars = None, []
 
+            phase_start = time.time()
+            preloaded = preload_search_metadata()
+            timings["metadata preload"] = time.time() - phase_start
+
+            def write_doc(doc_id: int, pars: list[str]) -> None:
+                phase_start = time.time()
+                content_line = add_doc_info_content_line(
+                    doc_id, pars, remove_deleted_pars, preloaded=preloaded
+                )
+                timings["content lines"] += time.time() - phase_start
+
+                phase_start = time.time()
+                title_line = add_doc_info_metadata_line(doc_id, "title", preloaded)
+                paths_line = add_doc_info_metadata_line(doc_id, "path", preloaded)
+                tags_line = add_doc_info_metadata_line(doc_id, "tags", preloaded)
+                timings["metadata lines"] += time.time() - phase_start
+
+                phase_start = time.time()
+                if content_line:
+                    temp_content_file.write(content_line)
+                if title_line:
+                    temp_title_file.write(title_line)
+                if paths_line:
+                    temp_paths_file.write(paths_line)
+                if tags_line:
+                    temp_tags_file.write(tags_line)
+                timings["file writes"] += time.time() - phase_start
+
+                phase_start = time.time()
+                if content_line:
+                    content = json.loads(content_line)
+                    document = get_search_doc_metadata(
+                        doc_id, preloaded
+                    ).doc_info.document
+                    index_builder.add_content(
+                        content["doc_id"],
+                        content["pars"],
+                        document.get_par_ids(),
+                        document.get_version(),
+                    )
+                metadata = {}
+                relevance = None
+                metadata_doc_id = None
+                for target, line in (
+                    ("title", title_line),
+                    ("path", paths_line),
+                    ("tags", tags_line),
+                ):
+                    item = json.loads(line) if line else {}
+                    metadata[target] = item.get(f"doc_{target}")
+                    relevance = item.get("d_r", relevance)
+                    metadata_doc_id = item.get("doc_id", metadata_doc_id)
+                if metadata_doc_id is not None:
+                    index_builder.add_metadata(metadata_doc_id, relevance, metadata)
+                timings["index writes"] += time.time() - phase_start
+
+                # Each document is written once, so its loaded paragraphs can be released.
+                preloaded.pop(doc_id, None)
+
             for line in raw_file:
                 try:
                     doc_id, par_id, par = get_doc_par_id(line)
@@ -563,22 +706,7 @@ def create_search_files(remove_deleted_pars=True) -> tuple[int, str]:
                         current_pars.append(par)
                     # Otherwise save the previous one and empty par data.
                     else:
-                        new_content_line = add_doc_info_content_line(
-                            current_doc, current_pars, remove_deleted_pars
-                        )
-                        new_title_line = add_doc_info_metadata_line(
-                            current_doc, "title"
-                        )
-                        new_paths_line = add_doc_info_metadata_line(current_doc, "path")
-                        new_tags_line = add_doc_info_metadata_line(current_doc, "tags")
-                        if new_content_line:
-                            temp_content_file.write(new_content_line)
-                        if new_title_line:
-                            temp_title_file.write(new_title_line)
-                        if new_paths_line:
-                            temp_paths_file.write(new_paths_line)
-                        if new_tags_line:
-                            temp_tags_file.write(new_tags_line)
+                        write_doc(current_doc, current_pars)
                         current_doc = doc_id
                         current_pars.clear()
                         current_pars.append(par)
@@ -589,21 +717,9 @@ def create_search_files(remove_deleted_pars=True) -> tuple[int, str]:
 
             # Write the last line separately, because loop leaves it unsaved.
             if current_doc and current_pars:
-                new_content_line = add_doc_info_content_line(
-                    current_doc, current_pars, remove_deleted_pars
-                )
-                new_title_line = add_doc_info_metadata_line(current_doc, "title")
-                new_paths_line = add_doc_info_metadata_line(current_doc, "path")
-                new_tags_line = add_doc_info_metadata_line(current_doc, "tags")
-                if new_content_line:
-                    temp_content_file.write(new_content_line)
-                if new_title_line:
-                    temp_title_file.write(new_title_line)
-                if new_paths_line:
-                    temp_paths_file.write(new_paths_line)
-                if new_tags_line:
-                    temp_tags_file.write(new_tags_line)
+                write_doc(current_doc, current_pars)
 
+            phase_start = time.time()
             temp_content_file.flush()
             temp_title_file.flush()
             temp_paths_file.flush()
@@ -612,11 +728,22 @@ def create_search_files(remove_deleted_pars=True) -> tuple[int, str]:
             os.fsync(temp_title_file)
             os.fsync(temp_paths_file)
             os.fsync(temp_tags_file)
+            timings["file writes"] += time.time() - phase_start
 
+        phase_start = time.time()
         temp_content_file_name.rename(PROCESSED_CONTENT_FILE_PATH)
         temp_title_file_name.rename(PROCESSED_TITLE_FILE_PATH)
         temp_paths_file_name.rename(PROCESSED_PATHS_FILE_PATH)
         temp_tags_file_name.rename(PROCESSED_TAGS_FILE_PATH)
+        index_builder.finish()
+        timings["finish"] = time.time() - phase_start
+
+        with index_log_file_name.open("a", encoding="utf-8") as index_log_file:
+            for phase, elapsed in timings.items():
+                index_log_file.write(f"SEARCH_INDEX_TIMING: {phase}: {elapsed:.3f} s\n")
+            index_log_file.write(
+                f"SEARCH_INDEX_TIMING: total: {time.time() - start_time:.3f} s\n"
+            )
 
         log_info(f"Search file indexing took: {time.time() - start_time} seconds")
 
@@ -625,17 +752,20 @@ def create_search_files(remove_deleted_pars=True) -> tuple[int, str]:
             f"Combined and processed index files created to \n"
             f"  {PROCESSED_CONTENT_FILE_PATH}, \n"
             f"  {PROCESSED_TITLE_FILE_PATH}, \n"
-            f"  {PROCESSED_PATHS_FILE_PATH} and \n"
-            f"  {PROCESSED_TAGS_FILE_PATH}",
+            f"  {PROCESSED_PATHS_FILE_PATH}, \n"
+            f"  {PROCESSED_TAGS_FILE_PATH} and \n"
+            f"  {SEARCH_INDEX_PATH}",
         )
     except Exception as e:
+        index_builder.abort()
         return (
             400,
             f"Creating files to \n"
             f"  {PROCESSED_CONTENT_FILE_PATH}, \n"
             f"  {PROCESSED_TITLE_FILE_PATH}, \n"
-            f"  {PROCESSED_PATHS_FILE_PATH} and \n"
-            f"  {PROCESSED_TAGS_FILE_PATH} \n"
+            f"  {PROCESSED_PATHS_FILE_PATH}, \n"
+            f"  {PROCESSED_TAGS_FILE_PATH} and \n"
+            f"  {SEARCH_INDEX_PATH} \n"
             f" failed: {get_error_message(e)}!",
         )
 
@@ -702,6 +832,22 @@ def is_timeouted(start_time: float, timeout: float) -> bool:
     return elapsed_time > timeout
 
 
+def parse_search_line(line: str | bytes) -> dict | None:
+    """
+    Parses a single line of a search file.
+
+    :param line: The line to parse.
+    :return: The search item, or None if the line is empty.
+    """
+    line = line.strip()
+    if not line or len(line) <= 10:
+        return None
+    try:
+        return json.loads(line)
+    except Exception as e:
+        raise Exception(f"Exception while parsing search items: {get_error_message(e)}")
+
+
 def parse_search_items(output_file: list) -> dict:
     """
     Parses a list of search items.
@@ -711,14 +857,9 @@ def parse_search_items(output_file: list) -> dict:
     """
     output_items = {}
     for line in output_file:
-        if line and len(line) > 10:
-            try:
-                line = json.loads(line)
-                output_items[line["doc_id"]] = line
-            except Exception as e:
-                raise Exception(
-                    f"Exception while parsing search items: {get_error_message(e)}"
-                )
+        item = parse_search_line(line)
+        if item is not None:
+            output_items[item["doc_id"]] = item
     return output_items
 
 
@@ -818,27 +959,163 @@ def filter_search_documents(
     return docs
 
 
-def grep_search_file(
-    cmd: list[str], search_file_path: str, search_type: str
-) -> list[str]:
+def iter_search_documents(
+    batches: Iterable[dict],
+    folder: str,
+    user: User,
+    search_owned_docs: bool,
+    ignore_relevance: bool,
+    relevance_threshold: int,
+) -> Iterator[tuple[DocInfo, dict]]:
     """
-    Helper function to grep the specified (text) file
+    Fetches and filters the documents of search items as the batches arrive.
 
-    :param cmd: command to process, along with its arguments
-    :param search_file_path: (text) file to process
-    :param search_type: type of search to perform, dictated by a Request from the UI
-    :return: list of matches
+    :param batches: batches of search items keyed by document id
+    :param folder: folder path that the search is limited to
+    :param user: current user
+    :param search_owned_docs: whether the user's own documents should be included in the search process
+    :param ignore_relevance: whether documents' relevance values should affect search results
+    :param relevance_threshold: threshold value for document relevance check
+    :return: the visible documents along with their search items
     """
-    if not search_file_path.exists():
-        raise NotExist(
-            f"Combined {search_type} file '{search_file_path}' not found, unable to perform {search_type} search!"
+    for search_items in batches:
+        if not search_items:
+            continue
+        doc_infos = filter_search_documents(
+            fetch_search_items(search_items, folder),
+            search_items,
+            user,
+            search_owned_docs,
+            ignore_relevance,
+            relevance_threshold,
         )
-    try:
-        s = subprocess.Popen(cmd + [search_file_path], stdout=subprocess.PIPE)
-        output_str = s.communicate()[0].decode("utf-8").strip()
-        return output_str.splitlines()
-    except Exception as e:
-        raise RouteException(get_error_message(e))
+        for doc_info in doc_infos:
+            yield doc_info, search_items[doc_info.id]
+
+
+class GrepScan:
+    """
+    Runs ripgrep on a search file in a background thread and streams the parsed search items in batches,
+    so that early matches can be processed while the scan is still running.
+    """
+
+    def __init__(self, cmd: list[str], search_file_path: Path, search_type: str):
+        """
+        :param cmd: command to process, along with its arguments
+        :param search_file_path: (text) file to process
+        :param search_type: type of search to perform, dictated by a Request from the UI
+        """
+        if not search_file_path.exists():
+            raise NotExist(
+                f"Combined {search_type} file '{search_file_path}' not found, unable to perform {search_type} search!"
+            )
+        self.cmd = cmd + [str(search_file_path)]
+        self.search_type = search_type
+        self.queue: Queue[dict | Exception | None] = Queue(maxsize=SEARCH_QUEUE_SIZE)
+        self.process: subprocess.Popen | None = None
+        self.finished = False
+        self.timed_out = False
+        self.error: Exception | None = None
+
+    def start(self) -> "GrepScan":
+        try:
+            self.process = subprocess.Popen(self.cmd, stdout=subprocess.PIPE)
+        except Exception as e:
+            raise RouteException(get_error_message(e))
+        Thread(target=self._read, daemon=True).start()
+        return self
+
+    def _read(self) -> None:
+        batch = {}
+        try:
+            for line in self.process.stdout:
+                item = parse_search_line(line)
+                if item is None:
+                    continue
+                batch[item["doc_id"]] = item
+                if len(batch) >= SEARCH_BATCH_SIZE:
+                    self.queue.put(batch)
+                    batch = {}
+            if batch:
+                self.queue.put(batch)
+        except Exception as e:
+            self.queue.put(e)
+        finally:
+            self.queue.put(None)
+
+    def iter_batches(self, deadline: float) -> Iterator[dict]:
+        """
+        Yields the search items as they are parsed.
+
+        Stops when the scan is finished, fails or the deadline is reached.
+
+        :param deadline: time after which the scan is abandoned
+        :return: batches of search items keyed by document id
+        """
+        while not self.finished:
+            try:
+                batch = self.queue.get(timeout=max(deadline - time.time(), 0))
+            except Empty:
+                self.timed_out = True
+                return
+            if batch is None:
+                self.finished = True
+            elif isinstance(batch, Exception):
+                self.error = batch
+            else:
+                yield batch
+
+    def close(self) -> None:
+        """
+        Terminates ripgrep if it is still running, e.g. because a result limit was reached.
+        """
+        if self.process is None:
+            return
+        if self.process.poll() is None:
+            self.process.kill()
+        # Drain the queue so that the reader thread is not left waiting for room in it.
+        while not self.finished:
+            try:
+                self.finished = self.queue.get(timeout=5) is None
+            except Empty:
+                break
+        self.process.wait()
+        self.process.stdout.close()
+
+
+def get_grep_command(
+    query: str,
+    regex: bool,
+    case_sensitive: bool,
+    search_whole_words: bool,
+) -> list[str]:
+    """
+    Builds the ripgrep command for searching the flat search files.
+
+    :param query: Search word.
+    :param regex: Regex search.
+    :param case_sensitive: Distinguish between upper and lower case in search.
+    :param search_whole_words: Search words separated by spaces, commas etc.
+    :return: The command without the file to search.
+    """
+    cmd = ["rg"]
+    # disable printing line numbers into output
+    cmd.append("-N")
+    if case_sensitive:
+        cmd.append("-s")
+    else:
+        cmd.append("-i")
+    if not regex:
+        cmd.append("-F")
+    if search_whole_words:
+        cmd.append("-w")
+    cmd.append("--auto-hybrid-regex")
+    # TODO auto-hybrid-regex option has been deprecated in up-to-date versions of ripgrep,
+    #  use the options below when ripgrep is updated
+    # cmd.append("--engine")
+    # cmd.append("auto")
+    cmd.append(query)
+    return cmd
 
 
 @search_routes.get("")
@@ -875,10 +1152,6 @@ def search():
     validate_query(query, search_whole_words)
 
     incomplete_search_reason = ""
-    content_output = []
-    title_output = []
-    tags_output = []
-    paths_output = []
     content_results = []
     title_results = []
     tags_results = []
@@ -891,90 +1164,101 @@ def search():
 
     term_regex = compile_regex(query, regex, case_sensitive, search_whole_words)
 
-    cmd = ["rg"]
-    # disable printing line numbers into output
-    cmd.append("-N")
-    if case_sensitive:
-        cmd.append("-s")
-    else:
-        cmd.append("-i")
-    if not regex:
-        cmd.append("-F")
-    if search_whole_words:
-        cmd.append("-w")
-    cmd.append("--auto-hybrid-regex")
-    # TODO auto-hybrid-regex option has been deprecated in up-to-date versions of ripgrep,
-    #  use the options below when ripgrep is updated
-    # cmd.append("--engine")
-    # cmd.append("auto")
-    cmd.append(query)
-
+    targets = []
     if should_search_content:
-        content_output = grep_search_file(cmd, content_search_file_path, "content")
-
+        targets.append(("content", content_search_file_path))
     if should_search_titles:
-        title_output = grep_search_file(cmd, title_search_file_path, "title")
-
+        targets.append(("title", title_search_file_path))
     if should_search_tags:
-        tags_output = grep_search_file(cmd, tags_search_file_path, "tags")
-
+        targets.append(("tags", tags_search_file_path))
     if should_search_paths:
-        paths_output = grep_search_file(cmd, paths_search_file_path, "paths")
-
-    if not content_output and not title_output and not tags_output and not paths_output:
-        return json_response(
-            {
-                "title_result_count": title_result_count,
-                "word_result_count": word_result_count,
-                "tags_result_count": tags_result_count,
-                "paths_result_count": paths_result_count,
-                "errors": [],
-                "incomplete_search_reason": incomplete_search_reason,
-                "title_results": title_results,
-                "content_results": content_results,
-                "tags_results": tags_results,
-                "paths_results": paths_results,
-            }
-        )
+        targets.append(("path", paths_search_file_path))
 
-    if should_search_titles:
-        title_results, title_result_count, incomplete_search_reason = search_metadata(
-            request,
-            title_output,
-            "title",
-            start_time,
-            timeout,
-            user,
-            term_regex,
-        )
-    if should_search_content:
-        (
-            content_results,
-            word_result_count,
-            incomplete_search_reason,
-        ) = search_content(
-            request, content_output, start_time, timeout, user, term_regex
-        )
-    if should_search_tags:
-        tags_results, tags_result_count, incomplete_search_reason = search_metadata(
-            request,
-            tags_output,
-            "tags",
-            start_time,
-            timeout,
-            user,
-            term_regex,
-        )
-    if should_search_paths:
-        paths_results, paths_result_count, incomplete_search_reason = search_metadata(
-            request,
-            paths_output,
-            "path",
-            start_time,
-            timeout,
-            user,
-            term_regex,
-        )
+    # All scans are started up front so that they run concurrently while the results are processed.
+    streams: dict[str, Iterable[dict]] = {}
+    scans: dict[str, GrepScan] = {}
+    deadline = start_time + timeout
+    index = SearchIndex()
+    try:
+        for target, search_file_path in targets:
+            # Plain text queries are answered from the inverted index. Regular expressions need a full scan.
+            target_items = (
+                None if regex else index.find_items(target, query, search_whole_words)
+            )
+            if target_items is not None:
+                streams[target] = [target_items]
+                continue
+            scan = GrepScan(
+                get_grep_command(query, regex, case_sensitive, search_whole_words),
+                search_file_path,
+                target,
+            )
+            scans[target] = scan.start()
+            streams[target] = scan.iter_batches(deadline)
+
+        if should_search_titles:
+            (
+                title_results,
+                title_result_count,
+                incomplete_search_reason,
+            ) = search_metadata(
+                request,
+                streams["title"],
+                "title",
+                start_time,
+                timeout,
+                user,
+                term_regex,
+            )
+        if should_search_content:
+            (
+                content_results,
+                word_result_count,
+                incomplete_search_reason,
+            ) = search_content(
+                request, streams["content"], start_time, timeout, user, term_regex
+            )
+        if should_search_tags:
+            tags_results, tags_result_count, incomplete_search_reason = search_metadata(
+                request,
+                streams["tags"],
+                "tags",
+                start_time,
+                timeout,
+                user,
+                term_regex,
+            )
+        if should_search_paths:
+            (
+                paths_results,
+                paths_result_count,
+                incomplete_search_reason,
+            ) = search_metadata(
+                request,
+                streams["path"],
+                "path",
+                start_time,
+                timeout,
+                user,
+                term_regex,
+            )
+    finally:
+        for scan in scans.values():
+            scan.close()
+
+    for target, scan in scans.items():
+        if scan.error:
+            log_search_error(
+                get_error_message(scan.error),
+                query,
+                "",
+                title=(target == "title"),
+                path=(target == "path"),
+            )
+        if scan.timed_out:
+            incomplete_search_reason = (
+                f"{target} search exceeded the timeout ({timeout} seconds)."
+            )
 
     return json_response(
         {
@@ -1014,7 +1298,7 @@ def get_result_instance(result_type: str, alt_num_results: int) -> SearchResult:
 
 def search_metadata(
     req: Request,
-    grep_output: list,
+    search_batches: Iterable[dict],
     target: str,
     start_time: float,
     timeout: float,
@@ -1025,7 +1309,7 @@ def search_metadata(
     Performs a search and collates search results for a type of search in a search index
 
     :param req: search request containing search options
-    :param grep_output: temporary in-memory search index
+    :param search_batches: batches of candidate search items keyed by document id
     :param target: type of search ("content", "title", "path" or "tags")
     :param start_time: start time of the search process in seconds
     :param timeout: timeout limit for the search process
@@ -1050,29 +1334,14 @@ def search_metadata(
     search_result_count = 0
     search_results = []
 
-    search_items = {}
-    try:
-        search_items = parse_search_items(grep_output)
-    except Exception as e:
-        log_search_error(
-            get_error_message(e),
-            query,
-            current_doc,
-            title=(target == "title"),
-            path=(target == "path"),
-        )
-
-    doc_infos: list[DocInfo] = fetch_search_items(search_items, folder)
-    doc_infos = filter_search_documents(
-        doc_infos,
-        search_items,
+    for doc_info, line_info in iter_search_documents(
+        search_batches,
+        folder,
         user,
         search_owned_docs,
         ignore_relevance,
         relevance_threshold,
-    )
-
-    for doc_info in doc_infos:
+    ):
         current_doc = doc_info.title
         try:
             if is_timeouted(start_time, timeout):
@@ -1081,7 +1350,6 @@ def search_metadata(
                 )
                 raise TimeoutError(f"{target} search timeout")
 
-            line_info = search_items[doc_info.id]
             doc_result = DocResult(doc_info)
 
             search_matches = list(term_regex.finditer(line_info[f"doc_{target}"]))
@@ -1118,7 +1386,7 @@ def search_metadata(
 
 def search_content(
     req: Request,
-    content_output: list,
+    content_batches: Iterable[dict],
     start_time: float,
     timeout: float,
     user: User,
@@ -1128,7 +1396,7 @@ def search_content(
     Performs a document content search and collates the search results
 
     :param req: search request containing search options
-    :param content_output: temporary in-memory content search index
+    :param content_batches: batches of candidate content search items keyed by document id
     :param start_time: start time of the search process in seconds
     :param timeout: timeout limit for the search process
     :param user: current user object
@@ -1156,23 +1424,14 @@ def search_content(
     word_result_count = 0
     content_results = []
 
-    content_items = {}
-    try:
-        content_items = parse_search_items(content_output)
-    except Exception as e:
-        log_search_error(get_error_message(e), query, current_doc)
-
-    doc_infos: list[DocInfo] = fetch_search_items(content_items, folder)
-    doc_infos = filter_search_documents(
-        doc_infos,
-        content_items,
+    for doc_info, line_info in iter_search_documents(
+        content_batches,
+        folder,
         user,
         search_owned_docs,
         ignore_relevance,
         relevance_threshold,
-    )
-
-    for doc_info in doc_infos:
+    ):
         current_doc = doc_info.title
         try:
             if is_timeouted(start_time, timeout):
@@ -1181,7 +1440,6 @@ def search_content(
                 )
                 raise TimeoutError("content search timeout")
 
-            line_info = content_items[doc_info.id]
             pars = line_info["pars"]
 
             doc_result = DocResult(doc_info)
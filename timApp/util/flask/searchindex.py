@@ -0,0 +1,576 @@
+"""Persistent inverted index for document search.
+
+The index is an SQLite database in the search cache folder. It stores
+
+* the searchable paragraphs of each document (resolved markdown and attributes),
+* the title, path, tags and relevance of each document,
+* postings from each lowercased word to the document paragraphs (or document metadata) that contain it,
+* the vocabulary of all indexed words.
+
+A query is answered by looking up candidate paragraphs or documents from the postings. The candidates are then
+matched with the same regular expression as before, so case sensitivity, whole-word search and relevance
+behave the same as with the flat search files. Because paragraphs are stored lowercased in the postings only,
+the lookup can only narrow down the candidates and never decides the match by itself.
+
+A full rebuild writes a new database file and then switches the ``search_index.db`` symlink to it, so searches can
+continue while the index is rebuilt. Between rebuilds, the index is updated in Celery after document edits, renames,
+moves and tag changes. Each update brings the document from its indexed version to the latest one, so the updates
+can run in any order. Documents updated while a rebuild is in progress are recorded in a journal and reindexed once
+the new database has replaced the old one.
+"""
+
+import json
+import os
+import re
+import sqlite3
+import time
+from contextlib import closing
+from io import StringIO
+from pathlib import Path
+from typing import Any, Iterable
+
+from flask import current_app
+
+from timApp.document.docinfo import DocInfo
+from timApp.document.document import Document
+from timApp.document.version import Version
+from timApp.timdb.exceptions import InvalidReferenceException
+from timApp.util.logger import log_warning
+from timApp.util.utils import cache_folder_path, normalize_newlines
+
+SEARCH_INDEX_PATH = cache_folder_path / "searchcache" / "search_index.db"
+
+WORD_RE = re.compile(r"\w+")
+
+CONTENT_FIELD = "content"
+METADATA_FIELDS = ("title", "path", "tags")
+
+# Maximum number of SQL variables in a single IN clause.
+SQL_CHUNK_SIZE = 500
+
+SCHEMA = """
+CREATE TABLE docs (
+    doc_id INTEGER PRIMARY KEY,
+    relevance INTEGER,
+    title TEXT,
+    path TEXT,
+    tags TEXT
+);
+CREATE TABLE pars (
+    doc_id INTEGER NOT NULL,
+    par_id TEXT NOT NULL,
+    pos INTEGER NOT NULL,
+    attrs TEXT NOT NULL,
+    md TEXT NOT NULL,
+    PRIMARY KEY (doc_id, par_id)
+);
+CREATE TABLE postings (
+    word TEXT NOT NULL,
+    field TEXT NOT NULL,
+    doc_id INTEGER NOT NULL,
+    par_id TEXT NOT NULL,
+    PRIMARY KEY (word, field, doc_id, par_id)
+) WITHOUT ROWID;
+CREATE TABLE vocab (
+    word TEXT PRIMARY KEY
+) WITHOUT ROWID;
+CREATE TABLE doc_versions (
+    doc_id INTEGER PRIMARY KEY,
+    major INTEGER NOT NULL,
+    minor INTEGER NOT NULL
+);
+"""
+
+SECONDARY_INDEXES = """
+CREATE INDEX postings_doc ON postings (doc_id, par_id);
+"""
+
+
+def tokenize(text: str) -> set[str]:
+    """Returns the distinct lowercased words of the text."""
+    return set(WORD_RE.findall(text.lower()))
+
+
+def get_searchable_md(doc_par) -> str:
+    """Returns the markdown of a paragraph for searching, with paragraph and area references resolved.
+
+    :param doc_par: The paragraph.
+    :return: The markdown with normalized newlines.
+    """
+    par_md_buf = StringIO()
+    if doc_par.is_par_reference() or doc_par.is_area_reference():
+        try:
+            ref_pars = doc_par.get_referenced_pars()
+        except InvalidReferenceException:
+            par_md_buf.write(doc_par.md)
+        else:
+            for p in ref_pars:
+                par_md_buf.write(f"{p.md}\n")
+    else:
+        par_md_buf.write(doc_par.md)
+    return normalize_newlines(par_md_buf.getvalue())
+
+
+def _like_escape(s: str) -> str:
+    return s.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _chunks(items: list, size: int = SQL_CHUNK_SIZE) -> Iterable[list]:
+    for i in range(0, len(items), size):
+        yield items[i : i + size]
+
+
+def _connect(path: Path) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+def _write_document(
+    conn: sqlite3.Connection,
+    doc_id: int,
+    relevance: int | None,
+    metadata: dict[str, str | None],
+) -> None:
+    conn.execute(
+        "INSERT OR REPLACE INTO docs (doc_id, relevance, title, path, tags) VALUES (?, ?, ?, ?, ?)",
+        (doc_id, relevance, metadata["title"], metadata["path"], metadata["tags"]),
+    )
+    for field in METADATA_FIELDS:
+        value = metadata[field]
+        if value:
+            _write_postings(conn, field, doc_id, "", tokenize(value))
+
+
+def _write_par(
+    conn: sqlite3.Connection, doc_id: int, pos: int, par: dict[str, Any]
+) -> None:
+    par_id = par["id"]
+    attrs = par["attrs"]
+    md = par["md"]
+    conn.execute(
+        "INSERT OR REPLACE INTO pars (doc_id, par_id, pos, attrs, md) VALUES (?, ?, ?, ?, ?)",
+        (doc_id, par_id, pos, json.dumps(attrs, ensure_ascii=False), md),
+    )
+    # Attributes are included because they are searched with the searchAttrs option.
+    words = tokenize(md) | tokenize(str(attrs))
+    _write_postings(conn, CONTENT_FIELD, doc_id, par_id, words)
+
+
+def _write_postings(
+    conn: sqlite3.Connection, field: str, doc_id: int, par_id: str, words: set[str]
+) -> None:
+    conn.executemany(
+        "INSERT OR IGNORE INTO postings (word, field, doc_id, par_id) VALUES (?, ?, ?, ?)",
+        ((w, field, doc_id, par_id) for w in words),
+    )
+    conn.executemany(
+        "INSERT OR IGNORE INTO vocab (word) VALUES (?)", ((w,) for w in words)
+    )
+
+
+def _delete_pars(conn: sqlite3.Connection, doc_id: int, par_ids: list[str]) -> None:
+    for chunk in _chunks(par_ids):
+        marks = ",".join("?" * len(chunk))
+        conn.execute(
+            f"DELETE FROM postings WHERE doc_id = ? AND par_id IN ({marks})",
+            (doc_id, *chunk),
+        )
+        conn.execute(
+            f"DELETE FROM pars WHERE doc_id = ? AND par_id IN ({marks})",
+            (doc_id, *chunk),
+        )
+
+
+def _replace_document(
+    conn: sqlite3.Connection,
+    doc_id: int,
+    relevance: int | None,
+    metadata: dict[str, str | None],
+) -> None:
+    conn.execute("DELETE FROM postings WHERE doc_id = ? AND par_id = ''", (doc_id,))
+    _write_document(conn, doc_id, relevance, metadata)
+
+
+def _write_version(conn: sqlite3.Connection, doc_id: int, ver: Version) -> None:
+    conn.execute(
+        "INSERT OR REPLACE INTO doc_versions (doc_id, major, minor) VALUES (?, ?, ?)",
+        (doc_id, *ver),
+    )
+
+
+def _get_metadata(doc_info: DocInfo) -> dict[str, str | None]:
+    tags = doc_info.block.tags
+    return {
+        "title": doc_info.title,
+        "path": doc_info.path,
+        "tags": " ".join(tag.name for tag in tags) if tags else None,
+    }
+
+
+def _get_journal_path(index_path: Path) -> Path:
+    return index_path.with_name(f"{index_path.stem}.journal")
+
+
+class SearchIndexBuilder:
+    """Builds a new search index from scratch.
+
+    Usage: create the builder before reading any documents, call :meth:`add_content` and :meth:`add_metadata` for
+    each document, then :meth:`finish`. Documents that are updated in the meantime are recorded in a journal and
+    reindexed by :meth:`finish`.
+    """
+
+    def __init__(self, index_path: Path = SEARCH_INDEX_PATH) -> None:
+        self.index_path = index_path
+        self.index_path.parent.mkdir(parents=True, exist_ok=True)
+        self.journal_path = _get_journal_path(index_path)
+        self.journal_path.write_text("", encoding="utf-8")
+        self.db_path = index_path.with_name(
+            f"{index_path.stem}.{int(time.time() * 1000)}.db"
+        )
+        self.conn = sqlite3.connect(self.db_path)
+        self.conn.execute("PRAGMA journal_mode=OFF")
+        self.conn.execute("PRAGMA synchronous=OFF")
+        self.conn.executescript(SCHEMA)
+
+    def add_content(
+        self,
+        doc_id: int,
+        pars: list[dict[str, Any]],
+        par_ids: list[str],
+        version: Version,
+    ) -> None:
+        """Adds the paragraphs of a document.
+
+        :param doc_id: The document id.
+        :param pars: Paragraph dicts with id, attrs and md.
+        :param par_ids: The paragraph ids of the document version in document order. The positions of the
+         paragraphs are taken from it, the same way as in incremental updates.
+        :param version: The document version that the paragraphs are from.
+        """
+        positions = {par_id: pos for pos, par_id in enumerate(par_ids)}
+        for i, par in enumerate(pars):
+            pos = positions.get(par["id"], len(par_ids) + i)
+            _write_par(self.conn, doc_id, pos, par)
+        _write_version(self.conn, doc_id, version)
+
+    def add_metadata(
+        self, doc_id: int, relevance: int | None, metadata: dict[str, str | None]
+    ) -> None:
+        """Adds the relevance and the title, path and tags of a document."""
+        _write_document(self.conn, doc_id, relevance, metadata)
+
+    def finish(self) -> None:
+        """Creates the secondary indexes, makes the new index the current one and reindexes the documents that
+        were updated during the build."""
+        self.conn.executescript(SECONDARY_INDEXES)
+        self.conn.commit()
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.close()
+        tmp_link = self.index_path.with_name(f".{self.index_path.name}.tmp")
+        tmp_link.unlink(missing_ok=True)
+        tmp_link.symlink_to(self.db_path.name)
+        old_target = self.index_path.resolve() if self.index_path.is_symlink() else None
+        os.replace(tmp_link, self.index_path)
+        if old_target is not None and old_target != self.db_path:
+            # Processes that still have the old database open can keep using it until they close it.
+            for suffix in ("", "-wal", "-shm"):
+                Path(f"{old_target}{suffix}").unlink(missing_ok=True)
+        # Updates that start after this write straight to the new index.
+        replay_path = self.journal_path.with_name(f"{self.journal_path.name}.replay")
+        os.replace(self.journal_path, replay_path)
+        doc_ids = sorted({int(line) for line in replay_path.read_text("utf-8").split()})
+        index = SearchIndex(self.index_path)
+        for doc_id in doc_ids:
+            try:
+                index.update_document(doc_id, reindex=True)
+            except Exception as e:
+                log_warning(f"Could not update search index for document {doc_id}: {e}")
+        replay_path.unlink()
+
+    def abort(self) -> None:
+        self.conn.close()
+        self.db_path.unlink(missing_ok=True)
+        self.journal_path.unlink(missing_ok=True)
+
+
+class SearchIndex:
+    def __init__(self, index_path: Path = SEARCH_INDEX_PATH) -> None:
+        self.index_path = index_path
+
+    def exists(self) -> bool:
+        return self.index_path.exists()
+
+    def find_items(
+        self, target: str, query: str, whole_words: bool
+    ) -> dict[int, dict[str, Any]] | None:
+        """Finds the candidate documents for a query.
+
+        :param target: The search target: "content", "title", "path" or "tags".
+        :param query: The search text. It is interpreted as plain text, not as a regular expression.
+        :param whole_words: Whether only whole words are matched.
+        :return: Search items in the same format as the lines of the flat search files, keyed by document id,
+         or None if the index cannot answer the query.
+        """
+        if not self.exists():
+            return None
+        terms = self._get_terms(query, whole_words)
+        if not terms:
+            return None
+        with closing(_connect(self.index_path)) as conn:
+            candidates: set[tuple[int, str]] | None = None
+            for term, mode in sorted(terms, key=lambda t: t[1] != "exact"):
+                words = self._find_words(conn, term, mode)
+                matches = self._find_postings(conn, target, words)
+                candidates = matches if candidates is None else candidates & matches
+                if not candidates:
+                    return {}
+            return self._load_items(conn, target, candidates)
+
+    @staticmethod
+    def _get_terms(query: str, whole_words: bool) -> list[tuple[str, str]]:
+        """Splits the query into words and determines how each word must match an indexed word.
+
+        A query word at the start or the end of the query may continue an indexed word unless whole words are
+        searched. For example, in the query "ouse cat", the indexed word must end with "ouse" and start with "cat".
+        """
+        lowered = query.lower()
+        matches = list(WORD_RE.finditer(lowered))
+        terms = []
+        for i, m in enumerate(matches):
+            open_start = not whole_words and i == 0 and m.start() == 0
+            open_end = (
+                not whole_words and i == len(matches) - 1 and m.end() == len(lowered)
+            )
+            if open_start and open_end:
+                mode = "substring"
+            elif open_start:
+                mode = "suffix"
+            elif open_end:
+                mode = "prefix"
+            else:
+                mode = "exact"
+            terms.append((m.group(), mode))
+        return terms
+
+    @staticmethod
+    def _find_words(conn: sqlite3.Connection, term: str, mode: str) -> list[str]:
+        if mode == "exact":
+            return [term]
+        if mode == "prefix":
+            upper = term[:-1] + chr(ord(term[-1]) + 1)
+            rows = conn.execute(
+                "SELECT word FROM vocab WHERE word >= ? AND word < ?", (term, upper)
+            )
+        else:
+            escaped = _like_escape(term)
+            pattern = f"%{escaped}" if mode == "suffix" else f"%{escaped}%"
+            rows = conn.execute(
+                "SELECT word FROM vocab WHERE word LIKE ? ESCAPE '\\'", (pattern,)
+            )
+        return [r[0] for r in rows]
+
+    @staticmethod
+    def _find_postings(
+        conn: sqlite3.Connection, target: str, words: list[str]
+    ) -> set[tuple[int, str]]:
+        result = set()
+        for chunk in _chunks(words):
+            marks = ",".join("?" * len(chunk))
+            result.update(
+                conn.execute(
+                    f"SELECT doc_id, par_id FROM postings WHERE field = ? AND word IN ({marks})",
+                    (target, *chunk),
+                )
+            )
+        return result
+
+    @staticmethod
+    def _load_items(
+        conn: sqlite3.Connection, target: str, candidates: set[tuple[int, str]]
+    ) -> dict[int, dict[str, Any]]:
+        doc_ids = sorted({doc_id for doc_id, _ in candidates})
+        items: dict[int, dict[str, Any]] = {}
+        for chunk in _chunks(doc_ids):
+            marks = ",".join("?" * len(chunk))
+            for doc_id, relevance, title, path, tags in conn.execute(
+                f"SELECT doc_id, relevance, title, path, tags FROM docs WHERE doc_id IN ({marks})",
+                chunk,
+            ):
+                item: dict[str, Any] = {"doc_id": doc_id}
+                if relevance is not None:
+                    item["d_r"] = relevance
+                if target != CONTENT_FIELD:
+                    item[f"doc_{target}"] = {
+                        "title": title,
+                        "path": path,
+                        "tags": tags,
+                    }[target]
+                items[doc_id] = item
+        if target != CONTENT_FIELD:
+            return items
+
+        pars_by_doc: dict[int, list[str]] = {}
+        for doc_id, par_id in candidates:
+            pars_by_doc.setdefault(doc_id, []).append(par_id)
+        for doc_id, par_ids in pars_by_doc.items():
+            # Documents that have been added after the latest rebuild have no metadata yet.
+            item = items.setdefault(doc_id, {"doc_id": doc_id})
+            pars = []
+            for chunk in _chunks(par_ids):
+                marks = ",".join("?" * len(chunk))
+                pars.extend(
+                    conn.execute(
+                        f"SELECT pos, rowid, par_id, attrs, md FROM pars WHERE doc_id = ? AND par_id IN ({marks})",
+                        (doc_id, *chunk),
+                    )
+                )
+            pars.sort()
+            item["pars"] = [
+                {"id": par_id, "attrs": json.loads(attrs), "md": md}
+                for _, _, par_id, attrs, md in pars
+            ]
+        return items
+
+    def _record_for_rebuild(self, doc_id: int) -> None:
+        """Records the document in the journal of a rebuild that is in progress, if any.
+
+        This must be done before connecting to the index. Otherwise, the update could be written to a database that
+        is replaced after the rebuild has already replayed its journal.
+        """
+        try:
+            fd = os.open(_get_journal_path(self.index_path), os.O_WRONLY | os.O_APPEND)
+        except FileNotFoundError:
+            return
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(f"{doc_id}\n")
+
+    def update_document(self, doc_id: int, reindex: bool = False) -> None:
+        """Brings the paragraphs and metadata of a document up to date.
+
+        Only the paragraphs that differ from the indexed version are reindexed.
+
+        :param doc_id: The document id.
+        :param reindex: Whether to reindex all paragraphs. This is also done if the indexed version is not known.
+        """
+        self._record_for_rebuild(doc_id)
+        if not self.exists():
+            return
+        # Imported here to avoid a circular import; the route module imports a lot.
+        from timApp.document.docentry import DocEntry
+        from timApp.item.routes import get_document_relevance
+
+        doc_info = DocEntry.find_by_id(doc_id)
+        if doc_info is None:
+            return
+        metadata = _get_metadata(doc_info)
+        relevance = get_document_relevance(doc_info)
+        # The Document of the DocInfo may have cached an older version.
+        doc = Document(doc_id)
+        doc.docinfo = doc_info
+        store = doc.get_version_store()
+        with closing(_connect(self.index_path)) as conn, conn:
+            # The indexed version is read and written in the same write transaction, so concurrent updates of
+            # the document are applied one after another.
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT major, minor FROM doc_versions WHERE doc_id = ?", (doc_id,)
+            ).fetchone()
+            new_version = doc.get_version()
+            new_lines = store.read_lines(new_version)
+            old_version = (row[0], row[1]) if row and not reindex else None
+            old_lines = store.read_lines(old_version) if old_version else []
+            old_positions = {line: pos for pos, line in enumerate(old_lines)}
+            new_ids = {line.split("/")[0] for line in new_lines}
+            removed = [
+                par_id
+                for par_id in (line.split("/")[0] for line in old_lines)
+                if par_id not in new_ids
+            ]
+            changed = [
+                (pos, line.split("/")[0])
+                for pos, line in enumerate(new_lines)
+                if line not in old_positions
+            ]
+            # Unchanged paragraphs after an inserted or deleted one only need a new position.
+            moved = [
+                (pos, line.split("/")[0])
+                for pos, line in enumerate(new_lines)
+                if old_positions.get(line, pos) != pos
+            ]
+            if old_version is None:
+                conn.execute("DELETE FROM postings WHERE doc_id = ?", (doc_id,))
+                conn.execute("DELETE FROM pars WHERE doc_id = ?", (doc_id,))
+            else:
+                _delete_pars(conn, doc_id, removed + [p for _, p in changed])
+            for pos, par_id in changed:
+                doc_par = doc.get_paragraph(par_id)
+                par = {
+                    "id": par_id,
+                    "attrs": doc_par.get_attrs(),
+                    "md": get_searchable_md(doc_par),
+                }
+                _write_par(conn, doc_id, pos, par)
+            conn.executemany(
+                "UPDATE pars SET pos = ? WHERE doc_id = ? AND par_id = ?",
+                ((pos, doc_id, par_id) for pos, par_id in moved),
+            )
+            _write_version(conn, doc_id, new_version)
+            _replace_document(conn, doc_id, relevance, metadata)
+
+    def update_metadata(self, doc_id: int) -> None:
+        """Updates the relevance and the title, path and tags of a document, for example after it has been renamed.
+
+        :param doc_id: The document id.
+        """
+        self._record_for_rebuild(doc_id)
+        if not self.exists():
+            return
+        # Imported here to avoid a circular import; the route module imports a lot.
+        from timApp.document.docentry import DocEntry
+        from timApp.item.routes import get_document_relevance
+
+        doc_info = DocEntry.find_by_id(doc_id)
+        if doc_info is None:
+            return
+        metadata = _get_metadata(doc_info)
+        relevance = get_document_relevance(doc_info)
+        with closing(_connect(self.index_path)) as conn, conn:
+            _replace_document(conn, doc_id, relevance, metadata)
+
+
+def apply_search_index_update(doc_ids: list[int], content: bool) -> None:
+    """Updates the search index for the given documents. Errors are logged, not raised.
+
+    :param doc_ids: The document ids.
+    :param content: Whether the paragraphs have changed too, or only the metadata.
+    """
+    index = SearchIndex()
+    for doc_id in doc_ids:
+        try:
+            if content:
+                index.update_document(doc_id)
+            else:
+                index.update_metadata(doc_id)
+        except Exception as e:
+            log_warning(f"Could not update search index for document {doc_id}: {e}")
+
+
+def update_search_index(doc_ids: list[int], content: bool = True) -> None:
+    """Schedules a search index update after the documents have been edited, renamed, moved or tagged.
+
+    The update is run in Celery if SEARCH_INDEX_UPDATE_CELERY is enabled, so the request does not wait for the
+    index to be written. The changes must have been committed before calling this.
+
+    :param doc_ids: The document ids.
+    :param content: Whether the paragraphs have changed too, or only the metadata.
+    """
+    if not doc_ids:
+        return
+    if current_app.config["SEARCH_INDEX_UPDATE_CELERY"]:
+        from timApp.tim_celery import update_search_index_task
+
+        update_search_index_task.delay(doc_ids, content)
+    else:
+        apply_search_index_update(doc_ids, content)
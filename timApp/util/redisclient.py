@@ -0,0 +1,4 @@
+import redis
+
+# Redis client shared by the caches in TIM. Uses the same database (0) as Celery.
+rclient = redis.Redis(host="redis")
@@ -1,46 +1,148 @@
-"""Functions for dealing taking time."""
+"""Request-level timing.
+
+Every request gets a RequestTrace. The taketime probes record the time since the previous probe, and the
+hooks installed at startup add the time spent in database queries, Dumbo and plugin requests.
+After the request, the trace is reported in the Server-Timing header (TRACE_SERVER_TIMING) and, for
+TRACE_LOG_SAMPLE_PERCENT percent of the requests, as a JSON line in the log.
+"""
 import inspect
+import json
+import random
+import re
+import threading
 import time
+from collections import defaultdict
 from functools import wraps
 from typing import Callable, Any
 
+from flask import g, has_app_context, current_app, request, Response
+
 from timApp.util.logger import log_info
 
-timing_last = time.perf_counter()
-timing_last_t = time.time()
-timing_last_z = time.perf_counter()
-timing_last_t_z = time.time()
-
-
-# print(timing_last, timing_last_t)
-
-
-def taketime(s1: str = "", s2: str = "", n: int = 0, zero: bool = False) -> None:
-    return  # comment this to take times, uncomment for production and tests
-    global timing_last
-    global timing_last_t
-    global timing_last_z
-    global timing_last_t_z
-    t22 = time.perf_counter()
-    t22t = time.time()
-    if zero:
-        timing_last_z = t22
-        timing_last_t_z = t22t
-
-    print(
-        "%-20s %-15s %6d - %7.4f %7.4f %7.4f %7.4f"
-        % (
-            s1,
-            s2,
-            n,
-            (t22 - timing_last),
-            (t22t - timing_last_t),
-            (t22 - timing_last_z),
-            (t22t - timing_last_t_z),
+# Categories whose time is accumulated from the hooks.
+TRACE_CATEGORIES = ("db", "dumbo", "plugin")
+
+# Maximum number of probe spans in the Server-Timing header. The log gets all of them.
+MAX_SERVER_TIMING_SPANS = 30
+
+SERVER_TIMING_NAME_RE = re.compile(r"[^A-Za-z0-9_.-]+")
+
+
+class RequestTrace:
+    def __init__(self) -> None:
+        self.start = time.perf_counter()
+        self.last = self.start
+        self.spans: list[tuple[str, float]] = []
+        self.totals: dict[str, float] = defaultdict(float)
+        self.counts: dict[str, int] = defaultdict(int)
+        # Plugins are rendered in worker threads that share the trace of the request.
+        self.lock = threading.Lock()
+
+    def mark(self, name: str, elapsed: float | None = None) -> None:
+        """Records a probe span.
+
+        :param name: Name of the probe.
+        :param elapsed: The duration of the span. Defaults to the time since the previous probe.
+        """
+        now = time.perf_counter()
+        with self.lock:
+            if elapsed is None:
+                elapsed = now - self.last
+                self.last = now
+            self.spans.append((name, elapsed))
+
+    def add(self, category: str, elapsed: float) -> None:
+        with self.lock:
+            self.totals[category] += elapsed
+            self.counts[category] += 1
+
+    def get_total(self) -> float:
+        return time.perf_counter() - self.start
+
+    def to_server_timing(self) -> str:
+        parts = [f"total;dur={self.get_total() * 1000:.1f}"]
+        for c in TRACE_CATEGORIES:
+            if self.counts[c]:
+                parts.append(
+                    f'{c};dur={self.totals[c] * 1000:.1f};desc="{self.counts[c]} calls"'
+                )
+        for i, (name, elapsed) in enumerate(self.spans[:MAX_SERVER_TIMING_SPANS]):
+            metric = SERVER_TIMING_NAME_RE.sub("_", name).strip("_") or "span"
+            desc = name.replace("\\", "").replace('"', "")
+            parts.append(f'{i}_{metric};dur={elapsed * 1000:.1f};desc="{desc}"')
+        return ", ".join(parts)
+
+    def to_json(self) -> dict[str, Any]:
+        return {
+            "total": round(self.get_total(), 4),
+            **{
+                c: {"time": round(self.totals[c], 4), "count": self.counts[c]}
+                for c in TRACE_CATEGORIES
+            },
+            "spans": [[name, round(elapsed, 4)] for name, elapsed in self.spans],
+        }
+
+
+def get_current_trace() -> RequestTrace | None:
+    if not has_app_context():
+        return None
+    return g.get("request_trace")
+
+
+def start_request_trace() -> None:
+    g.request_trace = RequestTrace()
+
+
+def finish_request_trace(resp: Response) -> None:
+    """Reports the trace of the current request."""
+    trace = get_current_trace()
+    if not trace:
+        return
+    if current_app.config["TRACE_SERVER_TIMING"]:
+        resp.headers["Server-Timing"] = trace.to_server_timing()
+    sample_percent = current_app.config["TRACE_LOG_SAMPLE_PERCENT"]
+    if sample_percent and random.random() * 100 < sample_percent:
+        log_info(
+            "TRACE "
+            + json.dumps(
+                {
+                    "method": request.method,
+                    "path": request.path,
+                    "status": resp.status_code,
+                    **trace.to_json(),
+                }
+            )
         )
-    )
-    timing_last = t22
-    timing_last_t = t22t
+
+
+def add_trace_time(category: str, elapsed: float) -> None:
+    """Adds time to one of the TRACE_CATEGORIES of the current request, if any."""
+    trace = get_current_trace()
+    if trace:
+        trace.add(category, elapsed)
+
+
+def taketime(
+    s1: str = "",
+    s2: str = "",
+    n: int = 0,
+    elapsed: float | None = None,
+) -> None:
+    """Records the time since the previous call in the trace of the current request.
+
+    :param s1: Name of the probe.
+    :param s2: Additional name of the probe.
+    :param n: A number that is added to the name, e.g. the number of processed items.
+    :param elapsed: If given, this duration is recorded instead of the time since the previous call. Use it for
+     operations that run concurrently.
+    """
+    trace = get_current_trace()
+    if not trace:
+        return
+    name = f"{s1} {s2}".strip()
+    if n:
+        name += f" {n}"
+    trace.mark(name, elapsed)
 
 
 def with_timing(*print_args: str) -> Callable:
@@ -1,5 +1,6 @@
-from collections import defaultdict
-from typing import Any, Callable
+from collections import defaultdict, OrderedDict
+from threading import Lock
+from typing import Any, Callable, Generic, Hashable, TypeVar
 
 
 class keydefaultdict(defaultdict):
@@ -19,3 +20,71 @@ class keydefaultdict(defaultdict):
             def_key: Callable[[Any], Any] = self.default_factory  # type: ignore
             ret = self[key] = def_key(key)
             return ret
+
+
+V = TypeVar("V")
+
+
+class SizedLRUCache(Generic[V]):
+    """
+    Thread-safe LRU cache that is bounded by the total size of its values.
+
+    The size of each value is given by the caller when the value is stored.
+    Least recently used values are evicted until the total size fits in the limit.
+    Hit, miss and eviction counts are kept for monitoring.
+    """
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self._data: OrderedDict[Hashable, tuple[V, int]] = OrderedDict()
+        self._lock = Lock()
+        self.total_size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> V | None:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, key: Hashable, value: V, size: int) -> None:
+        if size > self.max_size:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.total_size -= old[1]
+            self._data[key] = (value, size)
+            self.total_size += size
+            while self.total_size > self.max_size:
+                _, (_, evicted_size) = self._data.popitem(last=False)
+                self.total_size -= evicted_size
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.total_size = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        """Checks whether the key is cached without affecting the LRU order or statistics."""
+        return key in self._data
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "entries": len(self._data),
+            "size": self.total_size,
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
@@ -1,9 +1,13 @@
 """Defines a client interface for using Dumbo, the markdown converter."""
 import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
-from typing import NamedTuple, overload, Any, Type
+from typing import NamedTuple, overload, Any, Type, Callable
 
 import requests
+from requests.adapters import HTTPAdapter
 
 from tim_common.timjsonencoder import TimJsonEncoder
 
@@ -93,6 +97,75 @@ DUMBO_URL = "http://dumbo:5000"
 
 KEYS_PATHS = {"/mdkeys", "/latexkeys"}
 
+DUMBO_CONNECT_TIMEOUT = 5
+"""Timeout in seconds for connecting to Dumbo."""
+
+DUMBO_READ_TIMEOUT = 120
+"""Timeout in seconds for reading the response of a single Dumbo request."""
+
+DUMBO_RETRIES = 2
+"""How many times a request is retried if the connection fails or is reset."""
+
+DUMBO_CHUNK_SIZE = 100
+"""Maximum number of items sent in a single request. Larger lists are split into several requests."""
+
+DUMBO_MAX_CONCURRENCY = 4
+"""Maximum number of concurrent requests per call. Dumbo converts each request in its own process."""
+
+dumbo_call_listener: Callable[[float], None] | None = None
+"""If set, called with the duration of every call_dumbo call in seconds. TIM uses this for request timing."""
+
+_session: requests.Session | None = None
+_session_pid: int | None = None
+
+
+def get_dumbo_session() -> requests.Session:
+    """Returns a keep-alive session for Dumbo requests.
+
+    The session is shared by the whole process. A new one is created after a fork so that workers do not share
+    connections.
+    """
+    global _session, _session_pid
+    pid = os.getpid()
+    if _session is None or _session_pid != pid:
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=1, pool_maxsize=DUMBO_MAX_CONCURRENCY * 4
+        )
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        _session = session
+        _session_pid = pid
+    return _session
+
+
+def _post_to_dumbo(path: str, data_to_send: dict) -> Any:
+    body = json.dumps(data_to_send, cls=TimJsonEncoder)
+    session = get_dumbo_session()
+    for attempt in range(DUMBO_RETRIES + 1):
+        try:
+            r = session.post(
+                url=DUMBO_URL + path,
+                data=body,
+                timeout=(DUMBO_CONNECT_TIMEOUT, DUMBO_READ_TIMEOUT),
+            )
+            break
+        except requests.Timeout:
+            # Retrying a slow conversion would only make it slower.
+            raise Exception("Dumbo did not respond in time")
+        except requests.ConnectionError:
+            # Also covers keep-alive connections that Dumbo has closed in the meantime.
+            if attempt == DUMBO_RETRIES:
+                raise Exception("Failed to connect to Dumbo")
+    r.encoding = "utf-8"
+    if r.status_code != 200:
+        raise DumboHTMLException()
+    return r.json()
+
+
+def _split_chunks(items: list, size: int) -> list[list]:
+    return [items[i : i + size] for i in range(0, len(items), size)]
+
 
 @overload
 def call_dumbo(
@@ -141,37 +214,60 @@ def call_dumbo(
      Otherwise, data is expected to be a List[str]. Each string is interpreted as Pandoc markdown and is converted to
      HTML. The return value format will be the same as input.
 
+    Lists longer than DUMBO_CHUNK_SIZE are split into chunks that are converted concurrently.
+    The results are returned in the original order.
+
     """
+    start = time.perf_counter()
+    try:
+        return _call_dumbo(data, path, options, data_opts)
+    finally:
+        if dumbo_call_listener:
+            dumbo_call_listener(time.perf_counter() - start)
+
+
+def _call_dumbo(
+    data: list[str] | dict | list[dict],
+    path: str,
+    options: DumboOptions,
+    data_opts: list[DumboOptions] | None,
+) -> list[str] | dict | list[dict]:
     is_dict = isinstance(data, dict)
+    if not is_dict and len(data) > DUMBO_CHUNK_SIZE:
+        chunks = _split_chunks(data, DUMBO_CHUNK_SIZE)
+        opt_chunks = (
+            _split_chunks(data_opts, DUMBO_CHUNK_SIZE)
+            if data_opts
+            else [None] * len(chunks)
+        )
+        with ThreadPoolExecutor(
+            max_workers=min(DUMBO_MAX_CONCURRENCY, len(chunks))
+        ) as executor:
+            results = executor.map(
+                lambda args: _call_dumbo(args[0], path, options, args[1]),
+                zip(chunks, opt_chunks),
+            )
+            return [item for result in results for item in result]
     opts = options.dict()
-    try:
-        if path in KEYS_PATHS:
-            if is_dict:
-                data_to_send: dict = {"content": [{"content": data}], **opts}
-            else:
-                if data_opts:
-                    data_to_send = {
-                        "content": [
-                            {"content": d, **o.dict()} for d, o in zip(data, data_opts)
-                        ],
-                        **opts,
-                    }
-                else:
-                    data_to_send = {
-                        "content": [{"content": d} for d in data],
-                        **opts,
-                    }
+    if path in KEYS_PATHS:
+        if is_dict:
+            data_to_send: dict = {"content": [{"content": data}], **opts}
         else:
-            data_to_send = {"content": data, **opts}
-        r = requests.post(
-            url=DUMBO_URL + path, data=json.dumps(data_to_send, cls=TimJsonEncoder)
-        )
-        r.encoding = "utf-8"
-    except requests.ConnectionError:
-        raise Exception("Failed to connect to Dumbo")
-    if r.status_code != 200:
-        raise DumboHTMLException()
-    returned = r.json()
+            if data_opts:
+                data_to_send = {
+                    "content": [
+                        {"content": d, **o.dict()} for d, o in zip(data, data_opts)
+                    ],
+                    **opts,
+                }
+            else:
+                data_to_send = {
+                    "content": [{"content": d} for d in data],
+                    **opts,
+                }
+    else:
+        data_to_send = {"content": data, **opts}
+    returned = _post_to_dumbo(path, data_to_send)
     if is_dict:
         return returned[0]
     else:
@@ -1,5 +1,7 @@
+import hashlib
 import re
-from typing import Any
+import secrets
+from typing import Any, Iterable
 
 import lxml
 import lxml.etree
@@ -7,6 +9,8 @@ from lxml.etree import ParserError
 from lxml.html import tostring, fragment_fromstring, document_fromstring
 from lxml.html.clean import Cleaner
 
+from tim_common.collections import SizedLRUCache
+
 TIM_SAFE_TAGS = [
     "a",
     "abbr",
@@ -283,10 +287,73 @@ c_with_styles = Cleaner(
 )
 
 
+SANITIZE_CACHE_MAX_BYTES = 16 * 1024 * 1024
+"""
+Maximum total size (in characters of input and output HTML) of the per-process cache of sanitized HTML.
+The same fragments (unchanged paragraphs, plugin outputs) are sanitized again in many requests.
+"""
+
+_sanitize_cache: SizedLRUCache[str] | None = None
+
+
+def get_sanitize_cache() -> SizedLRUCache[str]:
+    global _sanitize_cache
+    if _sanitize_cache is None:
+        _sanitize_cache = SizedLRUCache(SANITIZE_CACHE_MAX_BYTES)
+    return _sanitize_cache
+
+
+def get_sanitize_cache_key(html_string: str, allow_styles: bool) -> tuple[bytes, str]:
+    """Returns the cache key of the given HTML sanitized with the given cleaner profile."""
+    return (
+        hashlib.sha256(html_string.encode("utf-8", "surrogatepass")).digest(),
+        "styles" if allow_styles else "default",
+    )
+
+
 # NOTE: lxml cleaner is a LOT faster than bleach.
 def sanitize_html(html_string: str, allow_styles: bool = False) -> str:
+    cache = get_sanitize_cache()
+    key = get_sanitize_cache_key(html_string, allow_styles)
+    cleaned = cache.get(key)
+    if cleaned is None:
+        cleaner = c_with_styles if allow_styles else c_no_style
+        cleaned = sanitize_with_cleaner(html_string, cleaner)
+        cache.put(key, cleaned, len(html_string) + len(cleaned))
+    return cleaned
+
+
+def sanitize_html_batch(
+    html_strings: Iterable[str], allow_styles: bool = False
+) -> list[str]:
+    """Sanitizes many HTML fragments, returning the same results as calling sanitize_html for each of them.
+
+    Cached and duplicate fragments are sanitized only once, and the rest are parsed and cleaned together.
+
+    :param html_strings: The HTML fragments to sanitize.
+    :param allow_styles: Whether to allow <style> tags.
+    :return: The sanitized fragments in the same order.
+    """
+    html_strings = list(html_strings)
+    cache = get_sanitize_cache()
+    keys = [get_sanitize_cache_key(h, allow_styles) for h in html_strings]
+    results: list[str | None] = [cache.get(k) for k in keys]
+    to_sanitize: dict[tuple[bytes, str], str] = {}
+    for key, html_string, result in zip(keys, html_strings, results):
+        if result is None:
+            to_sanitize.setdefault(key, html_string)
+    if not to_sanitize:
+        return results
     cleaner = c_with_styles if allow_styles else c_no_style
-    return sanitize_with_cleaner(html_string, cleaner)
+    sanitized = dict(
+        zip(
+            to_sanitize.keys(),
+            sanitize_many_with_cleaner(list(to_sanitize.values()), cleaner),
+        )
+    )
+    for key, cleaned in sanitized.items():
+        cache.put(key, cleaned, len(to_sanitize[key]) + len(cleaned))
+    return [sanitized[k] if r is None else r for k, r in zip(keys, results)]
 
 
 # Copied from LXML to match the same pattern
@@ -377,6 +444,82 @@ def sanitize_with_cleaner(html_string: str, cleaner: Cleaner) -> str:
         return ""
 
 
+def sanitize_many_with_cleaner(html_strings: list[str], cleaner: Cleaner) -> list[str]:
+    """Sanitizes the given fragments with a single parse and clean pass.
+
+    Each fragment is wrapped in a div with a random id, and the wrappers are parsed and cleaned as one tree.
+    Fragments that would not be sanitized exactly like with sanitize_with_cleaner (full documents, empty
+    fragments and fragments whose root element the cleaner would rewrite) are sanitized one by one. If a
+    fragment breaks out of its wrapper (e.g. with unbalanced tags), all fragments are sanitized one by one.
+
+    :param html_strings: The fragments to sanitize.
+    :param cleaner: The cleaner to use.
+    :return: The sanitized fragments in the same order.
+    """
+    results: list[str | None] = [None] * len(html_strings)
+    batch = []
+    for i, html_string in enumerate(html_strings):
+        if html_string.strip() and not looks_like_full_html(html_string):
+            batch.append(i)
+        else:
+            results[i] = sanitize_with_cleaner(html_string, cleaner)
+    if len(batch) < 2:
+        for i in batch:
+            results[i] = sanitize_with_cleaner(html_strings[i], cleaner)
+        return results
+
+    marker = f"tim-sanitize-{secrets.token_hex(8)}"
+    wrappers = None
+    try:
+        root = fragment_fromstring(
+            "".join(
+                f'<div id="{marker}-{n}">{escape_data_svg(html_strings[i])}</div>'
+                for n, i in enumerate(batch)
+            ),
+            create_parent="div",
+        )
+        if not root.text and len(root) == len(batch):
+            wrappers = list(root)
+    except (lxml.etree.ParserError, lxml.etree.XMLSyntaxError, ValueError):
+        pass
+    if wrappers is None or any(
+        w.tag != "div"
+        or w.attrib != {"id": f"{marker}-{n}"}
+        or (w.tail and w.tail.strip())
+        for n, w in enumerate(wrappers)
+    ):
+        for i in batch:
+            results[i] = sanitize_with_cleaner(html_strings[i], cleaner)
+        return results
+
+    # Whether the fragment has a single root element. sanitize_with_cleaner only strips a div around such a
+    # fragment; other fragments are wrapped in a div that is stripped, which the wrapper here corresponds to.
+    single_roots = [False] * len(wrappers)
+    for n, w in reversed(list(enumerate(wrappers))):
+        # fragment_fromstring drops whitespace around a single root element.
+        if w.text and not w.text.strip():
+            w.text = None
+        if len(w) == 1 and not w.text and not (w[0].tail and w[0].tail.strip()):
+            if w[0].tag not in cleaner.allow_tags:
+                # The cleaner rewrites a disallowed root element instead of removing it.
+                i = batch.pop(n)
+                results[i] = sanitize_with_cleaner(html_strings[i], cleaner)
+                root.remove(w)
+                del wrappers[n]
+                del single_roots[n]
+                continue
+            w[0].tail = None
+            single_roots[n] = True
+        w.tail = None
+    cleaner(root)
+    for i, w, single_root in zip(batch, wrappers, single_roots):
+        cleaned = tostring(w, encoding="ascii").decode("ascii")
+        # Remove the wrapper tags.
+        cleaned = unescape_data_svg(cleaned[cleaned.index(">") + 1 : -len("</div>")])
+        results[i] = strip_div(cleaned) if single_root else cleaned
+    return results
+
+
 def strip_div(s: str) -> str:
     if s.startswith("<div>") and s.endswith("</div>"):
         return s[5:-6]
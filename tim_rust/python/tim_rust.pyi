@@ -1,3 +1,8 @@
+READER_API_VERSION: int
+
 def read_all_blocks(
-    doc_id: int, doc_par_file_path: str, skip_blocks: set[str]
+    doc_id: int,
+    doc_par_file_path: str,
+    skip_blocks: set[str],
+    files_path: str | None = None,
 ) -> list[dict]: ...
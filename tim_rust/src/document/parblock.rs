@@ -17,6 +17,9 @@ pub struct DocumentParagraphBlock {
     pub t: String,
     pub attrs: HashMap<String, Value>,
     pub h: Option<HashMap<String, String>>,
+    /// True if the block could not be read and `md` contains an error message instead.
+    #[serde(default)]
+    pub error: bool,
 }
 
 impl DocumentParagraphBlock {
@@ -26,36 +29,39 @@ impl DocumentParagraphBlock {
     ///
     /// # Arguments
     ///
+    /// * `files_path`: Path to the files directory in TIM DB.
     /// * `doc_id`: Document ID that contains the paragraph block.
     /// * `par_id`: Paragraph block ID.
     /// * `t`: Paragraph block hash.
     ///
     /// returns: Result<DocumentParagraphBlock, Error>
-    pub fn read_json(doc_id: u64, par_id: &str, t: &str) -> Result<Self, anyhow::Error> {
-        let file_path = get_doc_par_block_path(&doc_id, par_id, t);
+    pub fn read_json(files_path: &str, doc_id: u64, par_id: &str, t: &str) -> Result<Self, anyhow::Error> {
+        let file_path = get_doc_par_block_path(files_path, &doc_id, par_id, t);
         let file_text = std::fs::read_to_string(file_path).context("Could not read paragraph file")?;
         let json = serde_json::from_str(&file_text).context("Could not parse paragraph file")?;
         Ok(json)
     }
 
     /// Reads a paragraph block from a JSON file.
-    /// If the file cannot be read or parsed, returns a paragraph with an error message.
+    /// If the file cannot be read or parsed, returns a paragraph with an error message and `error` set.
     ///
     /// # Arguments
     ///
+    /// * `files_path`: Path to the files directory in TIM DB.
     /// * `doc_id`: Document ID that contains the paragraph block.
     /// * `par_id`: Paragraph block ID.
     /// * `t`: Paragraph block hash.
     ///
     /// returns: DocumentParagraphBlock
-    pub fn read_json_safe(doc_id: u64, par_id: &str, t: &str) -> Self {
-        Self::read_json(doc_id, par_id, t)
+    pub fn read_json_safe(files_path: &str, doc_id: u64, par_id: &str, t: &str) -> Self {
+        Self::read_json(files_path, doc_id, par_id, t)
             .unwrap_or_else(|e| Self {
                 id: par_id.to_string(),
                 md: format!("[**ERROR**: Could not load {}/{}/{}: {:#}]{{.error}}", doc_id, par_id, t, e),
                 attrs: HashMap::new(),
                 h: None,
                 t: t.to_string(),
+                error: true,
             })
     }
 
@@ -74,6 +80,7 @@ impl DocumentParagraphBlock {
             attrs: HashMap::new(),
             h: None,
             t: t.to_string(),
+            error: false,
         }
     }
 }
\ No newline at end of file
@@ -13,12 +13,14 @@ use crate::document::parblock::DocumentParagraphBlock;
 /// * `doc_id`: ID of the document
 /// * `doc_block_list_path`: Path to the block list file to read
 /// * `skip_blocks`: Set of block IDs to skip parsing. The blocks will still be included into the list, but they will be stubbed.
+/// * `files_path`: Path to the files directory in TIM DB.
 ///
 /// returns: Vector of blocks
 pub fn read_document_blocks(
     doc_id: u64,
     doc_block_list_path: impl AsRef<Path>,
     skip_blocks: HashSet<String>,
+    files_path: &str,
 ) -> Result<Vec<DocumentParagraphBlock>, anyhow::Error> {
     let doc_par_file_text = std::fs::read_to_string(doc_block_list_path).context("Could not read block list file")?;
     // Iterate the block list and extract the docblock id and type
@@ -27,8 +29,8 @@ pub fn read_document_blocks(
         .into_iter()
         .filter(|line| !line.is_empty())
         .map(|line| {
-            // FIXME: Some older files may still use the "current" symlink and thus not have the separator!
-            let (doc_par_id, doc_par_hash) = line.split_once("/").unwrap();
+            // Some older files only have the block ID, in which case the "current" symlink points to the latest version.
+            let (doc_par_id, doc_par_hash) = line.split_once("/").unwrap_or((line, "current"));
             (doc_par_id, doc_par_hash, skip_blocks.contains(doc_par_id))
         })
         .collect::<Vec<_>>();
@@ -40,7 +42,7 @@ pub fn read_document_blocks(
             if *skip {
                 DocumentParagraphBlock::new(doc_par_id, doc_par_hash)
             } else {
-                DocumentParagraphBlock::read_json_safe(doc_id, doc_par_id, doc_par_hash)
+                DocumentParagraphBlock::read_json_safe(files_path, doc_id, doc_par_id, doc_par_hash)
             }
         )
         .collect();
@@ -4,30 +4,42 @@ use pyo3::exceptions::PyException;
 use pyo3::prelude::*;
 use pythonize::pythonize;
 
+use crate::document::dbpaths::FILES_PATH;
 use crate::document::pipeline::read_document_blocks;
 
 mod document;
 #[cfg(test)]
 mod tests;
 
+/// Version of the read_all_blocks interface. Increment this when its arguments or the returned blocks change
+/// so that TIM does not use an extension built from older sources.
+const READER_API_VERSION: u32 = 2;
+
 
 /// Reads all blocks in a document safely.
-/// If a block cannot be read, it is replaced with an error indicator.
+/// If a block cannot be read, it is replaced with an error indicator and its `error` field is true.
 ///
 /// # Arguments
 ///
 /// * `doc_id`: ID of the document
 /// * `doc_block_list_path`: Path to the block list file to read
 /// * `skip_blocks`: Set of block IDs to skip
+/// * `files_path`: Path to the files directory in TIM DB. Defaults to `/tim_files`.
 ///
 /// returns: A list of blocks as dicts.
 #[pyfunction]
+#[pyo3(signature = (doc_id, doc_block_list_path, skip_blocks, files_path = None))]
 fn read_all_blocks(
+    py: Python,
     doc_id: u64,
     doc_block_list_path: String,
     skip_blocks: HashSet<String>,
+    files_path: Option<String>,
 ) -> PyResult<PyObject> {
-    let blocks = read_document_blocks(doc_id, doc_block_list_path, skip_blocks)
+    let files_path = files_path.unwrap_or_else(|| FILES_PATH.to_string());
+    // Reading the blocks does not touch any Python objects, so other Python threads can run meanwhile.
+    let blocks = py
+        .allow_threads(|| read_document_blocks(doc_id, doc_block_list_path, skip_blocks, &files_path))
         .map_err(|e| PyException::new_err(e.to_string()))?;
     Python::with_gil(|py| pythonize(py, &blocks))
         .map_err(|e| PyException::new_err(e.to_string()))
@@ -37,5 +49,6 @@ fn read_all_blocks(
 #[pymodule]
 fn tim_rust(_py: Python, m: &PyModule) -> PyResult<()> {
     m.add_function(wrap_pyfunction!(read_all_blocks, m)?)?;
+    m.add("READER_API_VERSION", READER_API_VERSION)?;
     Ok(())
 }
\ No newline at end of file